@@ -1,139 +1,177 @@
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output, State
+from dash import dash_table, dcc, html, Patch
+from dash.dependencies import ALL, Input, Output, State
+from flask import Response
 import dash_bootstrap_components as dbc
-import plotly.graph_objs as go
+import numpy as np
 from datetime import datetime
-import threading
+from collections import OrderedDict
+import atexit
+import importlib
+import json
 import os
+import threading
+import time
+
+from keithley2000 import events, metrics
+from keithley2000.analysis import CumulativeHeat
+from keithley2000.catalog import RunCatalog
+from keithley2000.data import MeasurementFileCache
+from keithley2000.decimate import decimate_window, x_range_from_relayout
+
+# Channels, instruments, serial link, output files, journals and catalog are
+# set in settings.py
+from settings import (
+    CATALOG_PATH,
+    CHANNELS,
+    ADAPTIVE_SPACING,
+    INSTRUMENTS,
+    JOURNAL_DIR,
+    METRICS_ENABLED,
+    VISA_RESOURCE,
+    create_engine,
+    existing_csv_directories,
+)
 
 # Filenames all start with the date and time in the format 2025-09-17_14-23
 now_str = datetime.now().strftime("%Y-%m-%d_%H-%M")
 
-# Calibration constants for the three channels
-CAL_FACTORS = [
-    12.45,
-    12.3151,
-    12.9117,
-]  # Calibration factors for channels 1, 2, 3 (Watt/Volt)
+# Maximum number of points per channel sent to the graph. Longer runs are
+# decimated (min/max per bucket, so peaks are kept); zooming in re-decimates
+# the visible time window only.
+MAX_GRAPH_POINTS = 2000
+
+# Zero line (mW/g) subtracted from the heat flow before the total heat is
+# integrated for the graph
+HEAT_BASELINE = 0.0
+
+# Address ("host:port") of a separate acquisition process (see serve.py).
+# Not set: the instruments are run by this process.
+ACQUISITION_ADDRESS = os.environ.get("KEITHLEY_ACQUISITION") or None
+
+# The browsers are notified of new readings and of runs starting or ending
+# over a server-sent event stream (/events) and only update then. Streams
+# send a keep-alive comment every EVENT_KEEPALIVE_SECONDS and are ended
+# after EVENT_STREAM_SECONDS (the browser reconnects at once), so that the
+# server threads of closed tabs are freed. Every REFRESH_SECONDS the page is
+# refreshed anyway, e.g. for files written by another program.
+EVENT_KEEPALIVE_SECONDS = 15
+EVENT_STREAM_SECONDS = 300
+REFRESH_SECONDS = 30
 
-# Create list of possible directories to save CSV files
-parent = os.path.expanduser("~")
+# Number of recent graph results kept, so that every viewer of the same
+# files gets the figure computed for the first one in this update
+FIGURE_CACHE_SIZE = 32
+
+# Timers of SCPI calls, sweeps, file writes and callbacks, see settings.py
+metrics.enable(METRICS_ENABLED)
+
+# Directories offered for the CSV files. Looking for them can take a few
+# seconds (see settings.py), so until start_background_tasks() has found
+# them only the working directory is offered, and the dropdown is filled
+# when they are ready. serve.py --server gunicorn looks for them once before
+# starting the workers and passes them on in KEITHLEY_DIRECTORIES.
 CSV_DIRECTORIES = [
-    "D:/",
-    "E:/",
-    "F:/",
-    os.getcwd(),
-    parent,
-    os.path.join(os.path.expanduser("~"), "Documents"),
-    os.path.join(os.path.expanduser("~"), "Downloads"),
-]
-
-# Add all subdirectories in the user's home directory
-CSV_DIRECTORIES += [
-    os.path.join(parent, d)
-    for d in os.listdir(parent)
-    if os.path.isdir(os.path.join(parent, d))
-]
-
-# Flatten the list and remove non-existing directories
-CSV_DIRECTORIES = [d for d in CSV_DIRECTORIES if os.path.isdir(d)]
-# If no valid directories found, use current directory
-if not CSV_DIRECTORIES:
-    CSV_DIRECTORIES = [os.getcwd()]
-
-# Global variable for thread and stop flag
-measurement_thread = None
-stop_flag = threading.Event()
-visa_error_flag = threading.Event()  # New: flag for VISA error
-
-
-def run_measurement(filenames, interval_seconds, weights):
-    import pyvisa
-    import time
-
-    rm = pyvisa.ResourceManager()
-    resources = rm.list_resources()
-    print("Available VISA resources:", resources)
-    if not resources:
-        visa_error_flag.set()  # Set VISA error flag
-        return
-    resource_str = resources[0]
-    print(f"Connecting to {resource_str} ...")
-    instrument = rm.open_resource(resource_str)
-    instrument.baud_rate = 9600
-    instrument.data_bits = 8
-    instrument.stop_bits = pyvisa.constants.StopBits.one
-    instrument.parity = pyvisa.constants.Parity.none
-    instrument.flow_control = pyvisa.constants.ControlFlow.none
-    instrument.timeout = 5000
-    instrument.write_termination = "\r"
-    instrument.read_termination = "\r"
-    instrument.write("*RST")
-    instrument.write("*WAI")
-    instrument.write("SRE 1")  # Instruments beeps
-    instrument.write("SYST:RWL")
-    instrument.write("SENS:FUNC 'Volt:DC'")
-    instrument.write("SYST:AZER:STAT 0")
-    instrument.write("SENS:VOLT:DC:AVER:STAT 0")
-    instrument.write("SENS:VOLT:DC:NPLC 10")
-    instrument.write("SENS:VOLT:DC:RANG:AUTO 1")
-    instrument.write("SENS:VOLT:DC:DIG 7")
-    instrument.write("SENS:Volt:DC:REF:STAT 0")
-    try:
-        start_time = time.time()
-        while not stop_flag.is_set():
-            for channel in range(1, 4):
-                if stop_flag.is_set():
-                    break
-                # Check if a weight is specified for this channel
-                if weights[channel - 1] is None:
-                    continue  # No weight → no measurement → no writing to file
-                try:
-                    instrument.write("*SRE 1")
-                    instrument.write("SENS:FUNC 'Volt:DC'")
-                    instrument.write("ROUT:OPEN:ALL")
-                    instrument.write(f"ROUT:CLOS (@{channel})")
-                    time.sleep(0.05)
-                    result = instrument.query("READ?")
-
-                    try:
-                        value = float(result.strip())
-                    except Exception:
-                        value = None
-
-                    if value is not None:
-                        calibrated = (
-                            value * 1000 * CAL_FACTORS[channel - 1]
-                        )  # Convert to mV and apply calibration factor
-                        try:
-                            normed = calibrated / weights[channel - 1]
-                        except Exception:
-                            normed = ""
-                    else:
-                        normed = ""
-                        calibrated = ""
-
-                    elapsed_seconds = time.time() - start_time
-                    elapsed_hours = elapsed_seconds / 3600.0
-
-                    with open(filenames[channel - 1], "a") as f:
-                        f.write(
-                            f"{elapsed_hours:.5f}, {normed}\n"  # Save only time and normed data (mW per gram)
-                        )
-                except Exception as e:
-                    print(f"Error with channel {channel}: {e}")
-            time.sleep(interval_seconds)
-    except Exception as e:
-        print("An error occurred:", e)
-    finally:
-        instrument.write("ROUT:CLOS:ALL")
-        instrument.close()
+    d for d in os.environ.get("KEITHLEY_DIRECTORIES", "").split(os.pathsep) if d
+] or [os.getcwd()]
+
+# Modules loaded in the background after the start instead of by the first
+# graph update (plotly figures) or the first run (pyvisa)
+PRELOAD_MODULES = ["plotly.graph_objs"]
+if any(i.get("resource", VISA_RESOURCE) != "SIM" for i in INSTRUMENTS):
+    PRELOAD_MODULES.append("pyvisa")
+
+catalog = RunCatalog(CATALOG_PATH)
+
+
+def find_directories():
+    # If no valid directories are found, the current directory stays
+    found = existing_csv_directories()
+    if found:
+        CSV_DIRECTORIES[:] = found
+    events.publish("directories")
+    scan_catalog()
+
+
+def scan_catalog():
+    catalog.scan_in_background(
+        list(CSV_DIRECTORIES), on_change=lambda: events.publish("catalog")
+    )
+
+
+def preload():
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+
+# Held once the directories are being looked for
+background_started = threading.Lock()
+
+
+def start_background_tasks():
+    """Look for the directories, then index them in the catalog.
+
+    Called by python app.py and serve.py, once per process; not on import,
+    so that the gunicorn workers do not all scan the same directories.
+    """
+    if background_started.acquire(blocking=False):
+        threading.Thread(
+            target=find_directories, name="find-directories", daemon=True
+        ).start()
+
+
+threading.Thread(target=preload, name="preload", daemon=True).start()
+
+
+# With several web workers the measurement runs in its own process and the
+# workers only talk to it
+if ACQUISITION_ADDRESS:
+    from keithley2000.service import AcquisitionClient, load_authkey
+
+    engine = AcquisitionClient(ACQUISITION_ADDRESS, load_authkey(JOURNAL_DIR))
+else:
+    engine = create_engine()
+# Close the serial ports (kept open between runs) when the app exits
+atexit.register(engine.close)
 
 
 app = dash.Dash(
     __name__, title="Keithley 2000 Monitor", external_stylesheets=[dbc.themes.BOOTSTRAP]
 )
+# WSGI application for waitress or gunicorn (see serve.py)
+server = app.server
+
+
+# Helper function: Label and text input of every channel for the form, with
+# the pattern-matching id {"type": kind, "index": channel id}
+def channel_inputs(kind, label, value):
+    return [
+        component
+        for channel in CHANNELS
+        for component in (
+            html.Label(label(channel)),
+            dcc.Input(
+                id={"type": kind, "index": channel.id},
+                type="text",
+                value=value(channel),
+                className="mb-2 fw-bold",
+                style={"width": "100%"},
+            ),
+        )
+    ]
+
+
+def weight_text(weight):
+    return "" if weight is None else str(weight)
+
+
+# The inputs of all channels in callbacks, in the order of CHANNELS
+FILENAME_INPUTS = {"type": "filename", "index": ALL}
+WEIGHT_INPUTS = {"type": "weight", "index": ALL}
+
 
 app.layout = dbc.Container(
     [
@@ -154,6 +192,24 @@ app.layout = dbc.Container(
                 ),
             ]
         ),
+        # Offer to resume a run that was interrupted
+        dbc.Alert(
+            [
+                html.Div(id="resume-text", className="mb-2"),
+                dbc.Button("Resume", id="resume-button", color="warning", n_clicks=0),
+                dbc.Button(
+                    "Discard",
+                    id="discard-button",
+                    color="secondary",
+                    className="ms-2",
+                    n_clicks=0,
+                ),
+            ],
+            id="resume-alert",
+            color="warning",
+            is_open=False,
+        ),
+        dcc.Store(id="resume-instrument", data=None),
         dbc.Row(
             [
                 dbc.Col(
@@ -162,69 +218,45 @@ app.layout = dbc.Container(
                             [
                                 dbc.CardBody(
                                     [
+                                        # Only shown with more than one instrument
+                                        html.Div(
+                                            [
+                                                html.Label("Instrument"),
+                                                dcc.Dropdown(
+                                                    id="instrument",
+                                                    options=[
+                                                        i["name"] for i in INSTRUMENTS
+                                                    ],
+                                                    value=INSTRUMENTS[0]["name"],
+                                                    clearable=False,
+                                                    className="mb-2",
+                                                ),
+                                                html.Hr(),
+                                            ],
+                                            style=(
+                                                {}
+                                                if len(INSTRUMENTS) > 1
+                                                else {"display": "none"}
+                                            ),
+                                        ),
                                         dbc.Row(
                                             [
                                                 # Filenames stacked (left)
                                                 dbc.Col(
-                                                    [
-                                                        html.Label(
-                                                            "Filename Channel 1"
-                                                        ),
-                                                        dcc.Input(
-                                                            id="filename1",
-                                                            type="text",
-                                                            value=f"{now_str}-1.csv",
-                                                            className="mb-2 fw-bold",
-                                                            style={"width": "100%"},
-                                                        ),
-                                                        html.Label(
-                                                            "Filename Channel 2"
-                                                        ),
-                                                        dcc.Input(
-                                                            id="filename2",
-                                                            type="text",
-                                                            value=f"{now_str}-2.csv",
-                                                            className="mb-2 fw-bold",
-                                                            style={"width": "100%"},
-                                                        ),
-                                                        html.Label(
-                                                            "Filename Channel 3"
-                                                        ),
-                                                        dcc.Input(
-                                                            id="filename3",
-                                                            type="text",
-                                                            value=f"{now_str}-3.csv",
-                                                            className="mb-2 fw-bold",
-                                                            style={"width": "100%"},
-                                                        ),
-                                                    ],
+                                                    channel_inputs(
+                                                        "filename",
+                                                        lambda c: f"Filename {c.label}",
+                                                        lambda c: f"{now_str}-{c.id}.csv",
+                                                    ),
                                                     width=7,
                                                 ),
                                                 # Weights stacked (right)
                                                 dbc.Col(
-                                                    [
-                                                        html.Label("Weight 1 (g)"),
-                                                        dcc.Input(
-                                                            id="weight1",
-                                                            type="text",
-                                                            className="mb-2 fw-bold",
-                                                            style={"width": "100%"},
-                                                        ),
-                                                        html.Label("Weight 2 (g)"),
-                                                        dcc.Input(
-                                                            id="weight2",
-                                                            type="text",
-                                                            className="mb-2 fw-bold",
-                                                            style={"width": "100%"},
-                                                        ),
-                                                        html.Label("Weight 3 (g)"),
-                                                        dcc.Input(
-                                                            id="weight3",
-                                                            type="text",
-                                                            className="mb-2 fw-bold",
-                                                            style={"width": "100%"},
-                                                        ),
-                                                    ],
+                                                    channel_inputs(
+                                                        "weight",
+                                                        lambda c: f"Weight {c.id} (g)",
+                                                        lambda c: weight_text(c.weight),
+                                                    ),
                                                     width=5,
                                                 ),
                                             ]
@@ -252,6 +284,16 @@ app.layout = dbc.Container(
                                                             className="mb-1",
                                                             style={"width": "20%"},
                                                         ),
+                                                        dcc.Checklist(
+                                                            id="adaptive-spacing",
+                                                            options=[
+                                                                {
+                                                                    "label": " Shorter spacing during fast changes",
+                                                                    "value": "adaptive",
+                                                                }
+                                                            ],
+                                                            value=[],
+                                                        ),
                                                     ]
                                                 )
                                             ]
@@ -309,7 +351,7 @@ app.layout = dbc.Container(
                                     [
                                         dcc.Graph(
                                             id="main-graph",
-                                            figure=go.Figure(),
+                                            figure={"data": [], "layout": {}},
                                             config={
                                                 "scrollZoom": True,  # Enable scroll zooming
                                                 "displayModeBar": True,  # Show the mode bar
@@ -317,7 +359,17 @@ app.layout = dbc.Container(
                                                 "editable": False,  # Disable editing
                                                 "staticPlot": False,  # Enable interactivity
                                             },
-                                        )
+                                        ),
+                                        dcc.Checklist(
+                                            id="show-heat",
+                                            options=[
+                                                {
+                                                    "label": " Show total heat (J/g)",
+                                                    "value": "heat",
+                                                }
+                                            ],
+                                            value=[],
+                                        ),
                                     ]
                                 )
                             ]
@@ -328,13 +380,89 @@ app.layout = dbc.Container(
             ]
         ),
         html.Div(id="run-status", className="mt-3", style={"fontWeight": "bold"}),
+        dbc.Button(
+            "Diagnostics",
+            id="diagnostics-button",
+            color="link",
+            className="mt-2 p-0",
+            n_clicks=0,
+        ),
+        dbc.Collapse(
+            dbc.Card(dbc.CardBody(html.Div(id="diagnostics"))),
+            id="diagnostics-collapse",
+            is_open=False,
+        ),
+        # Earlier runs from the catalog, selected ones are drawn in the graph
+        dbc.Card(
+            dbc.CardBody(
+                [
+                    html.H5("Run archive"),
+                    dbc.Row(
+                        [
+                            dbc.Col(
+                                dcc.Input(
+                                    id="archive-search",
+                                    type="text",
+                                    placeholder="Search file names and directories",
+                                    debounce=True,
+                                    style={"width": "100%"},
+                                ),
+                                width=10,
+                            ),
+                            dbc.Col(
+                                dbc.Button(
+                                    "Rescan",
+                                    id="archive-rescan",
+                                    color="secondary",
+                                    size="sm",
+                                    n_clicks=0,
+                                    style={"width": "100%"},
+                                ),
+                                width=2,
+                            ),
+                        ],
+                        className="mb-2",
+                    ),
+                    dash_table.DataTable(
+                        id="archive-table",
+                        columns=[
+                            {"name": "File", "id": "name"},
+                            {"name": "Directory", "id": "directory"},
+                            {"name": "Started", "id": "started"},
+                            {"name": "Duration (h)", "id": "duration"},
+                            {"name": "Peak (h)", "id": "peak_time"},
+                            {"name": "Peak (mW/g)", "id": "peak_flow"},
+                            {"name": "Total heat (J/g)", "id": "total_heat"},
+                        ],
+                        data=[],
+                        row_selectable="multi",
+                        selected_row_ids=[],
+                        sort_action="native",
+                        page_size=10,
+                        style_table={"overflowX": "auto"},
+                        style_cell={"textAlign": "left", "fontSize": "0.9rem"},
+                    ),
+                    html.P(
+                        "Selected runs are drawn as dotted lines over the current one.",
+                        className="mt-2 mb-0",
+                    ),
+                ]
+            ),
+            className="mt-3",
+        ),
+        dcc.Store(id="archive-version", data=None),  # Catalog shown in the table
         dcc.Store(id="measurement-running", data=False),  # Status flag
         dcc.Store(id="stop-requested", data=False),
+        dcc.Store(id="graph-x-range", data=None),  # Zoomed time window (h)
+        dcc.Store(id="graph-state", data=None),  # What the browser's graph shows
+        # Set by the browser on every server-sent event (see live_events)
+        dcc.Store(id="live-event", data=None),
         dcc.Interval(
             id="graph-update-interval",
-            interval=3000,
-            n_intervals=0,  # interval in ms, update every 3 seconds
+            interval=REFRESH_SECONDS * 1000,
+            n_intervals=0,  # interval in ms, between server-sent events
         ),
+        dcc.Interval(id="diagnostics-interval", interval=3000, disabled=True),
         dbc.Row(
             [
                 dbc.Col(
@@ -364,26 +492,50 @@ app.layout = dbc.Container(
 )
 
 
-# Helper function: Read current measurement data from files
+# Helper function: Read current measurement data
+# Files of a live run are served from memory (the instrument's LiveStore),
+# all others from disk, parsing only the lines appended since the previous
+# call (see MeasurementFileCache)
+measurement_cache = MeasurementFileCache()
+
+
+def live_buffers(filenames):
+    buffers = []
+    for name in filenames:
+        acquisition = engine.find(name)
+        buffers.append(None if acquisition is None else acquisition.live.get(name))
+    return buffers
+
+
 def read_measurement_data(filenames):
-    data = []
-    for full_path in filenames:
-        times = []
-        normed = []
-        if os.path.exists(full_path):
-            with open(full_path, "r") as f:
-                for line in f:
-                    parts = line.strip().split(",")
-                    if len(parts) >= 2:
-                        try:
-                            t = float(parts[0])
-                            n = float(parts[1])
-                            times.append(t)
-                            normed.append(n)
-                        except Exception:
-                            continue
-        data.append((times, normed))
-    return data
+    buffers = live_buffers(filenames)
+    on_disk = iter(
+        measurement_cache.read([n for n, b in zip(filenames, buffers) if b is None])
+    )
+    return [b.arrays() if b is not None else next(on_disk) for b in buffers]
+
+
+# Helper function: Marker per file that changes when its data starts over
+def measurement_generations(filenames):
+    markers = []
+    on_disk = [n for n in filenames if engine.find(n) is None]
+    generations = dict(zip(on_disk, measurement_cache.generations(on_disk)))
+    for name in filenames:
+        acquisition = engine.find(name)
+        if acquisition is None:
+            markers.append(generations[name])
+        else:
+            markers.append(f"live-{acquisition.name}-{acquisition.live.run}")
+    return markers
+
+
+# Helper function: False if the callback was triggered by a server-sent
+# event about something else than kinds
+def concerns(live_event, *kinds):
+    triggered = dash.callback_context.triggered
+    if not triggered or triggered[0]["prop_id"] != "live-event.data":
+        return True
+    return live_event is not None and bool(set(live_event[1]) & {"connected", *kinds})
 
 
 @app.callback(
@@ -401,64 +553,41 @@ def read_measurement_data(filenames):
         Input("run-button", "n_clicks"),
         Input("stop-button", "n_clicks"),
         Input("graph-update-interval", "n_intervals"),
+        Input("live-event", "data"),
+        Input("instrument", "value"),
     ],
     [
         State("csv-directory", "value"),
-        State("filename1", "value"),
-        State("filename2", "value"),
-        State("filename3", "value"),
+        State(FILENAME_INPUTS, "value"),
         State("interval-input", "value"),
-        State("weight1", "value"),
-        State("weight2", "value"),
-        State("weight3", "value"),
+        State("adaptive-spacing", "value"),
+        State(WEIGHT_INPUTS, "value"),
         State("measurement-running", "data"),
         State("stop-requested", "data"),
     ],
 )
+@metrics.timed("callback_seconds", callback="control_measurement")
 def control_measurement(
     run_clicks,
     stop_clicks,
     n_intervals,
+    live_event,
+    instrument,
     csv_dir,
-    filename1,
-    filename2,
-    filename3,
+    names,
     interval,
-    w1,
-    w2,
-    w3,
+    adaptive,
+    weight_texts,
     running,
     stop_requested,
 ):
-    global measurement_thread, stop_flag, visa_error_flag
+    if not concerns(live_event, "state", "samples"):
+        return [dash.no_update] * 8
+    acquisition = engine[instrument]
+    running = acquisition.running
 
     ctx = dash.callback_context
-    if not ctx.triggered:
-        # On initial load or interval, just check for VISA error
-        if visa_error_flag.is_set():
-            return (
-                "",
-                False,
-                {"width": "100%", "opacity": "1"},
-                True,
-                {"width": "100%", "opacity": "0.2"},
-                False,
-                False,
-                "No VISA resources found! Please check if your instrument is connected and powered on, then restart the application.",
-            )
-        else:
-            return (
-                "",
-                False,
-                {"width": "100%", "opacity": "1"},
-                True,
-                {"width": "100%", "opacity": "0.2"},
-                False,
-                False,
-                "",
-            )
-
-    button_id = ctx.triggered[0]["prop_id"].split(".")[0]
+    button_id = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
 
     # Default styles
     run_style_active = {"width": "100%", "opacity": "1"}
@@ -468,8 +597,6 @@ def control_measurement(
 
     error_msg = ""
     if button_id == "run-button" and not running:
-        stop_flag.clear()
-        visa_error_flag.clear()
 
         def parse_weight(val):
             try:
@@ -478,118 +605,296 @@ def control_measurement(
                 return None
 
         # Parse weights (type: text) and handle both comma and point as decimal separator
-        weights = [parse_weight(w1), parse_weight(w2), parse_weight(w3)]
+        weights = [parse_weight(w) for w in weight_texts]
 
         # Combine directory and filenames
-        filenames = [
-            os.path.join(csv_dir, filename1),
-            os.path.join(csv_dir, filename2),
-            os.path.join(csv_dir, filename3),
-        ]
-        # Start measurement thread
-        measurement_thread = threading.Thread(
-            target=run_measurement, args=(filenames, interval - 1, weights)
-        )
-        measurement_thread.daemon = True
-        measurement_thread.start()
-        return (
-            "",
-            True,
-            run_style_disabled,
-            False,  # Stop button now active
-            stop_style_active,
-            True,
-            False,
-            "",
-        )
-
-    if button_id == "stop-button" and running:
-        stop_flag.set()
-        return (
-            "",
-            False,
-            run_style_active,
-            True,  # Stop button disabled again
-            stop_style_disabled,
-            False,
-            True,
-            "",
-        )
-
-    # On interval: show VISA error if set
-    if visa_error_flag.is_set():
-        return (
-            "",
-            False,
-            run_style_active,
-            True,
-            stop_style_disabled,
-            False,
-            False,
-            "No VISA resources found! Please check if your instrument is connected and powered on, then restart the application.",
-        )
+        filenames = [os.path.join(csv_dir, name) for name in names]
+        # Start measurement thread, showing what is already in the files
+        try:
+            engine.start(
+                instrument,
+                filenames,
+                interval,
+                weights,
+                existing=measurement_cache.read(filenames),
+                adaptive=ADAPTIVE_SPACING if adaptive else None,
+            )
+            running = True
+        except RuntimeError as e:
+            error_msg = str(e)
+    elif button_id == "stop-button" and running:
+        acquisition.stop()
+        running = False
 
+    # Show the VISA error of the selected instrument if there is one
+    error_msg = error_msg or acquisition.error
+    # One status line per instrument
+    status = [html.Div(a.status()) for a in engine] if len(INSTRUMENTS) > 1 else ""
     if running:
+        status = status or acquisition.status()
         return (
-            "",
+            status,
             True,
             run_style_disabled,
             False,  # Stop button active during measurement
             stop_style_active,
             True,
             False,
-            "",
+            error_msg,
         )
     return (
-        "",
+        status,
         False,
         run_style_active,
-        True,  # Stop button remains disabled before start
+        True,  # Stop button disabled before start and after stop
         stop_style_disabled,
         False,
-        False,
-        "",
+        button_id == "stop-button",
+        error_msg,
     )
 
 
 @app.callback(
-    Output("main-graph", "figure"),
+    [
+        Output("csv-directory", "value"),
+        Output(FILENAME_INPUTS, "value"),
+        Output("interval-input", "value"),
+        Output(WEIGHT_INPUTS, "value"),
+    ],
+    Input("instrument", "value"),
+    prevent_initial_call=True,
+)
+def show_instrument(instrument):
+    # Fill the form with the last run of the selected instrument, so that the
+    # graph shows its traces
+    acquisition = engine[instrument]
+    if not acquisition.filenames:
+        return [dash.no_update] * 4
+    return form_values(acquisition.filenames, acquisition.interval, acquisition.weights)
+
+
+# Helper function: Directory, filenames, spacing and weights of a run for the
+# form. Channels the run did not have get the default filename and no weight.
+def form_values(filenames, interval, weights):
+    csv_dir = os.path.dirname(filenames[0])
+    names = [os.path.basename(f) for f in filenames][: len(CHANNELS)]
+    names += [f"{now_str}-{c.id}.csv" for c in CHANNELS[len(names) :]]
+    weights = [weight_text(w) for w in weights][: len(CHANNELS)]
+    weights += [""] * (len(CHANNELS) - len(weights))
+    return [csv_dir, names, interval, weights]
+
+
+@app.callback(
+    [
+        Output("resume-alert", "is_open"),
+        Output("resume-text", "children"),
+        Output("resume-instrument", "data"),
+        Output("instrument", "value", allow_duplicate=True),
+        Output("csv-directory", "value", allow_duplicate=True),
+        Output(FILENAME_INPUTS, "value", allow_duplicate=True),
+        Output("interval-input", "value", allow_duplicate=True),
+        Output(WEIGHT_INPUTS, "value", allow_duplicate=True),
+    ],
     [
         Input("graph-update-interval", "n_intervals"),
+        Input("live-event", "data"),
+        Input("resume-button", "n_clicks"),
+        Input("discard-button", "n_clicks"),
+    ],
+    State("resume-instrument", "data"),
+    prevent_initial_call=True,
+)
+def offer_resume(n_intervals, live_event, resume_clicks, discard_clicks, instrument):
+    if not concerns(live_event, "state"):
+        return [dash.no_update] * 8
+    ctx = dash.callback_context
+    button_id = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
+    unchanged = [dash.no_update] * 5
+    journals = engine.interrupted()
+
+    if button_id == "discard-button" and instrument in journals:
+        engine.discard(instrument)
+        return [False, "", None] + unchanged
+    if button_id == "resume-button" and instrument in journals:
+        journal = journals[instrument]
+        try:
+            engine.resume(
+                instrument, existing=measurement_cache.read(journal["filenames"])
+            )
+        except RuntimeError as e:
+            return [True, str(e), instrument] + unchanged
+        # Show the resumed run
+        values = form_values(
+            journal["filenames"], journal["interval"], journal["weights"]
+        )
+        return [False, "", None, instrument] + values
+
+    if not journals:
+        return [False, "", None] + unchanged
+    if instrument in journals:
+        return [dash.no_update] * 8
+    instrument = sorted(journals)[0]
+    journal = journals[instrument]
+    started = datetime.fromtimestamp(journal["wall_start"]).strftime("%Y-%m-%d %H:%M")
+    text = (
+        f"The run of {instrument} started {started} was interrupted after"
+        f" {journal['last_elapsed'] / 3600:.2f} h"
+        f" ({', '.join(os.path.basename(f) for f in journal['filenames'])})."
+        " Resume it (same files, the time axis goes on and the gap is marked)"
+        " or discard it."
+    )
+    return [True, text, instrument] + unchanged
+
+
+@app.callback(
+    [
+        Output("csv-directory", "options"),
+        Output("csv-directory", "value", allow_duplicate=True),
+    ],
+    [
+        Input("graph-update-interval", "n_intervals"),
+        Input("live-event", "data"),
+    ],
+    [
+        State("csv-directory", "options"),
         State("csv-directory", "value"),
-        State("filename1", "value"),
-        State("filename2", "value"),
-        State("filename3", "value"),
+        State("measurement-running", "data"),
     ],
+    prevent_initial_call=True,
 )
-def update_graph(n, csv_dir, filename1, filename2, filename3):
-    # Build full paths for the files
-    filenames = [
-        os.path.join(csv_dir, filename1),
-        os.path.join(csv_dir, filename2),
-        os.path.join(csv_dir, filename3),
+def fill_directories(n_intervals, live_event, options, csv_dir, running):
+    # The directories are found in the background (see find_directories)
+    if (
+        not concerns(live_event, "directories")
+        or [o["value"] for o in options] == CSV_DIRECTORIES
+    ):
+        return dash.no_update, dash.no_update
+    # Switch from the placeholder to the first directory found (a USB flash
+    # drive if there is one) unless a directory was chosen meanwhile
+    untouched = len(options) == 1 and csv_dir == options[0]["value"]
+    value = CSV_DIRECTORIES[0] if untouched and not running else dash.no_update
+    return [{"label": d, "value": d} for d in CSV_DIRECTORIES], value
+
+
+@app.callback(
+    Output("graph-x-range", "data"),
+    Input("main-graph", "relayoutData"),
+    State("graph-x-range", "data"),
+)
+def update_x_range(relayout_data, x_range):
+    new_range = x_range_from_relayout(relayout_data, x_range)
+    if new_range == x_range:
+        return dash.no_update
+    return new_range
+
+
+# Helper function: Find the minimum of all normed values
+def graph_y_min(data):
+    # fmin skips NaN (the gap of a resumed run), NaN if there is nothing else
+    minima = [np.fmin.reduce(normed) for times, normed in data if len(normed)]
+    minima = [m for m in minima if not np.isnan(m)]
+    return float(min(minima)) if minima else 0
+
+
+# Helper function: Total heat (J/g) of every channel, integrating only the
+# points added since the last call
+heat_integrators = {}
+
+
+def total_heat(filenames, generations, data):
+    heat = []
+    for name, generation, (times, normed) in zip(filenames, generations, data):
+        key = os.path.abspath(name)
+        if heat_integrators.get(key, (None,))[0] != generation:
+            heat_integrators[key] = (generation, CumulativeHeat(HEAT_BASELINE))
+        heat.append(heat_integrators[key][1].update(times, normed))
+    return heat
+
+
+# Helper function: Old runs selected in the run archive, as (label, times,
+# normed): the previews from the catalog, or the files themselves when the
+# graph is zoomed in
+overlay_cache = MeasurementFileCache()
+
+
+def overlay_data(paths, x_range):
+    paths = paths or []
+    if x_range is None:
+        previews = catalog.previews(paths)
+        data = [previews[p] for p in paths if p in previews]
+        paths = [p for p in paths if p in previews]
+    else:
+        data = overlay_cache.read(paths)
+    return [
+        (os.path.splitext(os.path.basename(p))[0], times, normed)
+        for p, (times, normed) in zip(paths, data)
     ]
-    data = read_measurement_data(filenames)
+
+
+# Helper function: Build the graph, decimated to MAX_GRAPH_POINTS per channel
+def build_figure(data, x_range=None, heat=None, overlays=()):
+    import plotly.graph_objs as go  # Usually preloaded already
+
     fig = go.Figure()
-    colors = ["#1f77b4", "#ff7f0e", "#2ca02c"]
+    overlay_colors = ["#7f7f7f", "#9467bd", "#8c564b", "#e377c2", "#bcbd22", "#17becf"]
 
-    # Find the minimum of all normed values
-    all_normed = []
-    for times, normed in data:
-        all_normed.extend(normed)
-    y_min = min(all_normed) if all_normed else 0
+    y_min = graph_y_min(data + [(times, normed) for _, times, normed in overlays])
 
     for i, (times, normed) in enumerate(data):
-        if times and normed:
+        if len(times) and len(normed):
+            times, normed = decimate_window(times, normed, MAX_GRAPH_POINTS, x_range)
+            fig.add_trace(
+                go.Scatter(
+                    # Plain lists instead of typed arrays, so that patch_figure
+                    # can extend them in the browser
+                    x=times.tolist(),
+                    y=normed.tolist(),
+                    mode="lines",
+                    name=CHANNELS[i].label,
+                    line=dict(color=CHANNELS[i].color, width=2),
+                )
+            )
+    # Total heat on a second y axis, after all heat flow traces
+    for i, (times, normed) in enumerate(data):
+        if heat is not None and len(times) and len(normed):
+            times, total = decimate_window(times, heat[i], MAX_GRAPH_POINTS, x_range)
+            fig.add_trace(
+                go.Scatter(
+                    x=times.tolist(),
+                    y=total.tolist(),
+                    mode="lines",
+                    name=f"Total heat {CHANNELS[i].label}",
+                    yaxis="y2",
+                    line=dict(color=CHANNELS[i].color, width=1, dash="dash"),
+                )
+            )
+    # Old runs last, so that patch_figure finds the traces above at their index
+    for i, (label, times, normed) in enumerate(overlays):
+        if len(times):
+            times, normed = decimate_window(times, normed, MAX_GRAPH_POINTS, x_range)
             fig.add_trace(
                 go.Scatter(
                     x=times,
                     y=normed,
                     mode="lines",
-                    name=f"Channel {i+1}",
-                    line=dict(color=colors[i], width=2),
+                    name=label,
+                    line=dict(
+                        color=overlay_colors[i % len(overlay_colors)],
+                        width=1,
+                        dash="dot",
+                    ),
                 )
             )
+    if heat is not None:
+        fig.update_layout(
+            yaxis2=dict(
+                title="Total heat (J/g)",
+                overlaying="y",
+                side="right",
+                rangemode="tozero",
+                showgrid=False,
+            )
+        )
     fig.update_layout(
         uirevision="main",  # Preserve zoom and pan on updates
         xaxis=dict(
@@ -616,5 +921,314 @@ def update_graph(n, csv_dir, filename1, filename2, filename3):
     return fig
 
 
+# Helper function: Append only the points measured since the last update.
+# Returns None if the graph has to be redrawn completely.
+def patch_figure(data, state, filenames, generations, x_range, heat=None, overlays=()):
+    if (
+        state is None  # First load or reloaded page
+        or state["filenames"] != filenames
+        or state["generations"] != generations
+        or state["x_range"] != x_range
+        or state["heat"] != (heat is not None)
+        or state["overlays"] != [label for label, times, normed in overlays]
+    ):
+        return None
+    counts = [len(times) for times, normed in data]
+    new_points = [n - old for n, old in zip(counts, state["counts"])]
+    if any(k < 0 for k in new_points):
+        return None
+    # A channel without trace got its first points
+    if any(k and i not in state["traces"] for i, k in enumerate(new_points)):
+        return None
+    # Appended points are not decimated, redraw before they pile up
+    if state["appended"] + max(new_points) > MAX_GRAPH_POINTS:
+        return None
+
+    patch = Patch()
+    for trace_index, i in enumerate(state["traces"]):
+        if new_points[i]:
+            times, normed = data[i]
+            patch["data"][trace_index]["x"].extend(times[state["counts"][i] :].tolist())
+            patch["data"][trace_index]["y"].extend(
+                normed[state["counts"][i] :].tolist()
+            )
+            if heat is not None:
+                heat_trace = patch["data"][len(state["traces"]) + trace_index]
+                heat_trace["x"].extend(times[state["counts"][i] :].tolist())
+                heat_trace["y"].extend(heat[i][state["counts"][i] :].tolist())
+    y_min = graph_y_min(data + [(times, normed) for _, times, normed in overlays])
+    if y_min != state["y_min"]:
+        patch["layout"]["yaxis"]["range"][0] = y_min
+    state = dict(
+        state,
+        counts=counts,
+        y_min=y_min,
+        appended=state["appended"] + max(new_points),
+    )
+    return patch, state
+
+
+# Helper function: Result of compute() for this key, computed only once
+# while it is in the cache. The lock also protects heat_integrators.
+figure_cache = OrderedDict()
+figure_lock = threading.RLock()
+
+
+def cached(key, compute):
+    with figure_lock:
+        if key in figure_cache:
+            figure_cache.move_to_end(key)
+            return figure_cache[key]
+        result = figure_cache[key] = compute()
+        if len(figure_cache) > FIGURE_CACHE_SIZE:
+            figure_cache.popitem(last=False)
+        return result
+
+
+@app.callback(
+    [
+        Output("main-graph", "figure"),
+        Output("graph-state", "data"),
+    ],
+    [
+        Input("graph-update-interval", "n_intervals"),
+        Input("live-event", "data"),
+        Input("graph-x-range", "data"),
+        Input("show-heat", "value"),
+        Input("archive-table", "selected_row_ids"),
+        State("csv-directory", "value"),
+        State(FILENAME_INPUTS, "value"),
+        State("graph-state", "data"),
+    ],
+)
+@metrics.timed("callback_seconds", callback="update_graph")
+def update_graph(
+    n,
+    live_event,
+    x_range,
+    show_heat,
+    archive_runs,
+    csv_dir,
+    names,
+    state,
+):
+    if not concerns(live_event, "state", "samples"):
+        return dash.no_update, dash.no_update
+    # Build full paths for the files
+    filenames = [os.path.join(csv_dir, name) for name in names]
+    data = read_measurement_data(filenames)
+    generations = measurement_generations(filenames)
+    counts = [len(times) for times, normed in data]
+    overlays = overlay_data(archive_runs, x_range)
+    # Everything the figure depends on; the same for all viewers of these files
+    key = json.dumps(
+        [
+            filenames,
+            generations,
+            counts,
+            x_range,
+            bool(show_heat),
+            [(label, len(times)) for label, times, normed in overlays],
+        ]
+    )
+
+    def heat():
+        return total_heat(filenames, generations, data) if show_heat else None
+
+    def figure():
+        state = {
+            "filenames": filenames,
+            "generations": generations,
+            "x_range": x_range,
+            "counts": counts,
+            "traces": [i for i, (times, normed) in enumerate(data) if len(times)],
+            "y_min": graph_y_min(
+                data + [(times, normed) for _, times, normed in overlays]
+            ),
+            "appended": 0,
+            "heat": bool(show_heat),
+            "overlays": [label for label, times, normed in overlays],
+        }
+        return build_figure(data, x_range, heat(), overlays), state
+
+    def update():
+        # Streaming: send only the new points while nothing else changed
+        patched = patch_figure(
+            data, state, filenames, generations, x_range, heat(), overlays
+        )
+        if patched is None:
+            return cached(key, figure)
+        patch, new_state = patched
+        if new_state["counts"] == state["counts"]:
+            return dash.no_update, dash.no_update
+        return patch, new_state
+
+    # The patch depends on what the browser shows already
+    return cached(json.dumps([key, state]), update)
+
+
+@app.callback(
+    [
+        Output("archive-table", "data"),
+        Output("archive-version", "data"),
+    ],
+    [
+        Input("archive-search", "value"),
+        Input("archive-rescan", "n_clicks"),
+        Input("graph-update-interval", "n_intervals"),
+        Input("live-event", "data"),
+    ],
+    State("archive-version", "data"),
+)
+def update_archive(search, rescan_clicks, n_intervals, live_event, version):
+    ctx = dash.callback_context
+    trigger = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
+    if trigger == "archive-rescan":
+        if not catalog.scanning:
+            scan_catalog()
+        return dash.no_update, dash.no_update
+    # Refresh the table only when a scan changed the catalog
+    if (
+        trigger in ("graph-update-interval", "live-event")
+        and version == catalog.version
+    ):
+        return dash.no_update, dash.no_update
+
+    def hours(value):
+        return None if value is None else round(value, 2)
+
+    rows = [
+        {
+            "id": run["path"],
+            "name": run["name"],
+            "directory": run["directory"],
+            "started": (
+                datetime.fromtimestamp(run["started"]).strftime("%Y-%m-%d %H:%M")
+                if run["started"]
+                else ""
+            ),
+            "duration": hours(run["duration"]),
+            "peak_time": hours(run["peak_time"]),
+            "peak_flow": (
+                None if run["peak_flow"] is None else round(run["peak_flow"], 3)
+            ),
+            "total_heat": round(run["total_heat"], 1),
+        }
+        for run in catalog.search(search or "")
+    ]
+    return rows, catalog.version
+
+
+@server.route(f"{app.config.routes_pathname_prefix}events")
+def live_events():
+    """Server-sent events: one message per change, see keithley2000/events.py."""
+
+    def stream():
+        version = events.version()
+        # The first message makes a (re)connected page fetch everything
+        yield f"retry: 1000\ndata: {json.dumps([version, ['connected']])}\n\n"
+        end = time.monotonic() + EVENT_STREAM_SECONDS
+        while time.monotonic() < end:
+            new, kinds = events.wait(version, EVENT_KEEPALIVE_SECONDS)
+            if new == version:
+                yield ": keep-alive\n\n"
+            else:
+                version = new
+                yield f"data: {json.dumps([version, kinds])}\n\n"
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# The browser opens the event stream once the page is there and sets
+# live-event on every message, which triggers the callbacks above
+app.clientside_callback(
+    """
+    function (id) {
+        if (!window.liveEvents) {
+            window.liveEvents = new EventSource("events");
+            window.liveEvents.onmessage = function (message) {
+                window.dash_clientside.set_props(id, {data: JSON.parse(message.data)});
+            };
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("live-event", "data"),
+    Input("live-event", "id"),
+)
+
+
+# Helper function: Metrics of this process and of the acquisition process
+def collected_metrics():
+    exported = metrics.export()
+    if ACQUISITION_ADDRESS:
+        exported = metrics.merge(exported, engine.metrics())
+    return exported
+
+
+@server.route("/metrics")
+def prometheus_metrics():
+    return Response(
+        metrics.render(collected_metrics()), mimetype="text/plain; version=0.0.4"
+    )
+
+
+@app.callback(
+    [
+        Output("diagnostics-collapse", "is_open"),
+        Output("diagnostics-interval", "disabled"),
+    ],
+    Input("diagnostics-button", "n_clicks"),
+    State("diagnostics-collapse", "is_open"),
+    prevent_initial_call=True,
+)
+def toggle_diagnostics(n_clicks, is_open):
+    # The timers are only refreshed while they are shown
+    return not is_open, is_open
+
+
+@app.callback(
+    Output("diagnostics", "children"),
+    Input("diagnostics-interval", "n_intervals"),
+    Input("diagnostics-collapse", "is_open"),
+)
+def update_diagnostics(n, is_open):
+    if not is_open:
+        return dash.no_update
+    if not METRICS_ENABLED:
+        return "Metrics are disabled (METRICS_ENABLED in settings.py)."
+    timers, counters = metrics.summary(collected_metrics())
+    header = [
+        "Timer",
+        "Labels",
+        "Count",
+        "Mean (ms)",
+        "p50 (ms)",
+        "p95 (ms)",
+        "Max (ms)",
+    ]
+    rows = [
+        html.Tr(
+            [html.Td(name), html.Td(labels), html.Td(count)]
+            + [html.Td(f"{value * 1000:.1f}") for value in values]
+        )
+        for name, labels, count, *values in timers
+    ]
+    rows += [
+        html.Tr([html.Td(name), html.Td(labels), html.Td(value)] + [html.Td("")] * 4)
+        for name, labels, value in counters
+    ]
+    return dbc.Table(
+        [html.Thead(html.Tr([html.Th(h) for h in header])), html.Tbody(rows)],
+        size="sm",
+        striped=True,
+    )
+
+
 if __name__ == "__main__":
+    start_background_tasks()
     app.run(debug=True, port=8050)
@@ -0,0 +1,111 @@
+"""Acquisition throughput and latency against the simulated instrument.
+
+Run from the repository root (no hardware needed):
+
+    python -m benchmarks.bench_acquisition
+
+First the sweeps themselves are timed for the "scan" and "step" modes with
+1, 3 and 10 channels, then a complete measurement (Acquisition) is run for
+a few seconds per mode, writing to a temporary directory. Finally the run
+is repeated with a simulated slow disk (every write of the CSV files takes
+SLOW_WRITE seconds, longer than the spacing): the files are written by
+threads of their own, so the sweeps must stay on time.
+"""
+
+import os
+import tempfile
+import time
+
+from keithley2000.acquisition import Acquisition
+from keithley2000.writer import CsvWriter
+from keithley2000.instrument import configure_scan, read_channel, read_scan
+from keithley2000.session import InstrumentSession
+
+# Realistic timing: NPLC 10 at 50 Hz, a few ms USB-serial latency, 9600 baud
+SIMULATOR = {"reading_time": 0.2, "latency": 0.004, "seed": 0}
+SWEEPS = 3
+END_TO_END_SECONDS = 5
+SLOW_WRITE = 1.5
+
+
+def sweep_benchmark(mode, channels):
+    # Set up the way a run does it (see Acquisition.connect)
+    session = InstrumentSession("SIM", SIMULATOR)
+    instrument = session.open()
+    session.configure()
+    if mode == "scan":
+        configure_scan(instrument, channels)
+    written, read = instrument.bytes_written, instrument.bytes_read
+    durations = []
+    for _ in range(SWEEPS):
+        start = time.perf_counter()
+        if mode == "scan":
+            read_scan(instrument, channels)
+        else:
+            for channel in channels:
+                read_channel(instrument, channel)
+        durations.append(time.perf_counter() - start)
+    readings = SWEEPS * len(channels)
+    traffic = instrument.bytes_written - written + instrument.bytes_read - read
+    session.close()
+    return readings / sum(durations), max(durations), traffic / readings
+
+
+def end_to_end(mode, output_options=None):
+    acquisition = Acquisition(
+        "bench",
+        "SIM",
+        [12.45] * 3,
+        mode,
+        simulator_options=SIMULATOR,
+        output_options=output_options,
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        filenames = [os.path.join(tmp, f"bench-{i}.csv") for i in (1, 2, 3)]
+        acquisition.start(filenames, 1, [5.0, 5.0, 5.0])
+        time.sleep(END_TO_END_SECONDS)
+        acquisition.stop()
+        acquisition.thread.join()
+        readings = sum(len(acquisition.live.get(name)) for name in filenames)
+        return readings, acquisition.scheduler
+
+
+def slow_disk(mode):
+    write_rows = CsvWriter._write_rows
+
+    def slow_write_rows(self, f, index, rows):
+        time.sleep(SLOW_WRITE)
+        write_rows(self, f, index, rows)
+
+    CsvWriter._write_rows = slow_write_rows
+    try:
+        # Every sweep is written at once
+        return end_to_end(mode, {"flush_rows": 1})
+    finally:
+        CsvWriter._write_rows = write_rows
+
+
+def main():
+    print(
+        f"{'mode':>5} {'channels':>9} {'readings/s':>11}"
+        f" {'max sweep (s)':>14} {'bytes/reading':>14}"
+    )
+    for mode in ("scan", "step"):
+        for count in (1, 3, 10):
+            rate, worst, traffic = sweep_benchmark(mode, list(range(1, count + 1)))
+            print(f"{mode:>5} {count:>9} {rate:>11.2f} {worst:>14.3f} {traffic:>14.1f}")
+    print()
+    for mode in ("scan", "step"):
+        readings, _ = end_to_end(mode)
+        print(f"Acquisition {mode}: {readings} readings in {END_TO_END_SECONDS} s")
+    print()
+    readings, scheduler = slow_disk("scan")
+    print(
+        f"Slow disk ({SLOW_WRITE} s per write): {readings} readings in"
+        f" {END_TO_END_SECONDS} s, {scheduler.overruns} overruns,"
+        f" max jitter {scheduler.jitter_max * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
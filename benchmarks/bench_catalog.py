@@ -0,0 +1,91 @@
+"""Run catalog: indexing, search and overlaying many earlier runs.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_catalog
+
+RUNS synthetic runs of HOURS hours at 20 s spacing are written as CSV files
+and indexed. Then the runs are overlaid on the graph the way update_graph
+does it: from the previews in the catalog (the default) and from the files
+themselves (when the graph is zoomed in), timed up to the figure JSON that
+is sent to the browser.
+"""
+
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.isolation import use_temporary_state
+from keithley2000.catalog import RunCatalog
+from keithley2000.writer import HEADER
+
+use_temporary_state()
+import app
+
+RUNS = 20
+HOURS = 7 * 24
+REPEATS = 5
+
+
+def write_run(path, seed):
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, HOURS, 20 / 3600)
+    peak = (1.5 + 0.5 * rng.random()) * np.exp(-((t - 10 - 4 * rng.random()) ** 2) / 8)
+    normed = 0.2 + peak + rng.normal(0, 0.01, len(t))
+    start = 1.7e9 + seed * 86400
+    with open(path, "w") as f:
+        f.write(HEADER)
+        f.writelines(
+            f"{h:.5f}, {q}, {datetime.fromtimestamp(start + h * 3600).isoformat()}\n"
+            for h, q in zip(t, normed)
+        )
+
+
+def timed(func):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = func()
+    return (time.perf_counter() - start) / REPEATS * 1000, result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(RUNS):
+            write_run(os.path.join(tmp, f"run-{i:02}-1.csv"), i)
+        catalog = RunCatalog(os.path.join(tmp, "catalog.sqlite"))
+        app.catalog = catalog
+
+        start = time.perf_counter()
+        catalog.scan([tmp])
+        print(f"Index {RUNS} runs of {HOURS} h: {time.perf_counter() - start:.2f} s")
+        rescan, _ = timed(lambda: catalog.scan([tmp]))
+        print(f"Rescan without changes: {rescan:.1f} ms")
+        search, rows = timed(lambda: catalog.search("run-1"))
+        print(f"Search ({len(rows)} hits): {search:.2f} ms")
+
+        paths = [run["path"] for run in catalog.search()]
+        print()
+        print(
+            f"{'overlay of ' + str(RUNS) + ' runs':<24} {'load (ms)':>10}"
+            f" {'figure + JSON (ms)':>19} {'JSON (kB)':>10}"
+        )
+        for label, x_range in (("previews", None), ("full files, zoomed", [5, 20])):
+            # Cold: nothing read yet
+            app.overlay_cache.clear()
+            start = time.perf_counter()
+            overlays = app.overlay_data(paths, x_range)
+            load = (time.perf_counter() - start) * 1000
+            build, payload = timed(
+                lambda: app.build_figure([], x_range, overlays=overlays).to_json()
+            )
+            print(
+                f"{label:<24} {load:>10.1f} {build:>19.1f} {len(payload) / 1000:>10.0f}"
+            )
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Samples/s and worst-case write latency of the CSV output.
+
+Run from the repository root, optionally with the directory to write to
+(e.g. a USB flash drive, where the difference is largest):
+
+    python -m benchmarks.bench_csv_writer [directory]
+
+Compares the old open-append-close per reading with the buffered CsvWriter.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from keithley2000.writer import CsvWriter
+
+SAMPLES = 3000  # Per channel
+
+
+def per_line(filenames, samples):
+    latencies = []
+    for i in range(samples):
+        for name in filenames:
+            start = time.perf_counter()
+            with open(name, "a") as f:
+                f.write(f"{i * 20 / 3600:.5f}, {0.25 + i * 1e-6}\n")
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def buffered(filenames, samples):
+    latencies = []
+    writer = CsvWriter(filenames)
+    for i in range(samples):
+        for index in range(len(filenames)):
+            start = time.perf_counter()
+            writer.write(index, i * 20 / 3600, 0.25 + i * 1e-6)
+            latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    writer.close()
+    latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else None
+    print(f"{'writer':>10} {'samples/s':>12} {'mean (us)':>10} {'max (ms)':>9}")
+    for label, func in [("per line", per_line), ("CsvWriter", buffered)]:
+        with tempfile.TemporaryDirectory(dir=directory) as tmp:
+            filenames = [os.path.join(tmp, f"bench-{i}.csv") for i in (1, 2, 3)]
+            start = time.perf_counter()
+            latencies = func(filenames, SAMPLES)
+            total = time.perf_counter() - start
+        rate = SAMPLES * len(filenames) / total
+        mean = sum(latencies) / len(latencies) * 1e6
+        print(f"{label:>10} {rate:>12.0f} {mean:>10.1f} {max(latencies) * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
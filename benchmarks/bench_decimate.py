@@ -0,0 +1,65 @@
+"""Figure payload size and build time with and without decimation.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_decimate
+
+For every size, three channels of synthetic heat flow data are turned into
+the main-graph figure the way update_graph does it, then serialized to JSON
+(what Dash sends to the browser every tick).
+"""
+
+import time
+
+import numpy as np
+
+from benchmarks.isolation import use_temporary_state
+
+use_temporary_state()
+import app
+
+SIZES = [10_000, 100_000, 1_000_000]
+REPEATS = 3
+
+
+def synthetic_data(n):
+    data = []
+    t = np.linspace(0, n * 20 / 3600, n)
+    for channel in range(3):
+        peak = 2.0 * np.exp(-((t - 10 - channel) ** 2) / 8)
+        noise = np.random.default_rng(channel).normal(0, 0.01, n)
+        data.append((t, 0.2 + peak + noise))
+    return data
+
+
+def measure(data, max_points, x_range=None):
+    app.MAX_GRAPH_POINTS = max_points
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        payload = app.build_figure(data, x_range).to_json()
+    return (time.perf_counter() - start) / REPEATS * 1000, len(payload)
+
+
+def main():
+    default = app.MAX_GRAPH_POINTS
+    print(
+        f"{'points/channel':>14} {'mode':>12} {'latency (ms)':>13} {'payload (kB)':>13}"
+    )
+    try:
+        for n in SIZES:
+            data = synthetic_data(n)
+            t_end = data[0][0][-1]
+            window = [t_end * 0.4, t_end * 0.41]
+            for mode, max_points, x_range in [
+                ("full", n, None),
+                ("decimated", default, None),
+                ("zoomed 1%", default, window),
+            ]:
+                latency, size = measure(data, max_points, x_range)
+                print(f"{n:>14} {mode:>12} {latency:>13.1f} {size / 1024:>13.1f}")
+    finally:
+        app.MAX_GRAPH_POINTS = default
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Serial traffic and throughput per link configuration, simulated instrument.
+
+Run from the repository root (no hardware needed):
+
+    python -m benchmarks.bench_link
+
+Scans of 3 and 10 channels are timed at 9600 and 19200 baud with ASCII and
+binary (FORM:DATA SREAL/DREAL) readings, at NPLC 10 and NPLC 1 (integration
+time 0.2 s and 0.02 s per reading; the faster the instrument, the more the
+serial link matters). Then the step mode is compared with the commands it
+used to send for every channel, and the time to find the instrument's baud
+rate by probing is measured.
+"""
+
+import contextlib
+import io
+import time
+
+from keithley2000.instrument import (
+    SETUP_COMMANDS,
+    configure_scan,
+    data_format_commands,
+    read_channel,
+    read_readings,
+    read_scan,
+)
+from keithley2000.session import InstrumentSession
+
+LINKS = [
+    (9600, "ascii"),
+    (19200, "ascii"),
+    (9600, "sreal"),
+    (19200, "sreal"),
+    (19200, "dreal"),
+]
+READING_TIMES = {"NPLC 10": 0.2, "NPLC 1": 0.02}
+LATENCY = 0.004  # USB-serial adaptor
+SWEEPS = 3
+
+
+def open_session(baud_rate, data_format, reading_time, probe=False, device=None):
+    session = InstrumentSession(
+        "SIM",
+        {
+            "reading_time": reading_time,
+            "latency": LATENCY,
+            "seed": 0,
+            "device_baud_rate": device or baud_rate,
+        },
+        {"baud_rate": baud_rate, "data_format": data_format, "probe": probe},
+    )
+    with contextlib.redirect_stdout(io.StringIO()):  # "Connecting to SIM ..."
+        session.open()
+    session.configure(SETUP_COMMANDS + data_format_commands(data_format))
+    return session
+
+
+def traffic(instrument):
+    return instrument.bytes_written + instrument.bytes_read
+
+
+def scan_benchmark(baud_rate, data_format, reading_time, channels):
+    session = open_session(baud_rate, data_format, reading_time)
+    instrument = session.instrument
+    configure_scan(instrument, channels)
+    before = traffic(instrument)
+    start = time.perf_counter()
+    for _ in range(SWEEPS):
+        read_scan(instrument, channels, data_format)
+    seconds = time.perf_counter() - start
+    readings = SWEEPS * len(channels)
+    result = readings / seconds, (traffic(instrument) - before) / readings
+    session.close()
+    return result
+
+
+def read_channel_resending(instrument, channel):
+    """read_channel as it was: function and channels set again every time."""
+    instrument.write("*SRE 1")
+    instrument.write("SENS:FUNC 'Volt:DC'")
+    instrument.write("ROUT:OPEN:ALL")
+    instrument.write(f"ROUT:CLOS (@{channel})")
+    time.sleep(0.05)
+    return read_readings(instrument, 1)[0]
+
+
+def step_benchmark(read, channels):
+    session = open_session(9600, "ascii", READING_TIMES["NPLC 10"])
+    instrument = session.instrument
+    before, commands = traffic(instrument), instrument.commands
+    start = time.perf_counter()
+    for _ in range(SWEEPS):
+        for channel in channels:
+            read(instrument, channel)
+    seconds = time.perf_counter() - start
+    readings = SWEEPS * len(channels)
+    result = (
+        readings / seconds,
+        (traffic(instrument) - before) / readings,
+        (instrument.commands - commands) / readings,
+    )
+    session.close()
+    return result
+
+
+def main():
+    print(
+        f"{'baud':>6} {'format':>7} {'NPLC':>8} {'channels':>9}"
+        f" {'readings/s':>11} {'bytes/reading':>14}"
+    )
+    for nplc, reading_time in READING_TIMES.items():
+        for baud_rate, data_format in LINKS:
+            for count in (3, 10):
+                rate, size = scan_benchmark(
+                    baud_rate, data_format, reading_time, list(range(1, count + 1))
+                )
+                print(
+                    f"{baud_rate:>6} {data_format:>7} {nplc:>8} {count:>9}"
+                    f" {rate:>11.2f} {size:>14.1f}"
+                )
+    print()
+    print(f"{'step mode':>22} {'readings/s':>11} {'bytes/reading':>14} {'commands':>9}")
+    for label, read in (
+        ("resending commands", read_channel_resending),
+        ("trimmed", read_channel),
+    ):
+        rate, size, commands = step_benchmark(read, [1, 2, 3])
+        print(f"{label:>22} {rate:>11.2f} {size:>14.1f} {commands:>9.1f}")
+    print()
+    for configured, device in ((19200, 19200), (9600, 19200), (19200, 2400)):
+        start = time.perf_counter()
+        session = open_session(configured, "ascii", 0.2, probe=True, device=device)
+        seconds = time.perf_counter() - start
+        print(
+            f"Probe: configured {configured}, instrument at {device} baud:"
+            f" found {session.baud_rate} in {seconds:.2f} s"
+        )
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
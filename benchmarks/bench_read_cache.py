@@ -0,0 +1,130 @@
+"""Refresh cost of reading the measurement files while they grow.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_read_cache
+
+A full re-parse (the old read_measurement_data) gets slower with every line,
+the incremental MeasurementFileCache only pays for the lines appended since
+the previous refresh (one sweep = one line per channel here). Files of the
+running measurement are read from the in-memory LiveStore instead.
+
+Finally, opening a finished run is compared for the CSV file and the binary
+store (x.run) next to it.
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from keithley2000.data import MeasurementFileCache
+from keithley2000.live import LiveStore
+from keithley2000.store import RunStoreWriter
+from keithley2000.writer import CsvWriter
+
+SIZES = [1_000, 10_000, 30_000, 100_000]
+OPEN_SIZES = [30_000, 300_000, 1_000_000]  # 30k lines ~ 7 days at 20 s spacing
+REPEATS = 20
+
+
+def full_parse(filenames):
+    data = []
+    for full_path in filenames:
+        times = []
+        normed = []
+        if os.path.exists(full_path):
+            with open(full_path, "r") as f:
+                for line in f:
+                    parts = line.strip().split(",")
+                    if len(parts) >= 2:
+                        try:
+                            times.append(float(parts[0]))
+                            normed.append(float(parts[1]))
+                        except Exception:
+                            continue
+        data.append((times, normed))
+    return data
+
+
+def append_lines(filenames, start, count):
+    for channel, name in enumerate(filenames):
+        with open(name, "a") as f:
+            for i in range(start, start + count):
+                f.write(f"{i * 20 / 3600:.5f}, {0.25 + 0.01 * channel + i * 1e-6}\n")
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        func(*args)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        filenames = [os.path.join(tmp, f"bench-{i}.csv") for i in (1, 2, 3)]
+        cache = MeasurementFileCache()
+        lines = 0
+        live = LiveStore()
+        live.start_run(filenames)
+        print(
+            f"{'lines/file':>10} {'full parse (ms)':>16}"
+            f" {'append + cached refresh (ms)':>29} {'live store read (us)':>21}"
+        )
+        for size in SIZES:
+            append_lines(filenames, lines, size - lines)
+            lines = size
+            cache.read(filenames)
+            full = timed(full_parse, filenames)
+
+            def refresh():
+                nonlocal lines
+                append_lines(filenames, lines, 1)
+                lines += 1
+                cache.read(filenames)
+
+            incremental = timed(refresh)
+
+            for i in range(len(live.get(filenames[0])), size):
+                for channel in range(3):
+                    live.publish(channel, i * 20 / 3600, 0.25)
+            in_memory = timed(lambda: [live.get(f).arrays() for f in filenames])
+            print(
+                f"{size:>10} {full:>16.2f} {incremental:>29.3f} {in_memory * 1000:>21.1f}"
+            )
+
+    print()
+    print(f"{'rows':>10} {'open CSV (ms)':>14} {'open binary store (ms)':>23}")
+    for rows in OPEN_SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            name = os.path.join(tmp, "run-1.csv")
+            options = {"flush_rows": 10_000}
+            elapsed = np.arange(rows) * 20.0
+            for writer in (
+                CsvWriter([name], **options),
+                RunStoreWriter([name], **options),
+            ):
+                for i in range(rows):
+                    if isinstance(writer, CsvWriter):
+                        writer.write(0, elapsed[i] / 3600, 0.25, 1.7e9 + elapsed[i])
+                    else:
+                        writer.write(
+                            0, i, 1, elapsed[i], 1.7e9 + elapsed[i], 0.001, 12.45, 0.25
+                        )
+                writer.close()
+            store = os.path.join(tmp, "run-1.run")
+            os.rename(store, store + ".off")
+            start = time.perf_counter()
+            MeasurementFileCache().read([name])
+            csv_ms = (time.perf_counter() - start) * 1000
+            os.rename(store + ".off", store)
+            start = time.perf_counter()
+            MeasurementFileCache().read([name])
+            store_ms = (time.perf_counter() - start) * 1000
+        print(f"{rows:>10} {csv_ms:>14.1f} {store_ms:>23.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Cold start of the app: import time per module and time to the first page.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup
+
+The app is started in a fresh Python process (python -X importtime) on a
+free port. The script reports how long the imports of app.py took, module
+by module, and how long it took from starting the process until the page
+(/) and the layout (/_dash-layout, requested by the browser right after)
+were served.
+"""
+
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+TOP = 12
+TIMEOUT = 120
+
+SERVE = """
+import app
+app.start_background_tasks()
+app.app.run(debug=False, port={port})
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, start, process):
+    while time.perf_counter() - start < TIMEOUT:
+        if process.poll() is not None:
+            sys.exit(f"The app exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                response.read()
+                return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.01)
+    sys.exit(f"No answer from {url} after {TIMEOUT} s")
+
+
+def import_times(stderr):
+    """app's own (self, cumulative) microseconds and those of its imports.
+
+    The log lists every module after the modules it imported, one level
+    deeper indented, so the imports of app are the lines of depth 1 just
+    before the line of app.
+    """
+    lines = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            lines.append(((len(indent) - 1) // 2, module, int(own), int(cumulative)))
+    end = next(i for i, line in enumerate(lines) if line[:2] == (0, "app"))
+    imports = {}
+    for depth, module, own, cumulative in reversed(lines[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            imports[module] = cumulative
+    return lines[end][2:], imports
+
+
+def main():
+    port = free_port()
+    # A file, not a pipe: the import log would fill the pipe and block the app
+    with tempfile.TemporaryFile("w+") as log, tempfile.TemporaryDirectory() as home:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-X", "importtime", "-c", SERVE.format(port=port)],
+            # The app's journals and run catalog go into home/.keithley2000
+            env={**os.environ, "HOME": home, "USERPROFILE": home},
+            stdout=subprocess.DEVNULL,
+            stderr=log,
+            text=True,
+        )
+        try:
+            page = wait_for(f"http://127.0.0.1:{port}/", start, process)
+            layout = wait_for(f"http://127.0.0.1:{port}/_dash-layout", start, process)
+        finally:
+            process.terminate()
+            process.wait(30)
+        log.seek(0)
+        stderr = log.read()
+
+    (own, total), times = import_times(stderr)
+    print(f"Import of app.py: {total / 1e6:.2f} s (module body {own / 1e6:.3f} s)")
+    print(f"{'module':<40} {'import (ms)':>12}")
+    for module, cumulative in sorted(times.items(), key=lambda t: -t[1])[:TOP]:
+        print(f"{module:<40} {cumulative / 1000:>12.1f}")
+    print()
+    print(f"Time to first page:   {page:.2f} s")
+    print(f"Time to layout:       {layout:.2f} s")
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("KEITHLEY_RESOURCE", "SIM")
+    main()
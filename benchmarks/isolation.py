@@ -0,0 +1,28 @@
+"""Keep the benchmarks out of the user's run journals and run catalog.
+
+    from benchmarks.isolation import use_temporary_state
+
+    use_temporary_state()
+    import app
+
+app builds its RunCatalog (and the engine its journals) from settings.py
+when it is imported, so this has to come first.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+import settings
+
+
+def use_temporary_state(directory=None):
+    """Point settings.JOURNAL_DIR and CATALOG_PATH into directory; by default
+    a new temporary directory, removed when the process exits."""
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="keithley2000-bench-")
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    settings.JOURNAL_DIR = os.path.join(directory, "journals")
+    settings.CATALOG_PATH = os.path.join(directory, "catalog.sqlite")
+    return directory
@@ -0,0 +1,428 @@
+"""Benchmark suite of the hot paths, offline, with the results saved as JSON.
+
+Run from the repository root (no hardware or network needed):
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --cases run-1h run-1d
+    python -m benchmarks.suite --compare benchmarks/results/<earlier>.json
+
+Cases:
+
+- acquisition: readings per second of scan sweeps of 3 and 10 channels
+  against the simulated instrument (realistic reading time and USB-serial
+  latency, see bench_acquisition), and the sweep jitter of a complete run
+  (Acquisition, CSV files and binary store) of ACQUISITION_SECONDS.
+- run-1h, run-1d, run-1w: synthetic runs of 1 hour, 1 day and 1 week at
+  20 s spacing, every channel of channels.json, written as CSV files. Parsing them
+  (MeasurementFileCache, cold and after one more sweep), and the
+  update_graph and control_measurement callbacks called through Dash as the
+  browser does: latency percentiles, figure JSON size.
+
+Every case runs in a fresh Python process with a temporary home directory,
+so that the peak memory (RSS) reported is that of the case and the user's
+journals and run catalog are left alone. The results of all cases are
+written to benchmarks/results/<time>-<commit>.json (or --output). --compare
+prints the change of every metric against an earlier result file and exits
+with 1 if one got worse by more than --tolerance (timings: and by
+MIN_CHANGE_MS).
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+CASES = ["acquisition", "run-1h", "run-1d", "run-1w"]
+RUN_HOURS = {"run-1h": 1, "run-1d": 24, "run-1w": 24 * 7}
+SPACING = 20  # s
+CALLBACK_REPEATS = 30
+ACQUISITION_SECONDS = 10
+TOLERANCE = 0.2
+# Timings are only reported as worse if they also grew by this much, below
+# that it is noise
+MIN_CHANGE_MS = 1.0
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process (MB), None if unknown."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return windows_peak_rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def windows_peak_rss_mb():
+    try:
+        import ctypes
+        from ctypes import wintypes
+    except ImportError:
+        return None
+
+    class Counters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = Counters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(
+        process, ctypes.byref(counters), counters.cb
+    ):
+        return None
+    return counters.PeakWorkingSetSize / 1024**2
+
+
+def percentiles(name, seconds):
+    """{name_p50_ms: ..., name_p95_ms: ..., name_p99_ms: ...}"""
+    ms = np.asarray(seconds) * 1000
+    return {f"{name}_p{p}_ms": float(np.percentile(ms, p)) for p in (50, 95, 99)}
+
+
+# --- acquisition -----------------------------------------------------------
+
+
+def acquisition_case():
+    from benchmarks.bench_acquisition import SIMULATOR, sweep_benchmark
+    from keithley2000.acquisition import Acquisition
+
+    result = {}
+    for count in (3, 10):
+        rate, worst, traffic = sweep_benchmark("scan", list(range(1, count + 1)))
+        result[f"scan_{count}_readings_per_s"] = rate
+    acquisition = Acquisition(
+        "suite",
+        "SIM",
+        [12.45] * 3,
+        "scan",
+        simulator_options=SIMULATOR,
+        formats=("csv", "binary"),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        filenames = [os.path.join(tmp, f"suite-{i}.csv") for i in (1, 2, 3)]
+        acquisition.start(filenames, 1, [5.0, 5.0, 5.0])
+        time.sleep(ACQUISITION_SECONDS)
+        acquisition.stop()
+        acquisition.thread.join()
+        readings = sum(len(acquisition.live.get(name)) for name in filenames)
+        acquisition.close()
+    scheduler = acquisition.scheduler
+    result.update(
+        run_readings_per_s=readings / ACQUISITION_SECONDS,
+        jitter_mean_ms=scheduler.jitter_mean * 1000,
+        jitter_max_ms=scheduler.jitter_max * 1000,
+        overruns=scheduler.overruns,
+    )
+    return result
+
+
+# --- synthetic runs and the dashboard --------------------------------------
+
+
+def write_run(directory, names, hours):
+    """Synthetic heat flow every SPACING s, one CSV file per name."""
+    from keithley2000.writer import CsvWriter
+
+    n = int(hours * 3600 / SPACING)
+    t = np.arange(n) * SPACING / 3600
+    writer = CsvWriter(
+        [os.path.join(directory, name) for name in names], flush_rows=10_000
+    )
+    start = time.time() - hours * 3600
+    for index in range(len(names)):
+        peak = 2.0 * np.exp(-((t - 0.3 * hours - index) ** 2) / (0.02 * hours))
+        noise = np.random.default_rng(index).normal(0, 0.01, n)
+        for hour, value in zip(t.tolist(), (0.2 + peak + noise).tolist()):
+            writer.write(index, hour, value, start + hour * 3600)
+    writer.close()
+    return n
+
+
+def append_sweep(directory, names, elapsed_hours):
+    from keithley2000.writer import CsvWriter
+
+    writer = CsvWriter([os.path.join(directory, name) for name in names])
+    for index in range(len(names)):
+        writer.write(index, elapsed_hours, 0.25, time.time())
+    writer.close()
+
+
+def callback_request(output, inputs, state):
+    """Body of the request the browser sends for the callback with this output."""
+    outputs = [
+        dict(zip(("id", "property"), o.rsplit(".", 1)))
+        for o in output.strip(".").split("...")
+    ]
+    return {
+        "output": output,
+        "outputs": outputs,
+        "inputs": inputs,
+        "state": state,
+        "changedPropIds": [f"{inputs[0]['id']}.{inputs[0]['property']}"],
+    }
+
+
+def run_case(hours):
+    with tempfile.TemporaryDirectory() as directory:
+        return dashboard_case(hours, directory)
+
+
+def dashboard_case(hours, directory):
+    os.environ.setdefault("KEITHLEY_RESOURCE", "SIM")
+    # Journals and catalog in the temporary directory, not in the user's;
+    # importing app does not look for directories or index them (that is
+    # start_background_tasks(), not called here)
+    from benchmarks.isolation import use_temporary_state
+
+    use_temporary_state(directory)
+    import app
+    from keithley2000.data import MeasurementFileCache
+
+    def find(prop):
+        return next(key for key in app.app.callback_map if prop in key)
+
+    result = {}
+    names = [f"suite-{c.id}.csv" for c in app.CHANNELS]
+    lines = write_run(directory, names, hours)
+    result["lines_per_channel"] = lines
+    paths = [os.path.join(directory, name) for name in names]
+
+    # Parsing: cold, then only one more sweep
+    cache = MeasurementFileCache()
+    start = time.perf_counter()
+    cache.read(paths)
+    result["parse_cold_ms"] = (time.perf_counter() - start) * 1000
+    append_sweep(directory, names, hours)
+    start = time.perf_counter()
+    cache.read(paths)
+    result["parse_refresh_ms"] = (time.perf_counter() - start) * 1000
+
+    client = app.server.test_client()
+    filenames = [
+        {"id": {"type": "filename", "index": c.id}, "property": "value", "value": n}
+        for c, n in zip(app.CHANNELS, names)
+    ]
+    weights = [
+        {"id": {"type": "weight", "index": c.id}, "property": "value", "value": ""}
+        for c in app.CHANNELS
+    ]
+
+    def update_graph(state):
+        body = callback_request(
+            find("main-graph.figure"),
+            [
+                {
+                    "id": "graph-update-interval",
+                    "property": "n_intervals",
+                    "value": 1,
+                },
+                {"id": "live-event", "property": "data", "value": None},
+                {"id": "graph-x-range", "property": "data", "value": None},
+                {"id": "show-heat", "property": "value", "value": []},
+                {
+                    "id": "archive-table",
+                    "property": "selected_row_ids",
+                    "value": [],
+                },
+            ],
+            [
+                {"id": "csv-directory", "property": "value", "value": directory},
+                filenames,
+                {"id": "graph-state", "property": "data", "value": state},
+            ],
+        )
+        start = time.perf_counter()
+        response = client.post("/_dash-update-component", json=body)
+        return time.perf_counter() - start, response.get_json()
+
+    # Page (re)loaded: the whole figure, built every time. The first
+    # call also reads the files, see parse_cold_ms.
+    update_graph(None)
+    latencies = []
+    for _ in range(CALLBACK_REPEATS):
+        app.figure_cache.clear()
+        seconds, answer = update_graph(None)
+        latencies.append(seconds)
+    figure = answer["response"]["main-graph"]["figure"]
+    result["figure_json_bytes"] = len(json.dumps(figure))
+    result.update(percentiles("update_graph_full", latencies))
+
+    # Live updates: one sweep more every time, only the new points sent
+    state = answer["response"]["graph-state"]["data"]
+    latencies = []
+    for i in range(CALLBACK_REPEATS):
+        append_sweep(directory, names, hours + (i + 1) * SPACING / 3600)
+        seconds, answer = update_graph(state)
+        latencies.append(seconds)
+        state = answer["response"]["graph-state"]["data"]
+    result.update(percentiles("update_graph_patch", latencies))
+
+    # Status and buttons, refreshed on every notification
+    body = callback_request(
+        find("run-status.children"),
+        [
+            {"id": "run-button", "property": "n_clicks", "value": 0},
+            {"id": "stop-button", "property": "n_clicks", "value": 0},
+            {"id": "graph-update-interval", "property": "n_intervals", "value": 1},
+            {"id": "live-event", "property": "data", "value": None},
+            {
+                "id": "instrument",
+                "property": "value",
+                "value": app.INSTRUMENTS[0]["name"],
+            },
+        ],
+        [
+            {"id": "csv-directory", "property": "value", "value": directory},
+            filenames,
+            {"id": "interval-input", "property": "value", "value": SPACING},
+            {"id": "adaptive-spacing", "property": "value", "value": []},
+            weights,
+            {"id": "measurement-running", "property": "data", "value": False},
+            {"id": "stop-requested", "property": "data", "value": False},
+        ],
+    )
+    body["changedPropIds"] = ["graph-update-interval.n_intervals"]
+    latencies = []
+    for _ in range(CALLBACK_REPEATS):
+        start = time.perf_counter()
+        client.post("/_dash-update-component", json=body)
+        latencies.append(time.perf_counter() - start)
+    result.update(percentiles("control_measurement", latencies))
+    return result
+
+
+def run_in_process(case):
+    """Run one case in a fresh Python process, its metrics and peak RSS."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "result.json")
+        # A home directory of its own, so that nothing of the case ends up in
+        # the user's (~/.keithley2000)
+        home = {"HOME": tmp, "USERPROFILE": tmp}
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", "--run", case, "--result", path],
+            stdout=subprocess.DEVNULL,
+            env={**os.environ, **home},
+            check=True,
+        )
+        with open(path) as f:
+            return json.load(f)
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+
+def compare(results, baseline, tolerance):
+    """Print every metric next to the baseline; the names of regressions."""
+    regressions = []
+    print(f"{'case':<12} {'metric':<32} {'before':>12} {'now':>12} {'change':>8}")
+    for case, metrics in results["cases"].items():
+        before = baseline["cases"].get(case, {})
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if old is None or value is None:
+                continue
+            change = (value - old) / old if old else 0.0
+            worse = -change if higher_is_better(metric) else change
+            if metric.endswith("_ms") and value - old < MIN_CHANGE_MS:
+                worse = 0.0
+            flag = ""
+            if worse > tolerance:
+                regressions.append(f"{case}/{metric}")
+                flag = " worse"
+            print(
+                f"{case:<12} {metric:<32} {old:>12.3f} {value:>12.3f}"
+                f" {change:>+7.0%}{flag}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--output", help="result file (default in benchmarks/results)")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    # Internal: run one case in this process
+    parser.add_argument("--run", choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        if args.run == "acquisition":
+            result = acquisition_case()
+        else:
+            result = run_case(RUN_HOURS[args.run])
+        result["peak_rss_mb"] = peak_rss_mb()
+        with open(args.result, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = {
+        "commit": commit(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": {},
+    }
+    for case in args.cases:
+        print(f"{case} ...", flush=True)
+        results["cases"][case] = run_in_process(case)
+        for metric, value in results["cases"][case].items():
+            if value is not None:
+                print(f"    {metric:<32} {value:>12.3f}")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR,
+        f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}-{results['commit']}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline['commit']} ({baseline['time']}):")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit(
+                f"Worse by more than {args.tolerance:.0%}: {', '.join(regressions)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
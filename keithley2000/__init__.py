@@ -0,0 +1 @@
+"""Helpers for the Keithley 2000 heat flow calorimeter app (see app.py)."""
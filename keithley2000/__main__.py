@@ -0,0 +1,283 @@
+"""Headless acquisition: runs without the dashboard, Dash or Plotly.
+
+    python -m keithley2000 acquire --weight 1=1.52 --weight 3=0.98 --directory D:/
+    python -m keithley2000 acquire --config run.json
+    python -m keithley2000 status
+    python -m keithley2000 stop
+
+acquire starts a run and keeps measuring until Ctrl+C, SIGTERM, "stop" or
+until the run ends (stopped from the dashboard, or failed: exit status 1).
+The channels (calibration, default weights) come from the channel file,
+see keithley2000/channels.py; only channels with a weight are measured.
+The defaults (instrument, serial link, output files, journal directory,
+adaptive spacing) come from settings.py, the same as for the dashboard.
+Every option can also be given in a JSON config file (with _ instead of
+-, "weights" as {"channel id": grams}), the command line wins. The run is
+served on a local control socket (keithley2000/service.py): "status" and
+"stop" talk to it, and the dashboard attaches to it with
+
+    KEITHLEY_ACQUISITION=127.0.0.1:8051 python app.py
+
+(or serve.py --attach), so that it shows the run and can stop it, while
+the measurement goes on when the dashboard is restarted.
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+from keithley2000.acquisition import CLOSE_TIMEOUT, Acquisition, AcquisitionEngine
+from keithley2000.channels import load_channels
+from keithley2000.data import MeasurementFileCache
+from keithley2000.service import (
+    DEFAULT_ADDRESS,
+    AcquisitionServer,
+    load_authkey,
+    parse_address,
+)
+
+# settings.py of the repository root (run from there), shared with app.py
+import settings
+
+# Seconds between the status lines printed during a run
+STATUS_SECONDS = 60
+
+
+def parse_weight(text):
+    """ "ID=GRAMS" -> (id, grams); a comma works as decimal separator too."""
+    channel, _, grams = text.partition("=")
+    try:
+        return int(channel), float(grams.replace(",", "."))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not ID=GRAMS: {text!r}") from None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m keithley2000", description=__doc__.splitlines()[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    # Defaults from settings.py, the same as the dashboard's: first instrument
+    instrument = settings.INSTRUMENTS[0]
+    link = settings.SERIAL_LINK
+
+    acquire = commands.add_parser("acquire", help="start a run and serve it")
+    acquire.add_argument("--config", help="JSON file with any of the options below")
+    acquire.add_argument(
+        "--resource",
+        default=instrument.get("resource", settings.VISA_RESOURCE),
+        help='VISA resource, e.g. ASRL3::INSTR, "SIM" for the simulator',
+    )
+    acquire.add_argument("--name", default=instrument["name"], help="instrument name")
+    acquire.add_argument(
+        "--channels", default=settings.CHANNELS_FILE, help="channel file"
+    )
+    acquire.add_argument(
+        "--weight",
+        type=parse_weight,
+        action="append",
+        default=[],
+        metavar="ID=GRAMS",
+        help="sample weight of a channel (repeat per channel)",
+    )
+    acquire.add_argument("--interval", type=float, default=20, help="point spacing (s)")
+    acquire.add_argument(
+        "--adaptive", action="store_true", help="shorter spacing during fast changes"
+    )
+    acquire.add_argument("--directory", default=os.getcwd())
+    acquire.add_argument(
+        "--prefix",
+        default=datetime.now().strftime("%Y-%m-%d_%H-%M"),
+        help="filenames are PREFIX-ID.csv",
+    )
+    acquire.add_argument(
+        "--format",
+        dest="formats",
+        choices=["csv", "binary"],
+        action="append",
+        help="output format (repeat for both, default OUTPUT_FORMATS)",
+    )
+    acquire.add_argument(
+        "--mode", choices=["scan", "step"], default=settings.ACQUISITION_MODE
+    )
+    acquire.add_argument("--baud-rate", type=int, default=link["baud_rate"])
+    acquire.add_argument(
+        "--data-format",
+        choices=["ascii", "sreal", "dreal"],
+        default=link["data_format"],
+    )
+    acquire.add_argument(
+        "--time-scale",
+        type=float,
+        default=settings.SIMULATOR_OPTIONS.get("time_scale", 1.0),
+        help="speed of the simulator",
+    )
+    acquire.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the interrupted run of the instrument instead",
+    )
+    acquire.add_argument("--status-seconds", type=float, default=STATUS_SECONDS)
+
+    status = commands.add_parser("status", help="show the state of the runs")
+    stop = commands.add_parser("stop", help="stop the runs and exit")
+    for command in (acquire, status, stop):
+        command.add_argument(
+            "--control",
+            default="{}:{}".format(*DEFAULT_ADDRESS),
+            help="address of the control socket (host:port)",
+        )
+        command.add_argument(
+            "--journal-dir",
+            default=settings.JOURNAL_DIR,
+            help="run journals and the key of the control socket",
+        )
+    return parser, acquire
+
+
+def parse_args(argv=None):
+    """The arguments, with the defaults of acquire taken from --config."""
+    parser, acquire = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "acquire" and args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+        weights = config.pop("weights", {})
+        unknown = set(config) - set(vars(args))
+        if unknown:
+            parser.error(f"{args.config}: unknown options {', '.join(sorted(unknown))}")
+        acquire.set_defaults(**config)
+        args = parser.parse_args(argv)
+        args.weight = [(int(c), float(g)) for c, g in weights.items()] + args.weight
+    return args
+
+
+def acquire(args):
+    channels = load_channels(args.channels)
+    weights = {c.id: c.weight for c in channels}
+    for channel, grams in args.weight:
+        if channel not in weights:
+            sys.exit(f"Channel {channel} is not enabled in {args.channels}")
+        weights[channel] = grams
+    weights = [weights[c.id] for c in channels]
+    if not args.resume and all(w is None for w in weights):
+        sys.exit("No channel has a weight, give one with --weight ID=GRAMS")
+    filenames = [
+        os.path.join(args.directory, f"{args.prefix}-{c.id}.csv") for c in channels
+    ]
+
+    acquisition = Acquisition(
+        args.name,
+        args.resource,
+        mode=args.mode,
+        simulator_options={**settings.SIMULATOR_OPTIONS, "time_scale": args.time_scale},
+        formats=args.formats or settings.OUTPUT_FORMATS,
+        link={
+            **settings.SERIAL_LINK,
+            "baud_rate": args.baud_rate,
+            "data_format": args.data_format,
+        },
+        output_options={
+            "flush_rows": settings.CSV_FLUSH_ROWS,
+            "flush_seconds": settings.CSV_FLUSH_SECONDS,
+            "fsync_seconds": settings.CSV_FSYNC_SECONDS,
+        },
+        journal_dir=args.journal_dir,
+        channels=channels,
+    )
+    engine = AcquisitionEngine([acquisition])
+    server = AcquisitionServer(
+        engine, parse_address(args.control), load_authkey(args.journal_dir)
+    )
+    serving = threading.Thread(target=server.serve_forever, name="control")
+    serving.start()
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    error = None
+    try:
+        if args.resume:
+            # Shown before the new samples when the dashboard attaches
+            journal = acquisition.interrupted()
+            existing = None
+            if journal is not None:
+                existing = MeasurementFileCache().read(journal["filenames"])
+            engine.resume(args.name, existing)
+        else:
+            engine.start(
+                args.name,
+                filenames,
+                args.interval,
+                weights,
+                adaptive=settings.ADAPTIVE_SPACING if args.adaptive else None,
+            )
+        print(f"Measuring: {', '.join(acquisition.filenames)}")
+        next_status = time.monotonic() + args.status_seconds
+        # Short waits, so that a stop over the control socket ends this too
+        while not stop.wait(1.0) and serving.is_alive():
+            # Stopped from the dashboard, or failed
+            if not acquisition.running:
+                if not acquisition.stop_flag.is_set():
+                    error = acquisition.error or "The run ended unexpectedly"
+                break
+            if time.monotonic() >= next_status:
+                print(acquisition.status(), flush=True)
+                next_status += args.status_seconds
+    except RuntimeError as e:
+        error = str(e)
+    finally:
+        # Let the outputs write everything, then close the instrument
+        engine.stop_all()
+        if acquisition.thread is not None:
+            acquisition.thread.join(CLOSE_TIMEOUT + 10)
+        server.close()
+        serving.join()
+        print(acquisition.status())
+    if error:
+        sys.exit(error)
+
+
+def request(args, method, *arguments):
+    """Send one request to the control socket of a running acquisition."""
+    authkey = load_authkey(args.journal_dir)
+    try:
+        with Client(parse_address(args.control), authkey=authkey) as c:
+            c.send((method, arguments))
+            status, result = c.recv()
+    except AuthenticationError:
+        sys.exit(
+            f"The acquisition at {args.control} uses another key (KEITHLEY_AUTHKEY)"
+        )
+    except (OSError, EOFError) as e:
+        sys.exit(f"No acquisition at {args.control}: {e}")
+    if status == "error":
+        sys.exit(result[1])
+    return result
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "acquire":
+        acquire(args)
+    elif args.command == "status":
+        for state in request(args, "state"):
+            print(state["status"])
+    elif args.command == "stop":
+        request(args, "shutdown")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,569 @@
+import os
+import threading
+import time
+
+from keithley2000 import events, metrics
+from keithley2000.channels import ChannelTransform, channels_from_factors
+from keithley2000.instrument import (
+    SETUP_COMMANDS,
+    configure_scan,
+    data_format_commands,
+    read_channel,
+    read_scan,
+)
+from keithley2000.journal import RunJournal, new_run_id
+from keithley2000.live import LiveStore
+from keithley2000.pipeline import Pipeline, Sink
+from keithley2000.scheduler import AdaptiveScheduler, SweepScheduler
+from keithley2000.session import InstrumentSession
+from keithley2000.store import RunStoreWriter, last_reading, store_path
+from keithley2000.writer import CsvWriter
+
+NO_VISA_RESOURCE = (
+    "No VISA resources found! Please check if your instrument is connected"
+    " and powered on, then click Run again."
+)
+
+CONNECTION_FAILED = (
+    "The instrument does not answer! Please check the cable and the"
+    " USB-to-serial adaptor, then click Run again."
+)
+
+NAN = float("nan")
+
+# Reconnect to the instrument after this many sweeps in a row without a reading
+RECONNECT_AFTER_FAILURES = 3
+
+# Seconds the measurement thread waits for the processing of a sweep before
+# the adaptive spacing chooses the next measurement point
+OBSERVE_TIMEOUT = 1.0
+
+# Seconds the outputs get to write everything at the end of a run
+CLOSE_TIMEOUT = 30
+
+
+def csv_sink(writer, instrument):
+    """Time, normed data (mW per gram) and the absolute time to the CSV files."""
+
+    def write(readings):
+        for r in readings:
+            writer.write(r.index, r.elapsed / 3600.0, r.normed, r.wall)
+
+    return Sink("CSV files", write, writer.close, instrument)
+
+
+def store_sink(store, instrument):
+    """Everything to the binary store, also the raw and calibrated values."""
+
+    def write(readings):
+        for r in readings:
+            store.write(
+                r.index,
+                r.seq,
+                r.channel,
+                r.elapsed,
+                r.wall,
+                NAN if r.value is None else r.value,
+                NAN if r.calibrated == "" else r.calibrated,
+                NAN if r.normed == "" else r.normed,
+            )
+
+    return Sink("binary store", write, store.close, instrument)
+
+
+def journal_sink(journal, run, progress, instrument):
+    """Journal updates every JOURNAL_SECONDS; progress gets the last written
+    last_seq and last_elapsed."""
+
+    def write(readings):
+        for r in readings:
+            if r.seq >= 0:
+                progress["last_seq"] = r.seq
+            progress["last_elapsed"] = r.elapsed
+        if journal.due():
+            journal.update(state="running", **progress, **run)
+
+    return Sink("journal", write, lambda: None, instrument)
+
+
+class Acquisition:
+    """Measurement loop of one instrument, running in its own thread.
+
+    The instrument settings (resource, channels, acquisition mode, output
+    formats and their buffering) are fixed, filenames, interval and weights
+    are given per run, one per channel. channels: Channels (see
+    keithley2000.channels), or cal_factors for channels 1, 2, ... with one
+    calibration factor each. formats: "csv" (text files) and/or "binary"
+    (see keithley2000.store). link: serial link settings (see
+    LINK_DEFAULTS). journal_dir: where the run journal is kept (see
+    keithley2000.journal), None for no journal.
+    """
+
+    def __init__(
+        self,
+        name,
+        resource=None,
+        cal_factors=(),
+        mode="scan",
+        simulator_options=None,
+        formats=("csv",),
+        output_options=None,
+        link=None,
+        journal_dir=None,
+        channels=None,
+    ):
+        self.name = name
+        self.resource = resource
+        if channels is None:
+            channels = channels_from_factors(cal_factors)
+        self.channels = list(channels)
+        self.mode = mode
+        self.simulator_options = simulator_options
+        self.formats = tuple(formats)
+        self.output_options = dict(output_options or {})
+        self.live = LiveStore()
+        # The serial connection stays open between runs
+        self.session = InstrumentSession(resource, simulator_options, link)
+        self.data_format = self.session.link["data_format"]
+        self.setup_commands = SETUP_COMMANDS + data_format_commands(self.data_format)
+        self.stop_flag = threading.Event()
+        self.error = ""
+        self.thread = None
+        self._ended = False  # run() has returned, the thread is about to end
+        self.scheduler = None
+        self.pipeline = None
+        self.filenames = []
+        self.weights = []
+        self.interval = None
+        self.adaptive = None
+        self.journal = RunJournal(journal_dir, name) if journal_dir else None
+        self.resumed = None  # Journal of the interrupted run being continued
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive() and not self._ended
+
+    def start(
+        self,
+        filenames,
+        interval_seconds,
+        weights,
+        existing=None,
+        adaptive=None,
+        resume=None,
+    ):
+        """Start a run. existing: data already in the files, shown before the new samples.
+
+        adaptive: options of AdaptiveScheduler to make the spacing shorter
+        during fast changes, interval_seconds is the longest spacing then.
+        resume: journal of an interrupted run to continue (see interrupted()).
+        """
+        if self.running:
+            raise RuntimeError(f"{self.name} is already measuring")
+        if resume is None and len(filenames) != len(self.channels):
+            raise RuntimeError(
+                f"{self.name} has {len(self.channels)} channels,"
+                f" got {len(filenames)} filenames"
+            )
+        if self.journal is not None:
+            # Refuses a run while another process measures with this journal
+            self.journal.lock()
+        self.filenames = list(filenames)
+        self.interval = interval_seconds
+        self.adaptive = adaptive
+        self.weights = list(weights)
+        self.error = ""
+        self.stop_flag.clear()
+        self.resumed = resume
+        first_seq = None
+        if resume is not None:
+            # The journal is updated every JOURNAL_SECONDS, the stores may
+            # have more: sequence numbers go on after the last one written
+            stored = [last_reading(store_path(f)) for f in self.filenames]
+            first_seq = max([resume["last_seq"]] + [seq for seq, _ in stored]) + 1
+            last_elapsed = max([resume["last_elapsed"]] + [e for _, e in stored])
+            self.resumed = dict(resume, last_elapsed=last_elapsed)
+        # Graph and status read the new samples from memory from now on
+        self.live.start_run(self.filenames, existing, first_seq)
+        self._ended = False
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(self.filenames, interval_seconds, self.weights),
+            name=f"acquisition-{self.name}",
+            daemon=True,
+        )
+        self.thread.start()
+        events.publish("state")
+
+    def stop(self):
+        self.stop_flag.set()
+
+    def interrupted(self):
+        """Journal of a run that did not stop normally, None if there is none."""
+        if self.journal is None or self.running:
+            return None
+        return self.journal.interrupted()
+
+    def discard(self):
+        """Do not offer to resume the interrupted run any more."""
+        if self.interrupted() is not None:
+            self.journal.mark("discarded")
+            events.publish("state")
+
+    def _run(self, *args):
+        try:
+            self.run(*args)
+        except Exception as e:
+            print(f"{self.name}: the run failed: {e}")
+            self.error = self.error or f"The run failed: {e}"
+        finally:
+            if self.journal is not None:
+                self.journal.unlock()
+            # Not running any more from here on, also for the callbacks
+            # notified of the change
+            self._ended = True
+            events.publish("state")
+
+    def run(self, filenames, interval_seconds, weights):
+        resume = self.resumed
+        # A resumed run keeps its channels and calibration
+        if resume is not None:
+            # Journals from before the channel configuration have cal_factors
+            ids = resume.get("channel_ids") or list(range(1, len(weights) + 1))
+            calibrations = resume.get("calibrations") or [
+                [0.0, f] for f in resume["cal_factors"]
+            ]
+        else:
+            ids = [c.id for c in self.channels]
+            calibrations = [c.calibration for c in self.channels]
+        # Only channels with a weight are measured and written to file
+        channels = [c for c, w in zip(ids, weights) if w is not None]
+        try:
+            instrument = self.connect(channels, reset=resume is None)
+        except Exception as e:
+            # The port kept open since the last run may be gone (adaptor
+            # unplugged): open it again like during a run
+            print(f"{self.name}: could not connect ({e}), reconnecting ...")
+            instrument = self.reconnect(channels)
+            if instrument is None:
+                self.session.close()  # The next Run opens the port again
+                self.error = CONNECTION_FAILED
+                return
+        if instrument is None:
+            self.error = NO_VISA_RESOURCE
+            return
+        writer = store = None
+        if "csv" in self.formats:
+            writer = CsvWriter(filenames, **self.output_options)
+        if "binary" in self.formats:
+            store = RunStoreWriter(filenames, **self.output_options)
+        self.scheduler = None
+        self.pipeline = None
+        interrupted = False
+        run = None
+        progress = {"last_seq": self.live.last_seq, "last_elapsed": 0.0}
+        try:
+            # Readings are timed with the monotonic clock, the wall clock is
+            # only used once to get absolute timestamps for the CSV files
+            wall_now = time.time()
+            if self.adaptive is not None:
+                self.scheduler = AdaptiveScheduler(
+                    interval_seconds,
+                    self.stop_flag,
+                    time.monotonic,
+                    self.name,
+                    **self.adaptive,
+                )
+            else:
+                self.scheduler = SweepScheduler(
+                    interval_seconds, self.stop_flag, time.monotonic, self.name
+                )
+            # A resumed run continues its time axis
+            offset = 0.0 if resume is None else wall_now - resume["wall_start"]
+            start_time = self.scheduler.start - offset
+            wall_start = wall_now - offset
+            if resume is not None:
+                gap = offset - resume["last_elapsed"]
+                print(f"{self.name}: resuming run after a gap of {gap / 3600:.2f} h")
+                for index, channel in enumerate(ids):
+                    if channel not in channels:
+                        continue
+                    if writer is not None:
+                        writer.write_gap(index, offset / 3600, wall_now)
+                    if store is not None:
+                        store.write_gap(index, channel, offset, wall_now)
+            run = {
+                "run_id": resume["run_id"] if resume else new_run_id(),
+                "instrument": self.name,
+                "resource": self.resource,
+                "wall_start": wall_start,
+                "filenames": [os.path.abspath(f) for f in filenames],
+                "channels": channels,
+                "channel_ids": ids,
+                "weights": weights,
+                "calibrations": calibrations,
+                "interval": interval_seconds,
+                "adaptive": self.adaptive,
+                "mode": self.mode,
+            }
+            progress["last_elapsed"] = offset
+            # Processing and writing the files happen in threads of their
+            # own, this thread only talks to the instrument
+            sinks = []
+            if writer is not None:
+                sinks.append(csv_sink(writer, self.name))
+            if store is not None:
+                sinks.append(store_sink(store, self.name))
+            if self.journal is not None:
+                self.journal.write(state="running", **progress, **run)
+                sinks.append(journal_sink(self.journal, run, progress, self.name))
+            self.pipeline = Pipeline(
+                self.name,
+                ids,
+                ChannelTransform(calibrations, weights),
+                self.live,
+                sinks,
+                self.scheduler.observe if self.adaptive is not None else None,
+            )
+            failures = 0
+            while True:
+                if failures >= RECONNECT_AFTER_FAILURES:
+                    print(f"{self.name}: no readings, reconnecting ...")
+                    instrument = self.reconnect(channels)
+                    if instrument is None:
+                        break
+                    failures = 0
+
+                sweep_start = time.monotonic()
+                if self.mode == "scan" and channels:
+                    before = time.monotonic()
+                    try:
+                        values = read_scan(instrument, channels, self.data_format)
+                    except Exception as e:
+                        print(f"{self.name}: error scanning channels {channels}: {e}")
+                        values = [None] * len(channels)
+                        failures += 1
+                    else:
+                        failures = 0
+                    # The channels are measured one after the other during READ?
+                    step = (time.monotonic() - before) / len(channels)
+                    readings = [
+                        (channel, value, before + (i + 0.5) * step)
+                        for i, (channel, value) in enumerate(zip(channels, values))
+                    ]
+                else:
+                    readings = []
+                    for channel in channels:
+                        if self.stop_flag.is_set():
+                            break
+                        before = time.monotonic()
+                        try:
+                            value = read_channel(instrument, channel, self.data_format)
+                            now = (before + time.monotonic()) / 2
+                            readings.append((channel, value, now))
+                        except Exception as e:
+                            print(f"{self.name}: error with channel {channel}: {e}")
+                    failures = 0 if readings or not channels else failures + 1
+                metrics.observe(
+                    "sweep_seconds",
+                    time.monotonic() - sweep_start,
+                    instrument=self.name,
+                    mode=self.mode,
+                )
+
+                self.pipeline.put(
+                    [
+                        (
+                            channel,
+                            value,
+                            now - start_time,
+                            wall_start + now - start_time,
+                        )
+                        for channel, value, now in readings
+                    ]
+                )
+                # Wait for the next measurement point, returns at once on
+                # Stop. The adaptive spacing needs the processed readings.
+                if self.adaptive is not None:
+                    self.pipeline.wait_processed(OBSERVE_TIMEOUT)
+                if not self.scheduler.wait():
+                    break
+        except Exception as e:
+            print(f"{self.name}: an error occurred:", e)
+            interrupted = True
+        finally:
+            if self.pipeline is not None:
+                if not self.pipeline.close(CLOSE_TIMEOUT):
+                    print(f"{self.name}: the output files are still being written")
+            else:
+                for output in (writer, store):
+                    if output is not None:
+                        output.close()
+            if self.scheduler is not None:
+                summary = self.scheduler.summary()
+                if self.pipeline is not None:
+                    summary += ", " + self.pipeline.summary()
+                print(f"{self.name} finished:", summary)
+            # Only a run that was stopped is not offered for resuming
+            if self.journal is not None and run is not None:
+                self.journal.write(
+                    final=True,
+                    state="running" if interrupted else "stopped",
+                    **progress,
+                    **run,
+                )
+            if self.session.is_open:
+                try:
+                    self.session.instrument.write("ROUT:CLOS:ALL")
+                except Exception as e:
+                    print(f"{self.name}: error at the end of the run: {e}")
+
+    def connect(self, channels, reset=True):
+        """Open (if needed) and set up the instrument, None if there is none."""
+        instrument = self.session.open(reset=reset)
+        if instrument is None:
+            return None
+        self.session.configure(self.setup_commands)
+        if self.mode == "scan":
+            configure_scan(instrument, channels)
+        return instrument
+
+    def reconnect(self, channels):
+        """Reopen and set up the instrument, waiting longer after every failure.
+
+        None if Stop was clicked first.
+        """
+        while self.session.reconnect(self.stop_flag, self.setup_commands):
+            try:
+                if self.mode == "scan":
+                    configure_scan(self.session.instrument, channels)
+                return self.session.instrument
+            except Exception as e:
+                print(f"{self.name}: error setting up the scan: {e}")
+        return None
+
+    def close(self):
+        """Stop and close the connection to the instrument."""
+        self.stop()
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+        self.session.close()
+
+    def status(self):
+        """One line about the current or last run."""
+        if self.error in (NO_VISA_RESOURCE, CONNECTION_FAILED):
+            return f"{self.name}: not connected"
+        if self.error:
+            return f"{self.name}: failed"
+        buffers = [self.live.get(name) for name in self.filenames]
+        buffers = [b for b in buffers if b is not None and len(b)]
+        readings = sum(len(b) for b in buffers)
+        state = "measuring" if self.running else "idle"
+        if not buffers:
+            if self.running:
+                return f"{self.name}: measuring, waiting for the first reading ..."
+            return f"{self.name}: idle"
+        last = max(b.arrays()[0][-1] for b in buffers)
+        status = f"{self.name}: {state}, {readings} readings, last at {last:.3f} h"
+        if self.running and isinstance(self.scheduler, AdaptiveScheduler):
+            status += f", spacing {self.scheduler.interval:g} s"
+        if self.pipeline is not None:
+            if self.pipeline.total_dropped:
+                status += f", {self.pipeline.total_dropped} sweeps dropped"
+            if self.pipeline.overflows:
+                status += f", {self.pipeline.overflows} overflows"
+        return status
+
+
+class AcquisitionEngine:
+    """All instruments, each measuring in its own thread.
+
+    A slow serial round trip of one instrument therefore never delays the
+    sweeps of another one.
+    """
+
+    def __init__(self, acquisitions=()):
+        self.acquisitions = {}
+        for acquisition in acquisitions:
+            self.add(acquisition)
+
+    def add(self, acquisition):
+        if acquisition.name in self.acquisitions:
+            raise ValueError(f"Duplicate instrument name {acquisition.name!r}")
+        self.acquisitions[acquisition.name] = acquisition
+        return acquisition
+
+    def __getitem__(self, name):
+        return self.acquisitions[name]
+
+    def __iter__(self):
+        return iter(self.acquisitions.values())
+
+    def start(
+        self,
+        name,
+        filenames,
+        interval_seconds,
+        weights,
+        existing=None,
+        adaptive=None,
+        resume=None,
+    ):
+        acquisition = self.acquisitions[name]
+        paths = {os.path.abspath(f) for f in filenames}
+        for other in self:
+            if other is acquisition or not other.running:
+                continue
+            if other.resource == acquisition.resource:
+                raise RuntimeError(f"{other.name} is using the same instrument")
+            if paths & {os.path.abspath(f) for f in other.filenames}:
+                raise RuntimeError(f"{other.name} is writing to the same files")
+        # Files of an earlier run of another instrument are read from disk again
+        for other in self:
+            if other is not acquisition and not other.running:
+                if paths & {os.path.abspath(f) for f in other.filenames}:
+                    other.live.start_run([])
+        acquisition.start(
+            filenames, interval_seconds, weights, existing, adaptive, resume
+        )
+
+    def interrupted(self):
+        """{name: journal} of the instruments with an interrupted run."""
+        journals = {a.name: a.interrupted() for a in self}
+        return {name: j for name, j in journals.items() if j is not None}
+
+    def resume(self, name, existing=None):
+        """Continue the interrupted run of an instrument (same files, time axis)."""
+        journal = self.acquisitions[name].interrupted()
+        if journal is None:
+            raise RuntimeError(f"{name} has no interrupted run")
+        self.start(
+            name,
+            journal["filenames"],
+            journal["interval"],
+            journal["weights"],
+            existing,
+            journal["adaptive"],
+            resume=journal,
+        )
+
+    def discard(self, name):
+        self.acquisitions[name].discard()
+
+    def stop(self, name):
+        self.acquisitions[name].stop()
+
+    def stop_all(self):
+        for acquisition in self:
+            acquisition.stop()
+
+    def close(self):
+        for acquisition in self:
+            acquisition.close()
+
+    def find(self, filename):
+        """Acquisition whose live run includes this file, or None."""
+        for acquisition in self:
+            if acquisition.live.get(filename) is not None:
+                return acquisition
+        return None
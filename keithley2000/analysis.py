@@ -0,0 +1,148 @@
+"""Post-processing of heat flow curves (time in h, heat flow in mW/g).
+
+All functions work on NumPy arrays, CumulativeHeat updates the total heat
+incrementally while a run is going. NaN heat flow (the gap of a resumed run,
+see keithley2000.data) is skipped.
+"""
+
+import numpy as np
+
+# 1 mW/g integrated over 1 h = 3.6 J/g
+J_PER_MWH = 3.6
+
+
+def subtract_baseline(times, normed, baseline):
+    """Remove a zero offset or a linear zero drift.
+
+    baseline is either a constant (mW/g) or two points ((t0, q0), (t1, q1))
+    of the zero line, e.g. measured before and after the run.
+    """
+    if np.ndim(baseline) == 0:
+        return normed - baseline
+    (t0, q0), (t1, q1) = baseline
+    return normed - (q0 + (q1 - q0) * (times - t0) / (t1 - t0))
+
+
+def baseline_from_window(times, normed, start, stop):
+    """Mean heat flow between start and stop (h), e.g. at the end of a long run."""
+    mask = (times >= start) & (times <= stop)
+    if not mask.any():
+        raise ValueError(f"No data between {start} h and {stop} h")
+    return float(normed[mask].mean())
+
+
+def moving_average(values, window):
+    """Centered moving average over an odd number of points, shorter at the ends."""
+    if window < 2 or len(values) < 2:
+        return np.asarray(values, dtype=float)
+    half = window // 2
+    padded = np.concatenate([[0.0], np.cumsum(values, dtype=float)])
+    n = len(values)
+    lo = np.clip(np.arange(n) - half, 0, n)
+    hi = np.clip(np.arange(n) + half + 1, 0, n)
+    return (padded[hi] - padded[lo]) / (hi - lo)
+
+
+def savgol_coefficients(window, order):
+    """Smoothing coefficients of a Savitzky-Golay filter (least squares polynomial)."""
+    if window % 2 == 0 or window <= order:
+        raise ValueError("window must be odd and larger than order")
+    half = window // 2
+    x = np.arange(-half, half + 1)
+    vandermonde = np.vander(x, order + 1, increasing=True)
+    return np.linalg.pinv(vandermonde)[0]
+
+
+def savitzky_golay(values, window=11, order=2):
+    """Savitzky-Golay smoothing; the ends are smoothed by the moving average."""
+    values = np.asarray(values, dtype=float)
+    if len(values) < window:
+        return moving_average(values, window)
+    smoothed = np.convolve(values, savgol_coefficients(window, order)[::-1], "same")
+    half = window // 2
+    ends = moving_average(values, window)
+    smoothed[:half] = ends[:half]
+    smoothed[-half:] = ends[-half:]
+    return smoothed
+
+
+def cumulative_heat(times, normed):
+    """Total heat (J/g) released up to every point, trapezoidal rule.
+
+    A NaN point is bridged by the trapezoid of the points around it and gets
+    the heat of the point before.
+    """
+    if len(times) < 2:
+        return np.zeros(len(times))
+    valid = ~np.isnan(normed)
+    if not valid.all():
+        heat = np.zeros(len(times))
+        heat[valid] = cumulative_heat(times[valid], normed[valid])
+        last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(times)), 0))
+        return heat[last_valid]
+    steps = 0.5 * (normed[1:] + normed[:-1]) * np.diff(times)
+    return np.concatenate([[0.0], np.cumsum(steps)]) * J_PER_MWH
+
+
+def find_peak(times, normed, after=0.0):
+    """Time (h) and height (mW/g) of the maximum heat flow after a given time.
+
+    Use after to skip the initial wetting peak. Returns (None, None) if there
+    is no data after that time.
+    """
+    mask = (times >= after) & ~np.isnan(normed)
+    if not mask.any():
+        return None, None
+    index = np.flatnonzero(mask)[np.argmax(normed[mask])]
+    return float(times[index]), float(normed[index])
+
+
+class CumulativeHeat:
+    """Total heat of a growing curve, integrating only the new points.
+
+    update() is called with the complete (times, normed) arrays of a run
+    every time; if they got shorter, the run was restarted and everything
+    is integrated again.
+    """
+
+    def __init__(self, baseline=0.0, peak_after=0.5):
+        self.baseline = baseline
+        self.peak_after = peak_after
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.heat = np.zeros(1024)
+        self.peak_time = self.peak_height = None
+
+    def update(self, times, normed):
+        n = len(times)
+        if n < self.count:
+            self.reset()
+        if n > self.count:
+            # Continue from the last point with a value that was integrated
+            # already
+            start = max(self.count - 1, 0)
+            while start and np.isnan(normed[start]):
+                start -= 1
+            t = times[start:]
+            q = subtract_baseline(t, normed[start:], self.baseline)
+            new = cumulative_heat(t, q)
+            if self.count:
+                new = new[self.count - start :] + self.heat[start]
+            if n > len(self.heat):
+                self.heat = np.resize(self.heat, max(n, 2 * len(self.heat)))
+            self.heat[self.count : n] = new
+            peak_time, peak_height = find_peak(
+                times[self.count :], normed[self.count :], self.peak_after
+            )
+            if peak_height is not None and (
+                self.peak_height is None or peak_height > self.peak_height
+            ):
+                self.peak_time, self.peak_height = peak_time, peak_height
+            self.count = n
+        return self.heat[:n]
+
+    @property
+    def total(self):
+        return float(self.heat[self.count - 1]) if self.count else 0.0
@@ -0,0 +1,251 @@
+"""SQLite index of the measurement files in the CSV directories.
+
+Every channel file (x.csv, or a binary store x.run without CSV file) gets a
+row with its start time, duration, number of points, main peak, total heat
+and a decimated preview of PREVIEW_POINTS points, so the run list and
+overlays of old runs are shown without reading the files. scan() only
+reads files whose size or modification time changed since they were
+indexed.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from keithley2000.analysis import cumulative_heat, find_peak
+from keithley2000.data import MeasurementFileCache
+from keithley2000.decimate import minmax_decimate
+from keithley2000.store import load_run, segment_names, store_path
+from keithley2000.writer import HEADER
+
+PREVIEW_POINTS = 500
+
+# The main peak is looked for after the initial wetting peak (h)
+PEAK_AFTER = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    path TEXT PRIMARY KEY,
+    directory TEXT,
+    name TEXT,
+    size INTEGER,
+    mtime INTEGER,
+    started REAL,
+    duration REAL,
+    points INTEGER,
+    peak_time REAL,
+    peak_flow REAL,
+    total_heat REAL,
+    preview BLOB
+)
+"""
+
+COLUMNS = [
+    "path",
+    "directory",
+    "name",
+    "started",
+    "duration",
+    "points",
+    "peak_time",
+    "peak_flow",
+    "total_heat",
+]
+
+
+def file_signature(path):
+    """(size, mtime) of a CSV file or of the segments of its binary store."""
+    store = store_path(path)
+    if os.path.isdir(store):
+        files = [os.path.join(store, n) for n in segment_names(store)]
+    else:
+        files = [path]
+    stats = [os.stat(f) for f in files]
+    return sum(s.st_size for s in stats), max((s.st_mtime_ns for s in stats), default=0)
+
+
+def started_at(path):
+    """Absolute time (Unix) of the first reading, None if unknown."""
+    store = store_path(path)
+    if os.path.isdir(store):
+        records = load_run(store)
+        return float(records["wall"][0]) if len(records) else None
+    with open(path) as f:
+        for line in f:
+            parts = line.split(",")
+            if len(parts) >= 3:
+                try:
+                    return datetime.fromisoformat(parts[2].strip()).timestamp()
+                except ValueError:
+                    continue  # Header
+    return None
+
+
+def is_measurement_file(path):
+    """CSV files written by this app (see keithley2000.writer.HEADER), or by
+    its earlier versions: no header, "time (h), normed" per line."""
+    try:
+        with open(path) as f:
+            first = f.readline()
+    except (OSError, UnicodeDecodeError):
+        return False
+    if first == HEADER:
+        return True
+    parts = first.split(",")
+    try:
+        float(parts[0]), float(parts[1])
+    except (ValueError, IndexError):
+        return False
+    return True
+
+
+def measurement_files(directory):
+    """Channel files in a directory: x.csv, and x.run stores without x.csv."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    files = []
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.endswith(".csv") and is_measurement_file(path):
+            files.append(path)
+        elif name.endswith(".run") and os.path.isdir(path):
+            csv = path[:-4] + ".csv"
+            if csv[len(directory) + 1 :] not in names:
+                files.append(csv)
+    return files
+
+
+class RunCatalog:
+    """The index, in the SQLite database at path; usable from several threads."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute(SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._changes = 0  # Incremented whenever scan() changed the index
+        self.scanning = False
+
+    @property
+    def version(self):
+        """Changes whenever the index was changed, by this catalog or by
+        another process (serve.py indexes for the gunicorn workers)."""
+        with self._lock:
+            # Only counts the commits of other connections
+            (data_version,) = self._db.execute("PRAGMA data_version").fetchone()
+        return f"{data_version}.{self._changes}"
+
+    def _index(self, path, signature):
+        times, normed = MeasurementFileCache().read([path])[0]
+        peak_time = peak_flow = None
+        total = 0.0
+        if len(times):
+            peak_time, peak_flow = find_peak(times, normed, PEAK_AFTER)
+            total = float(cumulative_heat(times, normed)[-1])
+        preview_t, preview_q = minmax_decimate(times, normed, PREVIEW_POINTS)
+        preview = np.stack([preview_t, preview_q]).astype("<f4").tobytes()
+        return (
+            path,
+            os.path.dirname(path),
+            os.path.basename(path),
+            *signature,
+            started_at(path),
+            float(times[-1]) if len(times) else 0.0,
+            len(times),
+            peak_time,
+            peak_flow,
+            total,
+            preview,
+        )
+
+    def scan(self, directories):
+        """Index new and changed files, drop the ones that are gone. Returns changes."""
+        self.scanning = True
+        try:
+            with self._lock:
+                known = {
+                    path: (size, mtime)
+                    for path, size, mtime in self._db.execute(
+                        "SELECT path, size, mtime FROM runs"
+                    )
+                }
+            rows, found = [], set()
+            for directory in dict.fromkeys(os.path.abspath(d) for d in directories):
+                for path in measurement_files(directory):
+                    found.add(path)
+                    try:
+                        signature = file_signature(path)
+                        if known.get(path) != signature:
+                            rows.append(self._index(path, signature))
+                    except (OSError, ValueError) as e:
+                        print(f"Could not index {path}: {e}")
+            scanned = {os.path.abspath(d) for d in directories}
+            gone = [
+                p for p in known if p not in found and os.path.dirname(p) in scanned
+            ]
+            if rows or gone:
+                with self._lock:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO runs VALUES"
+                        " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._db.executemany(
+                        "DELETE FROM runs WHERE path = ?", [(p,) for p in gone]
+                    )
+                    self._db.commit()
+                    self._changes += 1
+            return len(rows) + len(gone)
+        finally:
+            self.scanning = False
+
+    def scan_in_background(self, directories, on_change=None):
+        """scan() in a thread of its own (returned); on_change() is called
+        after it if the index changed."""
+
+        def scan():
+            if self.scan(directories) and on_change is not None:
+                on_change()
+
+        thread = threading.Thread(target=scan, name="catalog-scan", daemon=True)
+        thread.start()
+        return thread
+
+    def search(self, text="", limit=500):
+        """Runs whose name or directory contains text, newest first, as dicts."""
+        pattern = f"%{text.strip()}%"
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM runs"
+                " WHERE name LIKE ? OR directory LIKE ?"
+                " ORDER BY started DESC, name LIMIT ?",
+                (pattern, pattern, limit),
+            ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def previews(self, paths):
+        """{path: (times, normed)} of the decimated previews."""
+        if not paths:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, preview FROM runs WHERE path IN"
+                f" ({', '.join('?' * len(paths))})",
+                list(paths),
+            ).fetchall()
+        previews = {}
+        for path, blob in rows:
+            times, normed = np.frombuffer(blob, "<f4").reshape(2, -1).astype(float)
+            previews[path] = times, normed
+        return previews
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,113 @@
+"""Channel configuration: which scanner channels are used and how their
+readings become heat flow.
+
+The channels are listed in a JSON file (channels.json next to app.py), one
+entry per channel of the scanner card, up to SCANNER_CHANNELS:
+
+    [
+     {"id": 1, "label": "Channel 1", "calibration": [0, 12.45],
+      "weight": null, "enabled": true, "color": "#1f77b4"},
+     ...
+    ]
+
+id: channel of the scanner card (1 to 10). calibration: coefficients of the
+polynomial turning the reading (V) into heat flow (W), lowest power first;
+a single number is a factor (W/V). weight: sample weight (g) filled into the
+form, null for none. Only enabled channels are shown and measured; label and
+color are used in the form and the graph. Everything but id is optional.
+
+For a run, ChannelTransform combines the calibration (V to mW) and the
+division by the weight (mW to mW/g) of every channel into one table of
+polynomial coefficients, evaluated for a whole sweep at once.
+"""
+
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from keithley2000.instrument import SCANNER_CHANNELS
+
+# Plotly's default colors, one per scanner channel
+COLORS = [
+    "#1f77b4",
+    "#ff7f0e",
+    "#2ca02c",
+    "#d62728",
+    "#9467bd",
+    "#8c564b",
+    "#e377c2",
+    "#7f7f7f",
+    "#bcbd22",
+    "#17becf",
+]
+
+Channel = namedtuple("Channel", "id label calibration weight enabled color")
+
+
+def make_channel(
+    id, label=None, calibration=1.0, weight=None, enabled=True, color=None
+):
+    """Channel with defaults for everything but id; checks the values."""
+    if not isinstance(id, int) or not 1 <= id <= SCANNER_CHANNELS:
+        raise ValueError(f"Channel ids must be 1 to {SCANNER_CHANNELS}, not {id!r}")
+    if isinstance(calibration, (int, float)):
+        calibration = [0.0, calibration]
+    calibration = [float(c) for c in calibration]
+    if not calibration:
+        raise ValueError(f"Channel {id}: empty calibration")
+    return Channel(
+        id,
+        label or f"Channel {id}",
+        calibration,
+        None if weight is None else float(weight),
+        bool(enabled),
+        color or COLORS[id - 1],
+    )
+
+
+def channels_from_factors(cal_factors):
+    """Channels 1, 2, ... calibrated with one factor (W/V) each."""
+    return [make_channel(i + 1, calibration=f) for i, f in enumerate(cal_factors)]
+
+
+def load_channels(path):
+    """The enabled channels of the configuration file, in its order."""
+    with open(path) as f:
+        entries = json.load(f)
+    channels = [make_channel(**entry) for entry in entries]
+    ids = [c.id for c in channels]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path}: a channel id is listed twice")
+    return [c for c in channels if c.enabled]
+
+
+class ChannelTransform:
+    """Calibration and normalization of the channels of a run.
+
+    calibrations: coefficients (W per V**k) of every channel, weights: its
+    sample weight (g). apply() turns the readings (V) of a sweep into the
+    calibrated (mW) and normed (mW/g) values, NaN where the reading is NaN
+    or the weight is 0 or missing.
+    """
+
+    def __init__(self, calibrations, weights):
+        degree = max(len(c) for c in calibrations)
+        # [0]: V -> mW, [1]: V -> mW/g, highest power first for Horner's rule
+        self.coefficients = np.zeros((2, len(calibrations), degree))
+        for i, (calibration, weight) in enumerate(zip(calibrations, weights)):
+            mw = 1000 * np.asarray(calibration[::-1], dtype=float)
+            self.coefficients[0, i, degree - len(mw) :] = mw
+            self.coefficients[1, i, degree - len(mw) :] = (
+                mw / weight if weight else np.nan
+            )
+
+    def apply(self, indices, values):
+        """(calibrated, normed) arrays for the readings values of the channels
+        indices."""
+        coefficients = self.coefficients[:, indices]
+        values = np.asarray(values, dtype=float)
+        result = coefficients[:, :, 0].copy()
+        for k in range(1, coefficients.shape[2]):
+            result = result * values + coefficients[:, :, k]
+        return result[0], result[1]
@@ -0,0 +1,196 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from keithley2000.store import DTYPE, GAP_SEQ, segment_names, store_path
+from keithley2000.writer import GAP_NOTE
+
+# Initial number of rows allocated per file, grows by doubling
+INITIAL_CAPACITY = 4096
+
+# Note of the CSV row where a resumed run continues, see CsvWriter.write_gap
+_GAP_NOTE = GAP_NOTE.encode()
+
+# Files kept per cache; the least recently read one is dropped beyond that
+MAX_FILES = 64
+
+# Generations are unique in the process, so a file that was dropped from a
+# cache and read again never gets the generation it had before
+_generations = itertools.count(1)
+
+
+class _State:
+    """(time, normed) arrays read so far, growing as data is appended."""
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.times = np.empty(INITIAL_CAPACITY)
+        self.normed = np.empty(INITIAL_CAPACITY)
+        self.generation = next(_generations)
+
+    def _grow(self, needed):
+        capacity = len(self.times)
+        while capacity < needed:
+            capacity *= 2
+        if capacity != len(self.times):
+            self.times = np.resize(self.times, capacity)
+            self.normed = np.resize(self.normed, capacity)
+
+    def _append(self, times, normed):
+        n = len(times)
+        if n:
+            self._grow(self.count + n)
+            self.times[self.count : self.count + n] = times
+            self.normed[self.count : self.count + n] = normed
+            self.count += n
+
+    def arrays(self):
+        return self.times[: self.count], self.normed[: self.count]
+
+
+class _FileState(_State):
+    """Parsed contents of one measurement file and where reading stopped."""
+
+    def reset(self):
+        super().reset()
+        self.inode = None
+        self.mtime = None
+        self.offset = 0  # Byte offset just after the last complete line
+
+    def _append_lines(self, chunk):
+        rows = []
+        for line in chunk.splitlines():
+            parts = line.split(b",")
+            if len(parts) >= 2:
+                try:
+                    rows.append((float(parts[0]), float(parts[1])))
+                except ValueError:
+                    # The gap of a resumed run breaks the line in the graph
+                    if len(parts) >= 4 and parts[3].strip() == _GAP_NOTE:
+                        rows.append((float(parts[0]), np.nan))
+                    continue  # Header, empty value or garbage
+        if rows:
+            block = np.array(rows)
+            self._append(block[:, 0], block[:, 1])
+
+    def refresh(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            if self.count or self.inode is not None:
+                self.reset()
+            return
+        # Another file under the same name, a truncated or a rewritten file:
+        # start over
+        replaced = self.inode is not None and st.st_ino != self.inode
+        rewritten = st.st_size == self.offset and st.st_mtime_ns != self.mtime
+        if replaced or st.st_size < self.offset or (rewritten and self.offset):
+            self.reset()
+        elif st.st_size == self.offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read()
+        # Keep a partially written last line for the next refresh
+        end = chunk.rfind(b"\n") + 1
+        if end:
+            self._append_lines(chunk[:end])
+            self.offset += end
+        self.inode = st.st_ino
+        self.mtime = st.st_mtime_ns
+
+
+class _StoreState(_State):
+    """Binary store (see keithley2000.store) of a measurement file.
+
+    The segments are memory-mapped, only the records appended since the
+    last refresh are copied.
+    """
+
+    def reset(self):
+        super().reset()
+        self.inode = None
+        self.segment = 0  # Index of the segment read last
+        self.rows = 0  # Records read from that segment
+
+    def refresh(self):
+        try:
+            inode = os.stat(os.path.join(self.path, "meta.json")).st_ino
+            segments = segment_names(self.path)
+        except OSError:
+            if self.count or self.inode is not None:
+                self.reset()
+            return
+        if self.inode is not None and (
+            inode != self.inode or len(segments) <= self.segment and self.rows
+        ):
+            self.reset()
+        self.inode = inode
+        for index in range(self.segment, len(segments)):
+            filename = os.path.join(self.path, segments[index])
+            rows = os.path.getsize(filename) // DTYPE.itemsize
+            if index == self.segment and rows < self.rows:
+                self.reset()  # Truncated, read everything again on next refresh
+                return
+            start = self.rows if index == self.segment else 0
+            if rows > start:
+                records = np.memmap(filename, DTYPE, "r", shape=(rows,))[start:]
+                # Gap records are kept (NaN) to break the line in the graph
+                valid = np.isfinite(records["normed"]) | (records["seq"] == GAP_SEQ)
+                self._append(records["elapsed"][valid] / 3600, records["normed"][valid])
+            self.segment, self.rows = index, rows
+
+
+class MeasurementFileCache:
+    """Incrementally read the (time, normed) measurement files.
+
+    Every file remembers the byte offset, inode and mtime of the last read,
+    so a refresh only parses the lines appended since then. A file that was
+    truncated or replaced is read again from the start. At most max_files
+    files are kept, the least recently read ones are dropped first. If there
+    is a binary store next to the CSV file (x.run for x.csv), it is read
+    instead. Where a resumed run continues, normed is NaN.
+    """
+
+    def __init__(self, max_files=MAX_FILES):
+        self.max_files = max_files
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, filenames):
+        with self._lock:
+            paths = [os.path.abspath(p) for p in filenames]
+            data = []
+            for path in paths:
+                state = self._files.get(path)
+                store = store_path(path)
+                kind = _StoreState if os.path.isdir(store) else _FileState
+                if not isinstance(state, kind):
+                    state = self._files[path] = kind(
+                        store if kind is _StoreState else path
+                    )
+                self._files.move_to_end(path)
+                state.refresh()
+                data.append(state.arrays())
+            # Never drop a file of this call, even if there are more of them
+            while len(self._files) > max(self.max_files, len(set(paths))):
+                self._files.popitem(last=False)
+            return data
+
+    def generations(self, filenames):
+        """Counter per file that changes whenever the file is reread from the
+        start, 0 for a file that is not in the cache."""
+        with self._lock:
+            paths = [os.path.abspath(p) for p in filenames]
+            return [self._files[p].generation if p in self._files else 0 for p in paths]
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+def minmax_decimate(x, y, max_points):
+    """Reduce (x, y) to at most max_points points for plotting.
+
+    The data is split into equally sized buckets and for every bucket the
+    points with the smallest and the largest y value are kept (in their
+    original order), so narrow peaks survive the decimation. The first and
+    the last point are always kept, and so are NaN points (gaps in the
+    line), which do not count as smallest or largest.
+    """
+    n = len(x)
+    if n <= max_points or max_points < 8:
+        return x, y
+    gaps = np.flatnonzero(np.isnan(y))
+    low = high = y
+    if len(gaps):
+        low = np.where(np.isnan(y), np.inf, y)
+        high = np.where(np.isnan(y), -np.inf, y)
+    # 2 points per bucket, plus a shorter tail bucket and the two end points
+    buckets = (max_points - 4) // 2
+    size = n // buckets
+    m = size * buckets
+    offsets = np.arange(buckets) * size
+    parts = [
+        [0, n - 1],
+        gaps,
+        low[:m].reshape(buckets, size).argmin(axis=1) + offsets,
+        high[:m].reshape(buckets, size).argmax(axis=1) + offsets,
+    ]
+    if m < n:
+        parts.append([m + low[m:].argmin(), m + high[m:].argmax()])
+    idx = np.unique(np.concatenate(parts))
+    return x[idx], y[idx]
+
+
+def decimate_window(x, y, max_points, x_range=None):
+    """Decimate only the part of the data that is visible in x_range.
+
+    x has to be sorted. One point left and right of the window is included,
+    so lines run to the plot edges when zoomed in.
+    """
+    if x_range is not None and len(x):
+        lo, hi = x_range
+        start = max(int(np.searchsorted(x, lo, side="left")) - 1, 0)
+        stop = int(np.searchsorted(x, hi, side="right")) + 1
+        x, y = x[start:stop], y[start:stop]
+    return minmax_decimate(x, y, max_points)
+
+
+def x_range_from_relayout(relayout_data, current=None):
+    """Visible x range from a dcc.Graph relayoutData event.
+
+    Returns None when the axis was reset (autorange) and ``current`` when
+    the event does not touch the x axis (e.g. a pure y-axis zoom).
+    """
+    if not relayout_data:
+        return current
+    if relayout_data.get("xaxis.autorange") or relayout_data.get("autosize"):
+        return None
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        lo, hi = relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    elif "xaxis.range" in relayout_data:
+        lo, hi = relayout_data["xaxis.range"]
+    else:
+        return current
+    try:
+        lo, hi = float(lo), float(hi)
+    except (TypeError, ValueError):
+        return current
+    return [min(lo, hi), max(lo, hi)]
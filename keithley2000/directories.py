@@ -0,0 +1,57 @@
+"""Finding the directories offered for the output files, without blocking.
+
+On Windows, os.path.isdir on the letter of a missing or sleeping USB or
+network drive can take many seconds. Every check runs in a daemon thread of
+its own and is given up after DRIVE_TIMEOUT seconds, so a stalled drive
+only drops out of the list instead of holding up the app.
+"""
+
+import os
+import threading
+import time
+
+# Seconds a drive (or directory) may take to answer
+DRIVE_TIMEOUT = 2.0
+
+
+def _run(func, args, results, key):
+    try:
+        results[key] = func(*args)
+    except OSError:
+        results[key] = None
+
+
+def call_all(func, arguments, timeout=DRIVE_TIMEOUT):
+    """[func(*args) for args in arguments], in parallel; None where it failed
+    or did not return within timeout seconds."""
+    results = {}
+    threads = [
+        threading.Thread(target=_run, args=(func, args, results, i), daemon=True)
+        for i, args in enumerate(arguments)
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
+    return [results.get(i) for i in range(len(threads))]
+
+
+def subdirectories(path):
+    return [
+        os.path.join(path, d)
+        for d in sorted(os.listdir(path))
+        if os.path.isdir(os.path.join(path, d))
+    ]
+
+
+def existing_directories(candidates, parents=(), timeout=DRIVE_TIMEOUT):
+    """The candidates that exist, followed by the subdirectories of parents.
+
+    Duplicates are dropped, the order is kept.
+    """
+    exists = call_all(os.path.isdir, [(d,) for d in candidates], timeout)
+    found = [d for d, ok in zip(candidates, exists) if ok]
+    for children in call_all(subdirectories, [(p,) for p in parents], timeout):
+        found += children or []
+    return list(dict.fromkeys(found))
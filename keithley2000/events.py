@@ -0,0 +1,39 @@
+"""Change notifications, pushed to the browsers instead of polling.
+
+    events.publish("samples")            # measurement thread, every point
+    version, kinds = events.wait(since, timeout=15)
+
+The measurement threads publish "samples" after every measurement point and
+"state" when a run starts or ends; the app publishes "directories" and
+"catalog" when the directory list or the run catalog changed. wait() blocks
+until something was published after the version since. app.py streams the
+notifications to the browsers as server-sent events (/events), and
+keithley2000.service forwards them from the acquisition process to the web
+workers.
+"""
+
+import threading
+
+_condition = threading.Condition()
+_version = 0
+_published = {}  # Kind -> version of its last publication
+
+
+def publish(*kinds):
+    global _version
+    with _condition:
+        _version += 1
+        for kind in kinds:
+            _published[kind] = _version
+        _condition.notify_all()
+
+
+def version():
+    return _version
+
+
+def wait(since, timeout=None):
+    """(version, kinds published after since), sorted; no kinds on timeout."""
+    with _condition:
+        _condition.wait_for(lambda: _version > since, timeout)
+        return _version, sorted(k for k, v in _published.items() if v > since)
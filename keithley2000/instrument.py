@@ -0,0 +1,209 @@
+import time
+
+# Number of channels of the scanner card
+SCANNER_CHANNELS = 10
+
+
+# Measurement setup (DC volts, NPLC 10), sent after *RST
+SETUP_COMMANDS = [
+    "SRE 1",  # Instruments beeps
+    "SYST:RWL",
+    "SENS:FUNC 'Volt:DC'",
+    "SYST:AZER:STAT 0",
+    "SENS:VOLT:DC:AVER:STAT 0",
+    "SENS:VOLT:DC:NPLC 10",
+    "SENS:VOLT:DC:RANG:AUTO 1",
+    "SENS:VOLT:DC:DIG 7",
+    "SENS:Volt:DC:REF:STAT 0",
+]
+
+# Serial link (see configure_link). baud_rate must match the setting on the
+# instrument's front panel (up to 19200 on the Model 2000); with probe the
+# other BAUD_RATES are tried if the instrument does not answer.
+# data_format of the readings: "ascii", "sreal" (4 byte float) or "dreal"
+# (8 byte float).
+LINK_DEFAULTS = {
+    "baud_rate": 9600,
+    "timeout": 5000,
+    "probe": True,
+    "data_format": "ascii",
+}
+BAUD_RATES = (19200, 9600, 4800, 2400, 1200, 600, 300)
+# Timeout (ms) of the *IDN? query per baud rate when probing
+PROBE_TIMEOUT = 500
+
+# struct type of the binary data formats
+BINARY_DATATYPES = {"sreal": "f", "dreal": "d"}
+
+_resource_manager = None
+_resources = None
+
+
+def resource_manager():
+    """The pyvisa ResourceManager, created once."""
+    global _resource_manager
+    if _resource_manager is None:
+        import pyvisa
+
+        _resource_manager = pyvisa.ResourceManager()
+    return _resource_manager
+
+
+def list_resources(refresh=False):
+    """Available VISA resources.
+
+    Enumerating can take seconds with NI-VISA on Windows, so the list is
+    kept until refresh is requested (or nothing was found last time).
+    """
+    global _resources
+    if refresh or not _resources:
+        _resources = resource_manager().list_resources()
+        print("Available VISA resources:", _resources)
+    return _resources
+
+
+def open_instrument(resource=None, simulator_options=None):
+    """Open the VISA resource, or the first one found if resource is None.
+
+    "SIM" opens the simulated instrument (see keithley2000.simulator).
+    Returns None if no resource was found.
+    """
+    if resource == "SIM":
+        from keithley2000.simulator import SimulatedResourceManager
+
+        rm = SimulatedResourceManager(**(simulator_options or {}))
+        resource = rm.list_resources()[0]
+    else:
+        rm = resource_manager()
+        if resource is None:
+            resources = list_resources()
+            if not resources:
+                return None
+            resource = resources[0]
+    print(f"Connecting to {resource} ...")
+    try:
+        return rm.open_resource(resource)
+    except Exception:
+        # The adapter may have been unplugged or moved to another COM port
+        list_resources(refresh=True)
+        raise
+
+
+def configure_link(instrument, baud_rate=9600, timeout=5000):
+    """Serial link settings."""
+    import pyvisa
+
+    instrument.baud_rate = baud_rate
+    instrument.data_bits = 8
+    instrument.stop_bits = pyvisa.constants.StopBits.one
+    instrument.parity = pyvisa.constants.Parity.none
+    instrument.flow_control = pyvisa.constants.ControlFlow.none
+    instrument.timeout = timeout
+    instrument.write_termination = "\r"
+    instrument.read_termination = "\r"
+
+
+def probe_baud_rate(instrument, first=None, rates=BAUD_RATES):
+    """Baud rate at which the instrument answers *IDN?, None if it never does.
+
+    first is tried before the others (the configured rate). The link is left
+    at the rate that worked, the timeout is restored.
+    """
+    timeout = instrument.timeout
+    instrument.timeout = PROBE_TIMEOUT
+    try:
+        for rate in [first] + [r for r in rates if r != first]:
+            if rate is None:
+                continue
+            instrument.baud_rate = rate
+            try:
+                if "KEITHLEY" in instrument.query("*IDN?").upper():
+                    return rate
+            except Exception:
+                pass  # Timeout or garbage at the wrong rate
+        return None
+    finally:
+        instrument.timeout = timeout
+
+
+def data_format_commands(data_format):
+    """Commands selecting the format of the readings (see LINK_DEFAULTS)."""
+    if data_format == "ascii":
+        return ["FORM:DATA ASC"]
+    if data_format not in BINARY_DATATYPES:
+        raise ValueError(f"Unknown data format {data_format!r}")
+    # Little endian, as the PC
+    return [f"FORM:DATA {data_format.upper()}", "FORM:BORD SWAP"]
+
+
+def channel_list(channels):
+    """SCPI channel list, e.g. (@1,2,3)."""
+    return "(@" + ",".join(str(c) for c in channels) + ")"
+
+
+def configure_scan(instrument, channels):
+    """Program the scanner card once to measure all channels per trigger.
+
+    After this, every READ? closes the channels one after the other, takes
+    one reading each and returns all of them in a single comma-separated
+    response.
+    """
+    if not channels:
+        return
+    if max(channels) > SCANNER_CHANNELS or min(channels) < 1:
+        raise ValueError(f"Scanner channels must be 1 to {SCANNER_CHANNELS}")
+    instrument.write("ROUT:OPEN:ALL")
+    instrument.write(f"ROUT:SCAN:INT {channel_list(channels)}")
+    instrument.write("ROUT:SCAN:LSEL INT")
+    instrument.write("TRIG:SOUR IMM")
+    instrument.write("TRIG:COUN 1")
+    instrument.write(f"SAMP:COUN {len(channels)}")
+    instrument.write("FORM:ELEM READ")  # Readings only, no units or channel
+    # NPLC 10 plus autoranging takes a few hundred ms per channel
+    instrument.timeout = 5000 + 1000 * len(channels)
+
+
+def parse_readings(response, count):
+    """Floats of a comma-separated READ? response, None for invalid ones."""
+    values = []
+    for part in response.strip().split(","):
+        try:
+            values.append(float(part))
+        except ValueError:
+            values.append(None)
+    if len(values) != count:
+        raise ValueError(f"Expected {count} readings, got {len(values)}: {response!r}")
+    return values
+
+
+def read_readings(instrument, count, data_format="ascii"):
+    """READ? and return its count readings (see data_format_commands)."""
+    if data_format == "ascii":
+        return parse_readings(instrument.query("READ?"), count)
+    # #0 block of 4 or 8 byte floats; with data_points pyvisa keeps reading
+    # if a data byte happens to look like the termination character
+    values = instrument.query_binary_values(
+        "READ?",
+        datatype=BINARY_DATATYPES[data_format],
+        is_big_endian=False,
+        data_points=count,
+    )
+    if len(values) != count:
+        raise ValueError(f"Expected {count} readings, got {len(values)}")
+    return list(values)
+
+
+def read_scan(instrument, channels, data_format="ascii"):
+    """One reading per channel from a single scan (see configure_scan)."""
+    return read_readings(instrument, len(channels), data_format)
+
+
+def read_channel(instrument, channel, data_format="ascii"):
+    """Close a single channel and take one reading, None if it is invalid.
+
+    ROUT:CLOS opens all other channels, the function and the other settings
+    are sent once per run (SETUP_COMMANDS), not for every reading.
+    """
+    instrument.write(f"ROUT:CLOS (@{channel})")
+    time.sleep(0.05)
+    return read_readings(instrument, 1, data_format)[0]
@@ -0,0 +1,160 @@
+"""Run journal: what is needed to continue a run after the app died.
+
+One JSON file per instrument, replaced atomically (written to a temporary
+file, fsynced and renamed), so it is either the old or the new version even
+if the power fails while it is written. It says "running" from the start
+of a run until the run is stopped. During the run, the process measuring
+holds an OS lock on a lock file next to the journal, which the OS releases
+when the process dies: a journal that says "running" while nobody holds
+the lock belongs to an interrupted run, one that is locked belongs to a run
+going on in another process (e.g. python -m keithley2000 acquire).
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+VERSION = 1
+
+# Seconds between updates of the journal during a run
+JOURNAL_SECONDS = 30
+
+
+def write_atomic(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+
+def _try_lock(f):
+    """Lock the open file f without waiting, OSError if another process has it."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+class RunJournal:
+    """The journal file of one instrument, in directory."""
+
+    def __init__(self, directory, instrument):
+        self.directory = directory
+        safe = re.sub(r"[^\w.-]+", "_", instrument)
+        self.path = os.path.join(directory, f"{safe}.json")
+        self.lock_path = os.path.join(directory, f"{safe}.lock")
+        self._lock_file = None  # Open and locked while this process runs
+        self._last_update = None
+        # One writer at a time: they share the temporary file
+        self._lock = threading.Lock()
+        self._updates = False  # update() writes, between write() and the final one
+
+    def read(self):
+        """Contents of the journal, None if there is none or it is unreadable."""
+        try:
+            with open(self.path) as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return journal if journal.get("version") == VERSION else None
+
+    def _write(self, run):
+        os.makedirs(self.directory, exist_ok=True)
+        write_atomic(self.path, {"version": VERSION, "updated": time.time(), **run})
+        self._last_update = time.monotonic()
+
+    def write(self, final=False, **run):
+        """Write the journal of a run (see Acquisition.run for the fields).
+
+        final: the run has ended, update() does nothing until the next run.
+        """
+        with self._lock:
+            self._updates = not final
+            self._write(run)
+
+    def update(self, **run):
+        """write() during a run; dropped once the run has ended, as the
+        outputs may still be written then."""
+        with self._lock:
+            if self._updates:
+                self._write(run)
+
+    def due(self):
+        """True if the last update is JOURNAL_SECONDS old."""
+        return (
+            self._last_update is None
+            or time.monotonic() - self._last_update >= JOURNAL_SECONDS
+        )
+
+    def lock(self):
+        """Take the lock for a run of this process, until unlock().
+
+        Raises RuntimeError if another process is running the instrument.
+        """
+        if self._lock_file is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        f = open(self.lock_path, "a+")
+        try:
+            _try_lock(f)
+        except OSError:
+            f.close()
+            raise RuntimeError(
+                f"The run in {self.path} is going on in another process"
+            ) from None
+        self._lock_file = f
+
+    def unlock(self):
+        f, self._lock_file = self._lock_file, None
+        if f is not None:
+            f.close()  # Releases the lock
+
+    def locked_elsewhere(self):
+        """True if another process holds the lock (is running a run)."""
+        if self._lock_file is not None:
+            return False
+        try:
+            f = open(self.lock_path, "a+")
+        except OSError:
+            return False
+        with f:
+            try:
+                _try_lock(f)
+            except OSError:
+                return True
+        return False
+
+    def interrupted(self):
+        """The journal if its run did not stop normally, else None.
+
+        A run that is still going on in another process is not interrupted.
+        """
+        journal = self.read()
+        if not journal or journal.get("state") != "running":
+            return None
+        return None if self.locked_elsewhere() else journal
+
+    def mark(self, state):
+        """Set the state ("stopped" or "discarded") of the journaled run."""
+        with self._lock:
+            journal = self.read()
+            if journal is not None:
+                journal.pop("version", None)
+                journal.pop("updated", None)
+                self._write(dict(journal, state=state))
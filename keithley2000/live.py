@@ -0,0 +1,107 @@
+import itertools
+import os
+import threading
+
+import numpy as np
+
+# Initial number of samples allocated per channel, grows by doubling
+INITIAL_CAPACITY = 4096
+
+
+class ChannelBuffer:
+    """Append-only columnar store for the samples of one channel.
+
+    There is a single writer (the measurement thread). Readers never lock:
+    the writer fills the next row first and only then publishes the new
+    count, and when it needs more room it copies into bigger arrays before
+    swapping them in. A reader that takes the count and then the arrays
+    therefore always sees complete rows.
+    """
+
+    def __init__(self, times=(), normed=()):
+        capacity = max(INITIAL_CAPACITY, 2 * len(times))
+        self._seq = np.zeros(capacity, dtype=np.int64)
+        self._times = np.empty(capacity)
+        self._normed = np.empty(capacity)
+        self._times[: len(times)] = times
+        self._normed[: len(normed)] = normed
+        self._seq[: len(times)] = -1  # Read from an existing file
+        self._count = len(times)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, seq, elapsed_hours, normed):
+        n = self._count
+        if n == len(self._times):
+            self._seq = np.resize(self._seq, 2 * n)
+            self._times = np.resize(self._times, 2 * n)
+            self._normed = np.resize(self._normed, 2 * n)
+        self._seq[n] = seq
+        self._times[n] = elapsed_hours
+        self._normed[n] = normed
+        self._count = n + 1  # Publish
+
+    def extend(self, times, normed, seq=-1):
+        """Append a block of samples, published at once."""
+        n = self._count
+        k = len(times)
+        if n + k > len(self._times):
+            capacity = max(2 * n, n + k)
+            self._seq = np.resize(self._seq, capacity)
+            self._times = np.resize(self._times, capacity)
+            self._normed = np.resize(self._normed, capacity)
+        self._seq[n : n + k] = seq
+        self._times[n : n + k] = times
+        self._normed[n : n + k] = normed
+        self._count = n + k  # Publish
+
+    def arrays(self):
+        n = self._count
+        return self._times[:n], self._normed[:n]
+
+    def last_seq(self):
+        n = self._count
+        return int(self._seq[n - 1]) if n else -1
+
+
+class LiveStore:
+    """Samples of the running (or last) measurement, per output file.
+
+    The measurement thread publishes every sample with a monotonic sequence
+    number, the Dash callbacks read the arrays without going through the
+    CSV files.
+    """
+
+    def __init__(self):
+        self._seq = itertools.count()
+        self._lock = threading.Lock()  # Only taken when a run starts
+        self._buffers = {}
+        self.run = 0
+        self.last_seq = -1
+
+    def start_run(self, filenames, existing=None, first_seq=None):
+        """Create fresh buffers, optionally seeded with data already in the files.
+
+        first_seq: continue the sequence numbers of a resumed run.
+        """
+        existing = existing or [((), ())] * len(filenames)
+        with self._lock:
+            if first_seq is not None:
+                self._seq = itertools.count(first_seq)
+            self._buffers = {
+                os.path.abspath(name): ChannelBuffer(times, normed)
+                for name, (times, normed) in zip(filenames, existing)
+            }
+            self._channels = [os.path.abspath(name) for name in filenames]
+            self.run += 1
+
+    def publish(self, channel_index, elapsed_hours, normed):
+        seq = next(self._seq)
+        self._buffers[self._channels[channel_index]].append(seq, elapsed_hours, normed)
+        self.last_seq = seq
+        return seq
+
+    def get(self, filename):
+        """Buffer for this file, or None if it is not part of the live run."""
+        return self._buffers.get(os.path.abspath(filename))
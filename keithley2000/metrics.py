@@ -0,0 +1,265 @@
+"""Timers, histograms and counters of the hot paths.
+
+    with metrics.timer("scpi_seconds", call="query", command="READ?"):
+        response = instrument.query("READ?")
+
+While metrics are disabled, timer() returns a shared do-nothing context
+manager and count() returns at once, so instrumented code costs one
+function call. export() returns the raw values (they can be sent to
+another process, see keithley2000.service), render() the Prometheus text
+format and summary() one row per timer for the dashboard.
+"""
+
+import bisect
+import functools
+import math
+import threading
+import time
+
+# Upper bounds (s) of the histogram buckets: serial round trips are
+# milliseconds, a scan of 10 channels at NPLC 10 a few seconds
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    math.inf,
+)
+
+PREFIX = "keithley_"
+
+HELP = {
+    "scpi_seconds": "Duration of SCPI calls to the instrument",
+    "sweep_seconds": "Duration of one measurement point (all channels)",
+    "sweep_jitter_seconds": "Delay between the deadline and the start of a sweep",
+    "sweep_overruns_total": "Sweeps that took longer than the measurement spacing",
+    "sweep_skipped_total": "Measurement points skipped after an overrun",
+    "sweep_interval_seconds": "Spacing chosen by the adaptive scheduler",
+    "file_flush_seconds": "Duration of writing the buffered rows to the files",
+    "file_fsync_seconds": "Duration of forcing the files onto the disk",
+    "pipeline_backpressure_seconds": "Time a pipeline stage waited for a full queue",
+    "pipeline_dropped_total": "Sweeps dropped because a pipeline stage fell behind",
+    "overflow_total": "Readings flagged as overflow (9.9E37)",
+    "callback_seconds": "Duration of Dash callbacks",
+    "reconnects_total": "Reconnections to the instrument",
+}
+
+enabled = False
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(BUCKETS, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def histogram(name, **labels):
+    key = _key(name, labels)
+    h = _histograms.get(key)
+    if h is None:
+        with _lock:
+            h = _histograms.setdefault(key, Histogram())
+    return h
+
+
+def observe(name, value, **labels):
+    if enabled:
+        histogram(name, **labels).observe(value)
+
+
+def count(name, n=1, **labels):
+    if enabled:
+        key = _key(name, labels)
+        with _lock:
+            _counters[key] = _counters.get(key, 0) + n
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """Context manager recording its duration in the histogram name{labels}."""
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(histogram(name, **labels))
+
+
+def timed(name, **labels):
+    """Decorator recording the duration of every call."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Timer(histogram(name, **labels)):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def export():
+    """(histograms, counters) as plain lists of tuples."""
+    with _lock:
+        histograms = list(_histograms.items())
+        counters = list(_counters.items())
+    return (
+        [
+            (name, labels, list(h.counts), h.sum, h.count, h.max)
+            for (name, labels), h in histograms
+        ],
+        [(name, labels, value) for (name, labels), value in counters],
+    )
+
+
+def merge(*exports):
+    histograms, counters = [], []
+    for h, c in exports:
+        histograms += h
+        counters += c
+    return histograms, counters
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in items
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render(exported=None):
+    """Prometheus text exposition format (version 0.0.4)."""
+    histograms, counters = exported if exported is not None else export()
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    for name, labels, counts, total, n, _ in sorted(histograms):
+        describe(name, "histogram")
+        cumulative = 0
+        for bound, k in zip(BUCKETS, counts):
+            cumulative += k
+            le = "+Inf" if bound == math.inf else repr(bound)
+            lines.append(
+                f"{PREFIX}{name}_bucket{_labels(labels, [('le', le)])} {cumulative}"
+            )
+        lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total!r}")
+        lines.append(f"{PREFIX}{name}_count{_labels(labels)} {n}")
+    for name, labels, value in sorted(counters):
+        describe(name, "counter")
+        lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def quantile(counts, q, maximum):
+    """Estimate of a quantile from the bucket counts (linear within a bucket)."""
+    n = sum(counts)
+    if not n:
+        return 0.0
+    rank = q * n
+    cumulative = 0
+    for i, k in enumerate(counts):
+        if k and cumulative + k >= rank:
+            lower = BUCKETS[i - 1] if i else 0.0
+            upper = min(BUCKETS[i], maximum)
+            return lower + (upper - lower) * (rank - cumulative) / k
+        cumulative += k
+    return maximum
+
+
+def summary(exported=None):
+    """Rows (name, labels, count, mean, p50, p95, max) of all timers, seconds."""
+    histograms, counters = exported if exported is not None else export()
+    rows = []
+    for name, labels, counts, total, n, maximum in sorted(histograms):
+        if n:
+            rows.append(
+                (
+                    name,
+                    ", ".join(f"{k}={v}" for k, v in labels),
+                    n,
+                    total / n,
+                    quantile(counts, 0.5, maximum),
+                    quantile(counts, 0.95, maximum),
+                    maximum,
+                )
+            )
+    return rows, [
+        (name, ", ".join(f"{k}={v}" for k, v in labels), value)
+        for name, labels, value in sorted(counters)
+    ]
@@ -0,0 +1,242 @@
+"""The stages of a run behind the instrument: processing and outputs.
+
+The measurement thread only talks to the instrument. It hands every sweep
+to the processing stage through a bounded queue and goes back to the
+instrument at once, so a slow disk (USB flash drive, virus scanner) never
+delays the next reading. The processing stage calibrates and normalizes the
+readings, flags overflows, publishes them to the live store and passes them
+on to the outputs (sinks), each writing in a thread of its own from a
+bounded queue of its own:
+
+    measurement thread -> processing -> CSV files
+                                     -> binary store
+                                     -> journal
+
+A stage waits for room in a full queue of the next one (backpressure) for
+at most PUT_TIMEOUT seconds, then the sweep is dropped for that output and
+counted in pipeline_dropped_total. The measurement thread never waits: if
+the processing queue is full, the sweep is dropped there.
+"""
+
+import math
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from keithley2000 import events, metrics
+
+# The Model 2000 returns +9.9E37 (or -9.9E37) when the input exceeds the range
+OVERFLOW = 9.9e37
+
+# Sweeps the processing stage and every output may fall behind
+PROCESSING_QUEUE_SIZE = 100
+SINK_QUEUE_SIZE = 1000
+
+# Seconds a stage waits for room in the queue of the next one
+PUT_TIMEOUT = 5.0
+
+# index: position of the channel in the filenames of the run. calibrated and
+# normed are "" if the reading is missing, an overflow or the weight is 0;
+# seq is -1 then (not in the live store)
+Reading = namedtuple(
+    "Reading", "index channel seq elapsed wall value calibrated normed"
+)
+
+
+def _put(q, item, instrument, stage):
+    """Put item into q, waiting up to PUT_TIMEOUT s; False if it was dropped."""
+    try:
+        q.put_nowait(item)
+        return True
+    except queue.Full:
+        pass
+    with metrics.timer(
+        "pipeline_backpressure_seconds", instrument=instrument, stage=stage
+    ):
+        try:
+            q.put(item, timeout=PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            metrics.count("pipeline_dropped_total", instrument=instrument, stage=stage)
+            return False
+
+
+class Sink:
+    """One output of a run, writing in a thread of its own.
+
+    write(readings) is called with the Readings of every sweep, finish()
+    once at the end, also after errors.
+    """
+
+    def __init__(self, name, write, finish, instrument="", size=SINK_QUEUE_SIZE):
+        self.name = name
+        self.write = write
+        self.finish = finish
+        self.instrument = instrument
+        self.queue = queue.Queue(size)
+        self.dropped = 0
+        self.thread = threading.Thread(
+            target=self._run, name=f"{name}-{instrument}", daemon=True
+        )
+        self.thread.start()
+
+    def put(self, readings):
+        if not _put(self.queue, readings, self.instrument, self.name):
+            self.dropped += 1
+
+    def _run(self):
+        try:
+            while True:
+                readings = self.queue.get()
+                if readings is None:
+                    break
+                try:
+                    self.write(readings)
+                except Exception as e:
+                    print(f"{self.instrument}: error writing the {self.name}: {e}")
+        finally:
+            self.finish()
+
+
+class Pipeline:
+    """Processing stage of a run and its sinks (see the module docstring).
+
+    channels: the scanner channel of every file of the run, transform: their
+    ChannelTransform (see keithley2000.channels). observe(readings), if
+    given, gets the (channel, elapsed_hours, normed) of every sweep before
+    the sinks, see AdaptiveScheduler.observe.
+    """
+
+    def __init__(self, name, channels, transform, live, sinks=(), observe=None):
+        self.name = name
+        self.index = {channel: i for i, channel in enumerate(channels)}
+        self.transform = transform
+        self.live = live
+        self.sinks = list(sinks)
+        self.observe = observe
+        self.queue = queue.Queue(PROCESSING_QUEUE_SIZE)
+        self.dropped = 0
+        self.overflows = 0
+        self._submitted = 0
+        self._processed = 0
+        self._condition = threading.Condition()
+        self.thread = threading.Thread(
+            target=self._run, name=f"processing-{name}", daemon=True
+        )
+        self.thread.start()
+
+    def put(self, readings):
+        """Hand over the readings (channel, value, elapsed_seconds, wall) of a
+        sweep; returns at once."""
+        with self._condition:
+            self._submitted += 1
+        try:
+            self.queue.put_nowait(readings)
+        except queue.Full:
+            self.dropped += 1
+            metrics.count(
+                "pipeline_dropped_total", instrument=self.name, stage="processing"
+            )
+            self._done()
+
+    def wait_processed(self, timeout):
+        """Wait until every sweep handed over went through observe()."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._processed >= self._submitted, timeout
+            )
+
+    def _done(self):
+        with self._condition:
+            self._processed += 1
+            self._condition.notify_all()
+
+    def process(self, readings):
+        if not readings:
+            return []
+        indices = [self.index[channel] for channel, *_ in readings]
+        values = np.array(
+            [np.nan if value is None else value for _, value, *_ in readings]
+        )
+        overflow = np.abs(values) >= OVERFLOW
+        values[overflow] = np.nan
+        # Calibration (mV) and normalization (mW/g) of the whole sweep at once
+        calibrated, normed = (a.tolist() for a in self.transform.apply(indices, values))
+        processed = []
+        for i, (channel, value, elapsed, wall) in enumerate(readings):
+            if overflow[i]:
+                self.overflows += 1
+                metrics.count("overflow_total", instrument=self.name, channel=channel)
+            seq = -1
+            if not math.isnan(normed[i]):
+                seq = self.live.publish(indices[i], elapsed / 3600.0, normed[i])
+            processed.append(
+                Reading(
+                    indices[i],
+                    channel,
+                    seq,
+                    elapsed,
+                    wall,
+                    value,
+                    "" if math.isnan(calibrated[i]) else calibrated[i],
+                    normed[i] if seq >= 0 else "",
+                )
+            )
+        return processed
+
+    def _run(self):
+        try:
+            while True:
+                readings = self.queue.get()
+                if readings is None:
+                    break
+                try:
+                    processed = self.process(readings)
+                    if self.observe is not None:
+                        self.observe(
+                            [
+                                (r.channel, r.elapsed / 3600.0, r.normed)
+                                for r in processed
+                            ]
+                        )
+                except Exception as e:
+                    print(f"{self.name}: error processing readings: {e}")
+                    processed = []
+                finally:
+                    self._done()
+                events.publish("samples")
+                for sink in self.sinks:
+                    sink.put(processed)
+        finally:
+            for sink in self.sinks:
+                try:
+                    sink.queue.put(None, timeout=PUT_TIMEOUT)
+                except queue.Full:
+                    print(f"{self.name}: the {sink.name} does not respond")
+
+    def close(self, timeout=30):
+        """Process and write everything handed over, then close the outputs.
+
+        Returns False if that took longer than timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return False
+        for thread in [self.thread] + [s.thread for s in self.sinks]:
+            thread.join(max(deadline - time.monotonic(), 0))
+        return not any(
+            t.is_alive() for t in [self.thread] + [s.thread for s in self.sinks]
+        )
+
+    @property
+    def total_dropped(self):
+        """Sweeps dropped by the processing stage and any output."""
+        return self.dropped + sum(s.dropped for s in self.sinks)
+
+    def summary(self):
+        return f"{self.total_dropped} sweeps dropped, {self.overflows} overflows"
@@ -0,0 +1,171 @@
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from keithley2000 import metrics
+
+
+class SweepScheduler:
+    """Fire sweeps on absolute deadlines start + k * interval.
+
+    Unlike sleeping for the interval after every sweep, the period does not
+    grow with the time the sweep itself takes. A sweep that overruns its
+    slot is reported; slots that were missed completely are skipped instead
+    of being fired back to back. wait() returns as soon as stop_flag is set.
+    """
+
+    def __init__(self, interval, stop_flag, clock=time.monotonic, name=""):
+        self.interval = float(interval)
+        self.stop_flag = stop_flag
+        self.clock = clock
+        self.name = name  # Instrument, for the metrics
+        self.start = self.deadline = clock()
+        self.slot = 0
+        self.sweeps = 1  # The first sweep runs at start
+        self.overruns = 0
+        self.skipped = 0
+        # Jitter (s): delay between deadline and the actual start of a sweep
+        self.jitter_max = 0.0
+        self._jitter_mean = 0.0
+        self._jitter_m2 = 0.0
+
+    def _advance(self, slots=1):
+        self.slot += slots
+        self.deadline = self.start + self.slot * self.interval
+
+    def observe(self, readings):
+        """Readings (channel, elapsed_hours, normed) of the last sweep, unused here."""
+
+    def wait(self):
+        """Wait for the next slot. Returns False if the measurement was stopped."""
+        self._advance()
+        late = self.clock() - self.deadline
+        if late > 0:
+            self.overruns += 1
+            metrics.count("sweep_overruns_total", instrument=self.name)
+            missed = int(late // self.interval)
+            if missed:
+                self.skipped += missed
+                metrics.count("sweep_skipped_total", missed, instrument=self.name)
+                self._advance(missed)
+            print(
+                f"Sweep overran its slot by {late:.3f} s"
+                + (f", skipping {missed} slot(s)" if missed else "")
+            )
+        if self.stop_flag.wait(max(self.deadline - self.clock(), 0)):
+            return False
+        self._record(self.clock() - self.deadline)
+        return True
+
+    def _record(self, jitter):
+        # Welford's running mean and variance
+        self.sweeps += 1
+        n = self.sweeps - 1
+        delta = jitter - self._jitter_mean
+        self._jitter_mean += delta / n
+        self._jitter_m2 += delta * (jitter - self._jitter_mean)
+        self.jitter_max = max(self.jitter_max, jitter)
+        metrics.observe("sweep_jitter_seconds", jitter, instrument=self.name)
+
+    @property
+    def jitter_mean(self):
+        return self._jitter_mean
+
+    @property
+    def jitter_std(self):
+        n = self.sweeps - 1
+        return math.sqrt(self._jitter_m2 / (n - 1)) if n > 1 else 0.0
+
+    def summary(self):
+        return (
+            f"{self.sweeps} sweeps, {self.overruns} overruns, {self.skipped} skipped"
+            f" slots, jitter mean {self.jitter_mean * 1000:.1f} ms,"
+            f" std {self.jitter_std * 1000:.1f} ms, max {self.jitter_max * 1000:.1f} ms"
+        )
+
+
+class AdaptiveScheduler(SweepScheduler):
+    """Sweeps closer together while the heat flow changes quickly.
+
+    After every sweep (observe) a straight line is fitted to the last window
+    points of every channel. The spacing is halved, down to min_interval or
+    the time a sweep takes, if dQ/dt times the spacing exceeds
+    step_threshold (the heat flow would change by more than that many mW/g
+    from one point to the next) or the points scatter around the line by
+    more than residual_threshold mW/g (e.g. at the turn of a peak). After
+    quiet_sweeps quiet sweeps in a row it is doubled again, up to the
+    interval the run was started with. The run starts at min_interval. The
+    next deadline is always the last one plus the current spacing.
+    """
+
+    def __init__(
+        self,
+        interval,
+        stop_flag,
+        clock=time.monotonic,
+        name="",
+        min_interval=2.0,
+        step_threshold=0.02,
+        residual_threshold=0.01,
+        window=5,
+        quiet_sweeps=5,
+    ):
+        super().__init__(interval, stop_flag, clock, name)
+        self.max_interval = self.interval
+        self.min_interval = min(float(min_interval), self.interval)
+        # A run starts with the fastest changes (wetting, initial peak)
+        self.interval = self.min_interval
+        self.step_threshold = step_threshold
+        self.residual_threshold = residual_threshold
+        self.window = window
+        self.quiet_sweeps = quiet_sweeps
+        self.history = {}  # Channel -> last window (hours, normed)
+        self.quiet = 0
+        self.changes = 0
+        self.shortest = self.interval
+
+    def _advance(self, slots=1):
+        self.slot += slots
+        self.deadline += slots * self.interval
+
+    def _fast(self, points):
+        hours, normed = np.array(points).T
+        slope, intercept = np.polyfit(hours, normed, 1)
+        residual = np.sqrt(np.mean((normed - slope * hours - intercept) ** 2))
+        step = abs(slope) * self.interval / 3600
+        return step > self.step_threshold or residual > self.residual_threshold
+
+    def observe(self, readings):
+        # The sweep started at the deadline, the next one cannot start earlier
+        # than it takes
+        floor = max(self.min_interval, 1.1 * (self.clock() - self.deadline))
+        fast = False
+        for channel, hours, normed in readings:
+            if normed == "":
+                continue
+            points = self.history.setdefault(channel, deque(maxlen=self.window))
+            points.append((hours, normed))
+            if len(points) >= 3 and self._fast(points):
+                fast = True
+        interval = self.interval
+        if fast:
+            self.quiet = 0
+            interval = max(self.interval / 2, min(floor, self.max_interval))
+        else:
+            self.quiet += 1
+            if self.quiet >= self.quiet_sweeps:
+                self.quiet = 0
+                interval = min(2 * self.interval, self.max_interval)
+        if interval != self.interval:
+            self.changes += 1
+            self.interval = interval
+            self.shortest = min(self.shortest, interval)
+            metrics.observe("sweep_interval_seconds", interval, instrument=self.name)
+
+    def summary(self):
+        return (
+            super().summary()
+            + f", {self.changes} spacing changes, shortest {self.shortest:.1f} s"
+        )
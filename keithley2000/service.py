@@ -0,0 +1,380 @@
+"""The acquisition engine in its own process, shared by several web workers.
+
+AcquisitionServer exposes an AcquisitionEngine on a local socket
+(multiprocessing.connection, authenticated with a shared key, see
+load_authkey: the messages are pickles, so whoever has the key can run code
+in the acquisition process).
+AcquisitionClient offers the same interface as the engine to the Dash
+callbacks of a worker: the state of all instruments is fetched in one round
+trip and reused for STATUS_MAX_AGE seconds, and the samples of a live run
+are mirrored into local ChannelBuffers, transferring only the samples that
+are new since the last request. The change notifications of the acquisition
+process (keithley2000.events) are forwarded to every client over a
+connection of its own.
+"""
+
+import os
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from keithley2000 import events, metrics
+from keithley2000.live import ChannelBuffer
+
+DEFAULT_ADDRESS = ("127.0.0.1", 8051)
+# Key of the control socket of this installation, in the journal directory
+AUTHKEY_FILE = "authkey"
+
+# Seconds the instrument state of a client is reused before it is fetched again
+STATUS_MAX_AGE = 0.5
+
+# Seconds a client waits for a notification before it asks again
+EVENTS_TIMEOUT = 30
+
+
+def parse_address(address):
+    """ "host:port" -> (host, port); a (host, port) tuple is returned as is."""
+    if isinstance(address, str):
+        host, _, port = address.rpartition(":")
+        return host or DEFAULT_ADDRESS[0], int(port)
+    return tuple(address)
+
+
+def load_authkey(directory):
+    """KEITHLEY_AUTHKEY, else the key in directory/AUTHKEY_FILE.
+
+    The file is created with a random key on first use, readable by its
+    owner only. A key file that others can read is refused.
+    """
+    if os.environ.get("KEITHLEY_AUTHKEY"):
+        return os.environ["KEITHLEY_AUTHKEY"].encode()
+    path = os.path.join(directory, AUTHKEY_FILE)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp, path)  # Fails if another process was first
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    if os.name == "posix" and os.stat(path).st_mode & 0o077:
+        raise PermissionError(f"{path} must only be readable by its owner (chmod 600)")
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+class AcquisitionServer:
+    """Answers the requests of AcquisitionClients, one thread per connection."""
+
+    def __init__(self, engine, address, authkey):
+        self.engine = engine
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self._closed = False
+
+    def serve_forever(self):
+        """Answer requests until close() or a shutdown request, then close the engine."""
+        self._closed = False
+        listener = Listener(self.address, authkey=self.authkey)
+        print(f"Acquisition service listening on {self.address[0]}:{self.address[1]}")
+        try:
+            while not self._closed:
+                try:
+                    connection = listener.accept()
+                except Exception as e:  # Wrong key, port scanner, ...
+                    print(f"Rejected connection: {e}")
+                    continue
+                if self._closed:
+                    connection.close()
+                    break
+                threading.Thread(
+                    target=self._serve, args=(connection,), daemon=True
+                ).start()
+        finally:
+            listener.close()
+            self.engine.close()
+
+    def close(self):
+        self._closed = True
+        # Wake up accept()
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+
+    def _serve(self, connection):
+        with connection:
+            while True:
+                try:
+                    method, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    result = ("ok", getattr(self, f"do_{method}")(*args))
+                except Exception as e:
+                    result = ("error", (type(e).__name__, str(e)))
+                try:
+                    connection.send(result)
+                except OSError:
+                    return
+
+    def do_state(self):
+        """Everything the dashboard shows about the instruments."""
+        return [
+            {
+                "name": a.name,
+                "resource": a.resource,
+                "running": a.running,
+                "error": a.error,
+                "status": a.status(),
+                "filenames": a.filenames,
+                "weights": a.weights,
+                "interval": a.interval,
+                "run": a.live.run,
+                "interrupted": a.interrupted(),
+                "live": [
+                    os.path.abspath(f) for f in a.filenames if a.live.get(f) is not None
+                ],
+            }
+            for a in self.engine
+        ]
+
+    def do_start(self, name, filenames, interval_seconds, weights, existing, adaptive):
+        self.engine.start(
+            name, filenames, interval_seconds, weights, existing, adaptive
+        )
+
+    def do_stop(self, name):
+        self.engine.stop(name)
+
+    def do_resume(self, name, existing):
+        self.engine.resume(name, existing)
+
+    def do_discard(self, name):
+        self.engine.discard(name)
+
+    def do_metrics(self):
+        """Timers and counters of the acquisition process (metrics.export())."""
+        return metrics.export()
+
+    def do_shutdown(self):
+        """Stop all runs, close the instruments and end serve_forever()."""
+        self.close()
+
+    def do_events(self, since, timeout):
+        """(version, kinds) as events.wait(), at once for a new client (since None)."""
+        if since is None or since > events.version():
+            return events.version(), ["state"]
+        return events.wait(since, timeout)
+
+    def do_samples(self, filename, since):
+        """(run, times, normed) of a live file from index since on, None if not live."""
+        acquisition = self.engine.find(filename)
+        if acquisition is None:
+            return None
+        run = acquisition.live.run
+        buffer = acquisition.live.get(filename)
+        if buffer is None:
+            return None
+        times, normed = buffer.arrays()
+        return run, times[since:].copy(), normed[since:].copy()
+
+
+class _RemoteLive:
+    """Local mirror of the LiveStore of an acquisition in the server."""
+
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+        self._buffers = {}  # Absolute path -> (run, ChannelBuffer)
+
+    @property
+    def run(self):
+        return self._client._state_of(self._name)["run"]
+
+    def get(self, filename):
+        key = os.path.abspath(filename)
+        if key not in self._client._state_of(self._name)["live"]:
+            return None
+        return self._client._sync(self, key)
+
+
+class RemoteAcquisition:
+    """What the dashboard uses of an Acquisition, backed by the server."""
+
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+        self.live = _RemoteLive(client, name)
+
+    def __getattr__(self, attribute):
+        # resource, running, error, filenames, weights, interval
+        state = self._client._state_of(self.name)
+        try:
+            return state[attribute]
+        except KeyError:
+            raise AttributeError(attribute) from None
+
+    def status(self):
+        return self._client._state_of(self.name)["status"]
+
+    def stop(self):
+        self._client.stop(self.name)
+
+
+class AcquisitionClient:
+    """Drop-in replacement of AcquisitionEngine talking to an AcquisitionServer.
+
+    One connection per client, shared by the threads of the worker.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self._connection = None
+        self._lock = threading.Lock()  # One request at a time on the connection
+        self._sync_lock = threading.RLock()  # One writer per mirrored buffer
+        self._state = {}
+        self._state_time = None
+        self._names = []
+        self.acquisitions = {}
+        self._refresh()
+        for name in self._names:
+            self.acquisitions[name] = RemoteAcquisition(self, name)
+        self._closed = False
+        self._events_connection = None
+        threading.Thread(
+            target=self._forward_events, name="acquisition-events", daemon=True
+        ).start()
+
+    def _call(self, method, *args):
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._connection is None:
+                        self._connection = Client(self.address, authkey=self.authkey)
+                    self._connection.send((method, args))
+                    status, result = self._connection.recv()
+                    break
+                except (EOFError, OSError):
+                    # The server was restarted, connect again once
+                    self._connection = None
+                    if attempt == 2:
+                        raise
+        if status == "error":
+            raise RuntimeError(result[1])
+        return result
+
+    def _forward_events(self):
+        """Publish the notifications of the acquisition process in this one."""
+        since = None
+        while not self._closed:
+            try:
+                if self._events_connection is None:
+                    self._events_connection = Client(self.address, authkey=self.authkey)
+                self._events_connection.send(("events", (since, EVENTS_TIMEOUT)))
+                status, result = self._events_connection.recv()
+            except (EOFError, OSError):
+                # Closed, or the server is restarted: start over
+                self._events_connection = None
+                since = None
+                time.sleep(1)
+                continue
+            if status == "error":
+                time.sleep(1)
+                continue
+            since, kinds = result
+            if kinds:
+                if "state" in kinds:
+                    self._state_time = None  # Fetch the state again
+                events.publish(*kinds)
+
+    def _refresh(self):
+        states = self._call("state")
+        self._names = [s["name"] for s in states]
+        self._state = {s["name"]: s for s in states}
+        self._state_time = time.monotonic()
+
+    def _state_of(self, name, max_age=STATUS_MAX_AGE):
+        if self._state_time is None or time.monotonic() - self._state_time > max_age:
+            self._refresh()
+        return self._state[name]
+
+    def _sync(self, live, key):
+        """Fetch the new samples of a live file into the local mirror."""
+        with self._sync_lock:
+            run, buffer = live._buffers.get(key, (None, None))
+            since = len(buffer) if buffer is not None else 0
+            answer = self._call("samples", key, since)
+            if answer is None:
+                return buffer
+            new_run, times, normed = answer
+            if new_run != run:
+                if since:
+                    # Mirror of an earlier run, fetch the new one from the start
+                    del live._buffers[key]
+                    return self._sync(live, key)
+                buffer = ChannelBuffer(times, normed)
+            else:
+                buffer.extend(times, normed)
+            live._buffers[key] = (new_run, buffer)
+            return buffer
+
+    def __getitem__(self, name):
+        return self.acquisitions[name]
+
+    def __iter__(self):
+        return iter(self.acquisitions.values())
+
+    def start(
+        self, name, filenames, interval_seconds, weights, existing=None, adaptive=None
+    ):
+        self._call(
+            "start", name, filenames, interval_seconds, weights, existing, adaptive
+        )
+        self._refresh()
+
+    def stop(self, name):
+        self._call("stop", name)
+        self._refresh()
+
+    def interrupted(self):
+        journals = {name: self._state_of(name)["interrupted"] for name in self._names}
+        return {name: j for name, j in journals.items() if j is not None}
+
+    def resume(self, name, existing=None):
+        self._call("resume", name, existing)
+        self._refresh()
+
+    def discard(self, name):
+        self._call("discard", name)
+        self._refresh()
+
+    def stop_all(self):
+        for name in self._names:
+            self.stop(name)
+
+    def close(self):
+        """Close the connections; the acquisition itself keeps running."""
+        self._closed = True
+        with self._lock:
+            connection, self._connection = self._connection, None
+        for connection in (connection, self._events_connection):
+            if connection is not None:
+                connection.close()
+
+    def metrics(self):
+        """metrics.export() of the acquisition process."""
+        return self._call("metrics")
+
+    def find(self, filename):
+        key = os.path.abspath(filename)
+        for name in self._names:
+            if key in self._state_of(name)["live"]:
+                return self.acquisitions[name]
+        return None
@@ -0,0 +1,149 @@
+from keithley2000 import metrics
+from keithley2000.instrument import (
+    LINK_DEFAULTS,
+    SETUP_COMMANDS,
+    configure_link,
+    open_instrument,
+    probe_baud_rate,
+)
+
+# Waiting time between reconnection attempts, doubled after every failure
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+
+
+def command_key(command):
+    """What a setup command sets, e.g. "SENS:VOLT:DC:NPLC" for "SENS:VOLT:DC:NPLC 10"."""
+    return command.split(" ", 1)[0].upper()
+
+
+class TimedInstrument:
+    """VISA resource that records the duration of every SCPI call (see metrics).
+
+    Everything else (timeout, baud_rate, close(), ...) goes to the resource.
+    """
+
+    def __init__(self, instrument):
+        object.__setattr__(self, "instrument", instrument)
+
+    def __getattr__(self, name):
+        return getattr(self.instrument, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.instrument, name, value)
+
+    def write(self, command, *args, **kwargs):
+        with metrics.timer("scpi_seconds", call="write", command=command_key(command)):
+            return self.instrument.write(command, *args, **kwargs)
+
+    def query(self, command, *args, **kwargs):
+        with metrics.timer("scpi_seconds", call="query", command=command_key(command)):
+            return self.instrument.query(command, *args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        with metrics.timer("scpi_seconds", call="read", command=""):
+            return self.instrument.read(*args, **kwargs)
+
+    def query_binary_values(self, command, *args, **kwargs):
+        with metrics.timer(
+            "scpi_seconds", call="query_binary_values", command=command_key(command)
+        ):
+            return self.instrument.query_binary_values(command, *args, **kwargs)
+
+
+class InstrumentSession:
+    """Long-lived connection to one instrument, kept open between runs.
+
+    The instrument is reset (*RST) only when the port is opened. After that
+    configure() only sends the setup commands whose value differs from what
+    was sent before, so starting the next run takes no time and does not
+    re-autorange the instrument. link: serial link settings, see
+    LINK_DEFAULTS; baud_rate is the rate that answered.
+    """
+
+    def __init__(self, resource=None, simulator_options=None, link=None):
+        self.resource = resource
+        self.simulator_options = simulator_options
+        self.link = {**LINK_DEFAULTS, **(link or {})}
+        self.baud_rate = None
+        self.instrument = None
+        self._sent = {}
+
+    @property
+    def is_open(self):
+        return self.instrument is not None
+
+    def open(self, reset=True):
+        """Open and reset the instrument unless it is open already. None if not found.
+
+        reset=False leaves out *RST (resuming a run: no re-autoranging, the
+        setup is sent again by configure() anyway).
+        """
+        if self.instrument is None:
+            instrument = open_instrument(self.resource, self.simulator_options)
+            if instrument is None:
+                return None
+            if metrics.enabled:
+                instrument = TimedInstrument(instrument)
+            baud_rate = self.link["baud_rate"]
+            configure_link(instrument, baud_rate, self.link["timeout"])
+            if self.link["probe"]:
+                baud_rate = probe_baud_rate(instrument, first=baud_rate)
+                if baud_rate is None:
+                    instrument.close()
+                    raise RuntimeError(
+                        "The instrument does not answer at any baud rate"
+                    )
+                if baud_rate != self.link["baud_rate"]:
+                    print(
+                        f"{self.resource or 'Instrument'} answers at {baud_rate} baud"
+                    )
+            self.baud_rate = baud_rate
+            if reset:
+                instrument.write("*RST")
+                instrument.write("*WAI")
+            self.instrument = instrument
+            self._sent = {}
+        return self.instrument
+
+    def configure(self, commands=SETUP_COMMANDS):
+        """Send the commands that change the instrument's state, returns how many."""
+        sent = 0
+        for command in commands:
+            key = command_key(command)
+            if self._sent.get(key) != command:
+                self.instrument.write(command)
+                self._sent[key] = command
+                sent += 1
+        return sent
+
+    def close(self):
+        instrument, self.instrument = self.instrument, None
+        self._sent = {}
+        if instrument is not None:
+            try:
+                instrument.close()
+            except Exception as e:
+                print(f"Error closing {self.resource or 'instrument'}: {e}")
+
+    def reconnect(self, stop_flag, commands=SETUP_COMMANDS):
+        """Close and reopen until it works, waiting longer after every failure.
+
+        Returns False if stop_flag was set before the instrument came back.
+        """
+        self.close()
+        metrics.count("reconnects_total", resource=str(self.resource))
+        delay = RECONNECT_DELAY
+        while not stop_flag.is_set():
+            try:
+                if self.open() is not None:
+                    self.configure(commands)
+                    print(f"Reconnected to {self.resource or 'instrument'}")
+                    return True
+            except Exception as e:
+                print(f"Reconnecting failed: {e}")
+                self.close()
+            if stop_flag.wait(delay):
+                break
+            delay = min(2 * delay, RECONNECT_MAX_DELAY)
+        return False
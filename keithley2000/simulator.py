@@ -0,0 +1,267 @@
+"""In-process stand-in for a Keithley 2000 with scanner card on a serial port.
+
+Used instead of pyvisa when the resource is "SIM" (see open_instrument), so
+the acquisition can be run and benchmarked without the instrument. It
+understands the SCPI subset sent by the app, takes the time the real
+instrument and serial link would take, can inject timeouts and overflow
+readings and returns heat flow curves that look like cement hydration.
+"""
+
+import math
+import random
+import re
+import struct
+import threading
+import time
+
+IDN = "KEITHLEY INSTRUMENTS INC.,MODEL 2000,0000000,SIM"
+OVERFLOW = 9.9e37
+
+
+class SimulatedTimeout(TimeoutError):
+    """Raised like a VISA timeout when an error is injected."""
+
+
+def heat_flow(channel, hours):
+    """Synthetic heat flow (mW/g) of a hydrating cement paste."""
+    shift = 0.5 * (channel - 1)
+    initial = 4.0 * math.exp(-hours / 0.15)  # Wetting peak
+    main = 2.5 * math.exp(-(((hours - 9 - shift) / 4.0) ** 2))  # Main peak
+    tail = 0.6 / (1 + hours / 24)
+    return initial + main + tail
+
+
+class SimulatedKeithley2000:
+    """Fake pyvisa message-based resource.
+
+    latency: seconds added to every command, command_latency overrides it
+    for single commands (e.g. {"READ?": 0.05}). Every transferred character
+    costs 10 bits at baud_rate. reading_time is the integration time of one
+    reading (NPLC 10 at 50 Hz = 0.2 s). error_rate is the probability that a
+    query times out, overflow_rate the probability of a 9.9E37 reading.
+    time_scale speeds up the synthetic curves (simulated s per real s).
+    device_baud_rate is the rate set on the front panel: at any other
+    baud_rate the instrument does not understand commands and queries time
+    out (None: every rate works). FORM:DATA SREAL/DREAL and FORM:BORD are
+    honored by READ?, read with query_binary_values.
+    """
+
+    def __init__(
+        self,
+        resource_name="SIM",
+        latency=0.002,
+        command_latency=None,
+        reading_time=0.2,
+        error_rate=0.0,
+        overflow_rate=0.0,
+        time_scale=1.0,
+        weight=5.0,
+        cal_factor=12.45,
+        noise=0.002,
+        seed=None,
+        sleep=time.sleep,
+        device_baud_rate=None,
+    ):
+        self.resource_name = resource_name
+        self.latency = latency
+        self.command_latency = dict(command_latency or {})
+        self.reading_time = reading_time
+        self.error_rate = error_rate
+        self.overflow_rate = overflow_rate
+        self.time_scale = time_scale
+        self.weight = weight
+        self.cal_factor = cal_factor
+        self.noise = noise
+        self.sleep = sleep
+        self.device_baud_rate = device_baud_rate
+        self.random = random.Random(seed)
+        # pyvisa attributes set by configure_link
+        self.baud_rate = 9600
+        self.data_bits = 8
+        self.stop_bits = None
+        self.parity = None
+        self.flow_control = None
+        self.timeout = 2000
+        self.write_termination = "\r"
+        self.read_termination = "\r"
+        # Traffic counters for benchmarks
+        self.commands = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.session_closed = False
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.closed_channels = []
+        self.scan_list = []
+        self.scan_enabled = False
+        self.sample_count = 1
+        self.trigger_count = 1
+        self.settings = {}
+        self.errors = []
+        self._output = None
+
+    # Serial link
+    def _transfer(self, command, nbytes):
+        delay = self.command_latency.get(command.upper(), self.latency)
+        bits = 10 * nbytes  # Start bit, 8 data bits, stop bit
+        self.sleep(delay + bits / self.baud_rate)
+
+    def write(self, command):
+        with self._lock:
+            self._check_open()
+            self.commands += 1
+            nbytes = len(command) + len(self.write_termination)
+            self.bytes_written += nbytes
+            self._transfer(command, nbytes)
+            if self.device_baud_rate in (None, self.baud_rate):
+                self._execute(command.strip())
+            else:
+                self._output = None  # Garbage for the instrument
+            return nbytes
+
+    def _read_output(self):
+        with self._lock:
+            self._check_open()
+            if self._output is None:
+                self.sleep(self.timeout / 1000)
+                raise SimulatedTimeout("Timeout expired before operation completed")
+            output, self._output = self._output, None
+            nbytes = len(output) + len(self.read_termination)
+            self.bytes_read += nbytes
+            self._transfer("", nbytes)
+            return output
+
+    def read(self):
+        output = self._read_output()
+        return output.decode("latin-1") if isinstance(output, bytes) else output
+
+    def _send_query(self, command):
+        self.write(command)
+        if self.random.random() < self.error_rate:
+            with self._lock:
+                self._output = None
+
+    def query(self, command):
+        self._send_query(command)
+        return self.read()
+
+    def query_binary_values(
+        self,
+        command,
+        datatype="f",
+        is_big_endian=False,
+        container=list,
+        delay=None,
+        header_fmt="ieee",
+        expect_termination=True,
+        data_points=None,
+        chunk_size=None,
+    ):
+        """Like pyvisa: values of the #0 block the query returns."""
+        self._send_query(command)
+        block = self._read_output()
+        if not isinstance(block, bytes) or not block.startswith(b"#0"):
+            raise ValueError(f"Not a binary block: {block!r}")
+        size = struct.calcsize(datatype)
+        count = (len(block) - 2) // size
+        order = ">" if is_big_endian else "<"
+        return container(
+            struct.unpack(f"{order}{count}{datatype}", block[2 : 2 + count * size])
+        )
+
+    def close(self):
+        self.session_closed = True
+
+    def _check_open(self):
+        if self.session_closed:
+            raise RuntimeError("Invalid session handle. The resource might be closed.")
+
+    # SCPI
+    def _execute(self, command):
+        upper = command.upper()
+        header = upper.split(" ", 1)[0]
+        argument = command[len(header) :].strip()
+        if header == "*RST":
+            self.reset()
+        elif header == "*IDN?":
+            self._output = IDN
+        elif header in ("READ?", "FETCH?", "FETC?", "TRAC:DATA?"):
+            self._output = self._format(self._measure())
+        elif header == "SYST:ERR?":
+            self._output = self.errors.pop(0) if self.errors else '0,"No error"'
+        elif header == "ROUT:OPEN:ALL":
+            self.closed_channels = []
+        elif header in ("ROUT:CLOS", "ROUT:CLOS:ALL"):
+            self.closed_channels = self._channels(argument) if argument else []
+            self.scan_enabled = False  # Closing a channel ends scanning
+        elif header == "ROUT:SCAN:INT":
+            self.scan_list = self._channels(argument)
+        elif header == "ROUT:SCAN:LSEL":
+            self.scan_enabled = argument.upper().startswith("INT")
+        elif header == "SAMP:COUN":
+            self.sample_count = int(argument)
+        elif header == "TRIG:COUN":
+            self.trigger_count = int(argument)
+        elif header in ("*WAI", "*CLS", "SYST:RWL", "SYST:LOC", "INIT", "ABOR"):
+            pass
+        elif header.startswith(("SENS:", "SYST:", "TRIG:", "FORM:", "TRAC:")) or (
+            header in ("SRE", "*SRE", "*ESE")
+        ):
+            self.settings[header] = argument
+        else:
+            self.errors.append('-113,"Undefined header"')
+
+    @staticmethod
+    def _channels(argument):
+        channels = []
+        for part in re.findall(r"\d+(?::\d+)?", argument):
+            if ":" in part:
+                first, last = map(int, part.split(":"))
+                channels.extend(range(first, last + 1))
+            else:
+                channels.append(int(part))
+        return channels
+
+    def _measure(self):
+        if self.scan_enabled and self.scan_list:
+            count = self.sample_count * self.trigger_count
+            channels = [self.scan_list[i % len(self.scan_list)] for i in range(count)]
+        else:
+            channels = self.closed_channels[:1] or [0]
+        values = []
+        for channel in channels:
+            self.sleep(self.reading_time)
+            values.append(self._volts(channel))
+        return values
+
+    def _format(self, values):
+        data_format = self.settings.get("FORM:DATA", "ASC").upper()
+        if data_format.startswith(("SRE", "DRE")):
+            swapped = self.settings.get("FORM:BORD", "NORM").upper().startswith("SW")
+            order = "<" if swapped else ">"
+            datatype = "f" if data_format.startswith("SRE") else "d"
+            return b"#0" + struct.pack(f"{order}{len(values)}{datatype}", *values)
+        return ",".join(f"{v:+.7E}" for v in values)
+
+    def _volts(self, channel):
+        if not channel or self.random.random() < self.overflow_rate:
+            return OVERFLOW
+        hours = (time.monotonic() - self._start) * self.time_scale / 3600
+        mw_per_g = heat_flow(channel, hours) + self.random.gauss(0, self.noise)
+        return mw_per_g * self.weight / (1000 * self.cal_factor)
+
+
+class SimulatedResourceManager:
+    """Fake pyvisa.ResourceManager with a single simulated instrument."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def list_resources(self):
+        return ("SIM",)
+
+    def open_resource(self, resource_name):
+        return SimulatedKeithley2000(resource_name, **self.options)
@@ -0,0 +1,153 @@
+"""Binary, column-friendly storage of the readings next to the CSV files.
+
+Every channel file x.csv gets a directory x.run holding meta.json and
+segments 00000.bin, 00001.bin, ... of fixed-size records (see DTYPE). The
+segments are only ever appended to and a new one is started every
+segment_rows records, so they can be memory-mapped while the run is still
+going and a multi-week run opens without parsing any text.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from keithley2000.writer import GAP_NOTE, HEADER, BufferedWriter
+
+DTYPE = np.dtype(
+    [
+        ("seq", "<i8"),  # Sequence number of the live store, -1 if invalid
+        ("channel", "<i8"),  # Scanner channel
+        ("elapsed", "<f8"),  # Seconds since the start of the run (monotonic)
+        ("wall", "<f8"),  # Absolute time (Unix timestamp)
+        ("volts", "<f8"),  # Raw reading, NaN if invalid
+        ("calibrated", "<f8"),  # mW
+        ("normed", "<f8"),  # mW/g
+    ]
+)
+SEGMENT_ROWS = 100_000
+# seq of the record that marks where an interrupted run was resumed (its
+# values are NaN, elapsed and wall are the time of resuming)
+GAP_SEQ = -2
+
+
+def store_path(filename):
+    """x.csv -> x.run"""
+    return os.path.splitext(filename)[0] + ".run"
+
+
+def segment_names(path):
+    return sorted(n for n in os.listdir(path) if n.endswith(".bin"))
+
+
+def read_meta(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+class RunStoreWriter(BufferedWriter):
+    """Buffered writer of the binary stores, one per channel (see BufferedWriter)."""
+
+    def __init__(self, filenames, segment_rows=SEGMENT_ROWS, **options):
+        super().__init__([store_path(f) for f in filenames], **options)
+        self.csv_names = [os.path.basename(f) for f in filenames]
+        self.segment_rows = segment_rows
+        self._segment_rows = [0] * len(self.filenames)
+        self._segments = [0] * len(self.filenames)
+
+    def _open_segment(self, index):
+        name = os.path.join(self.filenames[index], f"{self._segments[index]:05d}.bin")
+        f = open(name, "ab")
+        rows, partial = divmod(f.tell(), DTYPE.itemsize)
+        if partial:  # Last record cut off by a crash
+            f.truncate(rows * DTYPE.itemsize)
+        self._segment_rows[index] = rows
+        return f
+
+    def _open(self, index):
+        path = self.filenames[index]
+        os.makedirs(path, exist_ok=True)
+        meta = os.path.join(path, "meta.json")
+        if not os.path.exists(meta):
+            with open(meta, "w") as f:
+                json.dump(
+                    {
+                        "version": 1,
+                        "csv": self.csv_names[index],
+                        "dtype": DTYPE.descr,
+                        "segment_rows": self.segment_rows,
+                    },
+                    f,
+                )
+        # Continue the last segment, as the CSV file is continued
+        segments = segment_names(path)
+        if segments:
+            self._segments[index] = int(segments[-1][:-4])
+        return self._open_segment(index)
+
+    def _write_rows(self, f, index, rows):
+        data = np.array(rows, dtype=DTYPE)
+        while len(data):
+            room = self.segment_rows - self._segment_rows[index]
+            if room <= 0:
+                f.close()
+                self._segments[index] += 1
+                f = self._files[index] = self._open_segment(index)
+                continue
+            f.write(data[:room].tobytes())
+            self._segment_rows[index] += len(data[:room])
+            data = data[room:]
+
+    def write(self, index, seq, channel, elapsed, wall, volts, calibrated, normed):
+        """Queue one reading, NaN for values that are missing."""
+        self._add(index, (seq, channel, elapsed, wall, volts, calibrated, normed))
+
+    def write_gap(self, index, channel, elapsed, wall):
+        """Mark that the run continues here after an interruption (GAP_SEQ)."""
+        nan = float("nan")
+        self.write(index, GAP_SEQ, channel, elapsed, wall, nan, nan, nan)
+
+
+def open_segments(path):
+    """Memory-mapped record arrays of all complete records, per segment."""
+    arrays = []
+    for name in segment_names(path):
+        filename = os.path.join(path, name)
+        rows = os.path.getsize(filename) // DTYPE.itemsize
+        if rows:
+            arrays.append(np.memmap(filename, DTYPE, "r", shape=(rows,)))
+    return arrays
+
+
+def last_reading(path):
+    """(seq, elapsed) of the latest reading in a store, (-1, 0.0) if there is none."""
+    if not os.path.isdir(path):
+        return -1, 0.0
+    records = load_run(path)
+    readings = records[records["seq"] >= 0]
+    if not len(readings):
+        return -1, 0.0
+    return int(readings["seq"].max()), float(readings["elapsed"].max())
+
+
+def load_run(path):
+    """All records of a store as one array (memory-mapped if it is one segment)."""
+    arrays = open_segments(path)
+    if not arrays:
+        return np.empty(0, DTYPE)
+    return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+
+def export_csv(path, filename):
+    """Write a store as CSV file in the format of CsvWriter."""
+    records = load_run(path)
+    with open(filename, "w") as f:
+        f.write(HEADER)
+        for seq, elapsed, normed, wall in zip(
+            records["seq"], records["elapsed"], records["normed"], records["wall"]
+        ):
+            stamp = datetime.fromtimestamp(wall).astimezone()
+            value = "" if np.isnan(normed) else repr(float(normed))
+            row = f"{elapsed / 3600:.5f}, {value}, {stamp.isoformat(timespec='microseconds')}"
+            f.write(f"{row}, {GAP_NOTE}\n" if seq == GAP_SEQ else f"{row}\n")
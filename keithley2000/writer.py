@@ -0,0 +1,120 @@
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+from keithley2000 import metrics
+
+HEADER = "Time (h), Heat flow (mW/g), Timestamp\n"
+# Fourth column of the row that marks where a run was resumed after it had
+# been interrupted (no readings between the previous row and this one)
+GAP_NOTE = "resumed after interruption"
+
+
+class BufferedWriter:
+    """Base class of the output files of a run, one file per channel.
+
+    The files stay open for the whole run. Rows are collected in memory and
+    written out when flush_rows rows are pending or flush_seconds have passed
+    since the last flush; os.fsync is called at most every fsync_seconds.
+    Everything pending is written on close(), which also runs at interpreter
+    exit in case the measurement thread never got to it.
+
+    Subclasses implement _open(index) and _write_rows(f, index, rows).
+    """
+
+    def __init__(self, filenames, flush_rows=50, flush_seconds=30, fsync_seconds=300):
+        self.filenames = list(filenames)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+        self._files = [None] * len(self.filenames)
+        self._pending = [[] for _ in self.filenames]
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self._last_flush = self._last_fsync = time.monotonic()
+        self._closed = False
+        atexit.register(self.close)
+
+    def _file(self, index):
+        f = self._files[index]
+        if f is None:
+            f = self._files[index] = self._open(index)
+        return f
+
+    def _add(self, index, row):
+        with self._lock:
+            self._pending[index].append(row)
+            self._pending_rows += 1
+            now = time.monotonic()
+            if (
+                self._pending_rows >= self.flush_rows
+                or now - self._last_flush >= self.flush_seconds
+            ):
+                self._flush(now)
+
+    def _flush(self, now, sync=False):
+        writer = type(self).__name__
+        with metrics.timer("file_flush_seconds", writer=writer):
+            for index, rows in enumerate(self._pending):
+                if rows:
+                    self._write_rows(self._file(index), index, rows)
+                    rows.clear()
+            self._pending_rows = 0
+            self._last_flush = now
+            for f in self._files:
+                if f is not None:
+                    f.flush()
+        sync = sync or now - self._last_fsync >= self.fsync_seconds
+        if sync:
+            with metrics.timer("file_fsync_seconds", writer=writer):
+                for f in self._files:
+                    if f is not None:
+                        os.fsync(f.fileno())
+            self._last_fsync = now
+
+    def flush(self, sync=False):
+        with self._lock:
+            if not self._closed:
+                self._flush(time.monotonic(), sync)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._flush(time.monotonic(), sync=True)
+            finally:
+                self._closed = True
+                for f in self._files:
+                    if f is not None:
+                        f.close()
+                atexit.unregister(self.close)
+
+
+class CsvWriter(BufferedWriter):
+    """Buffered writer for the per-channel CSV files (see BufferedWriter)."""
+
+    def _open(self, index):
+        f = open(self.filenames[index], "a")
+        if f.tell() == 0:
+            f.write(HEADER)
+        return f
+
+    def _write_rows(self, f, index, rows):
+        f.write("".join(rows))
+
+    def write(self, index, elapsed_hours, normed, timestamp=None, note=None):
+        """Queue one reading. normed may be "" if the reading was invalid."""
+        if timestamp is None:
+            timestamp = time.time()
+        stamp = datetime.fromtimestamp(timestamp).astimezone()
+        row = (
+            f"{elapsed_hours:.5f}, {normed}, {stamp.isoformat(timespec='microseconds')}"
+        )
+        self._add(index, f"{row}, {note}\n" if note else f"{row}\n")
+
+    def write_gap(self, index, elapsed_hours, timestamp):
+        """Mark that the run continues here after an interruption."""
+        self.write(index, elapsed_hours, "", timestamp, GAP_NOTE)
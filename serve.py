@@ -0,0 +1,158 @@
+"""Production mode: the dashboard on a WSGI server with several workers.
+
+    python serve.py --workers 4
+    python serve.py --server gunicorn --workers 4 --host 0.0.0.0
+
+The instruments are measured by one separate acquisition process. The web
+workers (threads of waitress, or processes of gunicorn, which does not run
+on Windows) get the instrument state and the samples of the running
+measurement from it through a local socket, see keithley2000/service.py.
+Every open browser tab keeps one event stream (/events) open, which takes
+a server thread of its own: --streams of them are added to the workers.
+With --attach the dashboard uses a headless acquisition started before
+(python -m keithley2000 acquire) instead, which keeps running when the
+dashboard is stopped.
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import secrets
+import subprocess
+import sys
+import time
+from multiprocessing.connection import Client
+
+from keithley2000.service import DEFAULT_ADDRESS, load_authkey, parse_address
+from settings import JOURNAL_DIR
+
+
+def run_acquisition(address):
+    # The acquisition process builds the real engine from the settings,
+    # without the dashboard (Dash, the directory search, the catalog)
+    from keithley2000 import metrics
+    from keithley2000.service import AcquisitionServer
+    from settings import METRICS_ENABLED, create_engine
+
+    metrics.enable(METRICS_ENABLED)
+    AcquisitionServer(
+        create_engine(), address, load_authkey(JOURNAL_DIR)
+    ).serve_forever()
+
+
+def wait_for_acquisition(address, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    authkey = load_authkey(JOURNAL_DIR)
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            sys.exit("The acquisition process did not start")
+        try:
+            Client(address, authkey=authkey).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit(f"The acquisition process is not listening on {address}")
+
+
+def stop_acquisition(address, process):
+    """Let the acquisition process write its files and close the instruments."""
+    try:
+        with Client(address, authkey=load_authkey(JOURNAL_DIR)) as c:
+            c.send(("shutdown", ()))
+            c.recv()
+    except (OSError, EOFError):
+        pass
+    process.join(20)
+    if process.is_alive():
+        process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--server", choices=["waitress", "gunicorn"], default="waitress"
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--streams",
+        type=int,
+        default=16,
+        help="number of browser tabs that can be open at the same time",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument(
+        "--acquisition",
+        default="{}:{}".format(*DEFAULT_ADDRESS),
+        help="local address of the acquisition process (host:port)",
+    )
+    parser.add_argument(
+        "--attach",
+        action="store_true",
+        help="use the acquisition running at --acquisition, do not start one",
+    )
+    args = parser.parse_args()
+    address = parse_address(args.acquisition)
+
+    acquisition = None
+    if not args.attach:
+        # A key of its own for this acquisition process, inherited by it and
+        # the workers (see load_authkey)
+        os.environ.setdefault("KEITHLEY_AUTHKEY", secrets.token_hex(16))
+        acquisition = multiprocessing.Process(
+            target=run_acquisition, args=(address,), name="acquisition"
+        )
+        acquisition.start()
+    try:
+        if acquisition is not None:
+            wait_for_acquisition(address, acquisition)
+        os.environ["KEITHLEY_ACQUISITION"] = "{}:{}".format(*address)
+        if args.server == "waitress":
+            try:
+                from waitress import serve
+            except ImportError:
+                sys.exit("waitress is not installed: pip install waitress")
+            import app
+
+            app.start_background_tasks()
+            print(f"Dashboard on http://{args.host}:{args.port}/")
+            serve(
+                app.server,
+                host=args.host,
+                port=args.port,
+                threads=args.workers + args.streams,
+            )
+        else:
+            # Looked for and indexed once here instead of in every worker
+            from keithley2000.catalog import RunCatalog
+            from settings import CATALOG_PATH, existing_csv_directories
+
+            directories = existing_csv_directories() or [os.getcwd()]
+            os.environ["KEITHLEY_DIRECTORIES"] = os.pathsep.join(directories)
+            RunCatalog(CATALOG_PATH).scan_in_background(directories)
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "gunicorn",
+                    "--workers",
+                    str(args.workers),
+                    # Threaded workers, one thread per event stream
+                    "--threads",
+                    str(1 + math.ceil(args.streams / args.workers)),
+                    "--bind",
+                    f"{args.host}:{args.port}",
+                    "app:server",
+                ],
+                check=True,
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if acquisition is not None:
+            stop_acquisition(address, acquisition)
+
+
+if __name__ == "__main__":
+    main()
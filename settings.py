@@ -0,0 +1,135 @@
+"""Settings of the instruments, the runs and the output files.
+
+Imported by app.py and by the acquisition process of serve.py, which builds
+its engine with create_engine() from here and so never loads Dash or
+Plotly. The dashboard's own settings (graph, events, metrics) are in app.py.
+"""
+
+import os
+
+from keithley2000.acquisition import Acquisition, AcquisitionEngine
+from keithley2000.channels import load_channels
+from keithley2000.directories import existing_directories
+
+# Channels of the scanner card in use (up to 10) with label, calibration
+# polynomial (V to W), default weight and color each, read from channels.json
+# next to app.py (or the file in KEITHLEY_CHANNELS), see
+# keithley2000/channels.py. The form and the graph show the enabled channels.
+CHANNELS_FILE = os.environ.get("KEITHLEY_CHANNELS") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "channels.json"
+)
+CHANNELS = load_channels(CHANNELS_FILE)
+
+# VISA resource of the instrument, e.g. "ASRL3::INSTR". None uses the first
+# resource found, "SIM" a simulated instrument (no hardware needed, see
+# keithley2000/simulator.py) configured by SIMULATOR_OPTIONS.
+VISA_RESOURCE = os.environ.get("KEITHLEY_RESOURCE") or None
+SIMULATOR_OPTIONS = {"time_scale": 60}
+
+# Instruments (one calorimeter each, every one on its own serial port).
+# Each entry can override "resource" and "channels" (e.g. the calibration,
+# from load_channels("other.json"), with as many enabled channels as the
+# form); runs are started and stopped per instrument, the one selected in
+# the form.
+INSTRUMENTS = [
+    {"name": "Calorimeter", "resource": VISA_RESOURCE, "channels": CHANNELS},
+]
+for instrument in INSTRUMENTS:
+    if len(instrument.get("channels", CHANNELS)) != len(CHANNELS):
+        raise ValueError(f"{instrument['name']}: not as many channels as the form")
+
+# Serial link: baud rate as set on the instrument (MENU > RS-232, up to 19200
+# on the Model 2000), other rates are tried if it does not answer ("probe").
+# data_format "ascii" or binary readings: "sreal" (4 bytes, the precision
+# of the 6.5 digit display) or "dreal" (8 bytes), see keithley2000/instrument.py
+SERIAL_LINK = {"baud_rate": 9600, "probe": True, "data_format": "ascii"}
+
+# "scan": the scanner card measures all channels per READ? (one transfer)
+# "step": every channel is closed and read on its own
+ACQUISITION_MODE = "scan"
+
+# "Shorter spacing during fast changes": the spacing is halved (down to
+# min_interval seconds) while the heat flow would change by more than
+# step_threshold mW/g from one point to the next, or scatters by more than
+# residual_threshold mW/g around a straight line through the last window
+# points. After quiet_sweeps quiet points it is doubled again, up to the
+# spacing entered in the form. See AdaptiveScheduler in keithley2000/scheduler.py
+ADAPTIVE_SPACING = {
+    "min_interval": 2.0,
+    "step_threshold": 0.02,
+    "residual_threshold": 0.01,
+    "window": 5,
+    "quiet_sweeps": 5,
+}
+
+# Output formats: "csv" (text, one file per channel) and "binary" (a folder
+# x.run next to every x.csv with raw volts, calibrated and normed values and
+# timestamps, opened much faster, see keithley2000/store.py). The graph reads
+# the binary store if there is one.
+OUTPUT_FORMATS = ["csv", "binary"]
+
+# Output files are written in batches: after CSV_FLUSH_ROWS readings or
+# CSV_FLUSH_SECONDS seconds, whatever comes first. The data is forced onto
+# the disk (fsync) every CSV_FSYNC_SECONDS seconds and when the run stops.
+CSV_FLUSH_ROWS = 50
+CSV_FLUSH_SECONDS = 30
+CSV_FSYNC_SECONDS = 300
+
+# Run journals (one per instrument, see keithley2000/journal.py). If the app
+# or the PC dies during a run, the app offers to resume it when it starts
+# again: same files, the time axis goes on and the gap is marked.
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".keithley2000")
+
+# Index of all measurement files in the directories offered for the CSV
+# files (CSV_DIRECTORIES in app.py), with a preview of every
+# run (SQLite, see keithley2000/catalog.py), updated in the background when
+# the app starts and with "Rescan". Runs selected under "Run archive" are
+# drawn over the current one: the previews, the files themselves once the
+# graph is zoomed in.
+CATALOG_PATH = os.path.join(JOURNAL_DIR, "catalog.sqlite")
+
+# Possible directories to save CSV files: USB flash drives, the working
+# directory, the home directory and all its subdirectories. Checking a drive
+# letter can hang for a long time if the drive is missing or asleep, so every
+# drive is given at most DRIVE_TIMEOUT seconds (see keithley2000/directories.py).
+DIRECTORY_CANDIDATES = [
+    "D:/",
+    "E:/",
+    "F:/",
+    os.getcwd(),
+    os.path.expanduser("~"),
+    os.path.join(os.path.expanduser("~"), "Documents"),
+    os.path.join(os.path.expanduser("~"), "Downloads"),
+]
+DIRECTORY_PARENTS = [os.path.expanduser("~")]
+
+# Record the duration of SCPI calls, sweeps, file writes and callbacks,
+# shown under "Diagnostics" and at http://127.0.0.1:8050/metrics
+# (Prometheus format). KEITHLEY_METRICS=0 turns it off.
+METRICS_ENABLED = os.environ.get("KEITHLEY_METRICS", "1") != "0"
+
+
+def existing_csv_directories():
+    """The DIRECTORY_CANDIDATES that exist and the subdirectories of
+    DIRECTORY_PARENTS; takes up to about 2 * DRIVE_TIMEOUT seconds."""
+    return existing_directories(DIRECTORY_CANDIDATES, DIRECTORY_PARENTS)
+
+
+# One measurement thread per instrument
+def create_engine():
+    return AcquisitionEngine(
+        Acquisition(
+            mode=ACQUISITION_MODE,
+            simulator_options=SIMULATOR_OPTIONS,
+            formats=OUTPUT_FORMATS,
+            link=SERIAL_LINK,
+            journal_dir=JOURNAL_DIR,
+            output_options={
+                "flush_rows": CSV_FLUSH_ROWS,
+                "flush_seconds": CSV_FLUSH_SECONDS,
+                "fsync_seconds": CSV_FSYNC_SECONDS,
+            },
+            **instrument,
+        )
+        for instrument in INSTRUMENTS
+    )
@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+import pytest
+
+from keithley2000.acquisition import Acquisition, AcquisitionEngine
+from keithley2000.analysis import CumulativeHeat
+from keithley2000.data import MeasurementFileCache
+
+SIMULATOR = {"latency": 0.0, "reading_time": 0.0, "time_scale": 3600.0, "seed": 1}
+
+
+def measure(engine, seconds, start):
+    start()
+    acquisition = engine["SIM"]
+    time.sleep(seconds)
+    acquisition.stop()
+    acquisition.thread.join(30)
+    assert not acquisition.running
+    assert acquisition.error == ""
+
+
+@pytest.mark.parametrize("formats", [("csv",), ("binary",)])
+def test_resume_with_simulator(tmp_path, formats):
+    filename = str(tmp_path / "a.csv")
+    engine = AcquisitionEngine(
+        [
+            Acquisition(
+                "SIM",
+                resource="SIM",
+                cal_factors=[12.45],
+                simulator_options=SIMULATOR,
+                formats=formats,
+                output_options={"flush_rows": 1},
+                journal_dir=str(tmp_path / "journals"),
+            )
+        ]
+    )
+    try:
+        measure(engine, 1.0, lambda: engine.start("SIM", [filename], 0.2, [5.0]))
+        assert engine.interrupted() == {}
+        # As if the app had died during the run
+        engine["SIM"].journal.mark("running")
+        assert list(engine.interrupted()) == ["SIM"]
+        measure(engine, 1.0, lambda: engine.resume("SIM"))
+        assert engine.interrupted() == {}
+    finally:
+        engine.close()
+
+    times, normed = MeasurementFileCache().read([filename])[0]
+    assert np.isnan(normed).sum() == 1
+    assert (np.diff(times) >= 0).all()
+    gap = np.flatnonzero(np.isnan(normed))[0]
+    assert 0 < gap < len(normed) - 1
+    heat = CumulativeHeat()
+    assert np.isfinite(heat.update(times, normed)).all()
+    assert np.isfinite(heat.total)
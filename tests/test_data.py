@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+
+from keithley2000.analysis import CumulativeHeat
+from keithley2000.data import MeasurementFileCache
+from keithley2000.store import RunStoreWriter, store_path
+from keithley2000.writer import CsvWriter
+
+
+def write_csv(filename, rows, gap_at=None):
+    writer = CsvWriter([filename], flush_rows=1)
+    for i, (hours, normed) in enumerate(rows):
+        if i == gap_at:
+            writer.write_gap(0, hours, 0.0)
+        writer.write(0, hours, normed, 0.0)
+    writer.close()
+
+
+def test_csv_gap_is_nan(tmp_path):
+    filename = str(tmp_path / "a.csv")
+    write_csv(filename, [(0.0, 1.0), (0.1, 2.0), (0.5, 3.0), (0.6, 4.0)], gap_at=2)
+    times, normed = MeasurementFileCache().read([filename])[0]
+    assert times.tolist() == [0.0, 0.1, 0.5, 0.5, 0.6]
+    assert np.isnan(normed[2])
+    assert normed[[0, 1, 3, 4]].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_store_gap_is_nan(tmp_path):
+    filename = str(tmp_path / "a.csv")
+    store = RunStoreWriter([filename], flush_rows=1)
+    store.write(0, 0, 1, 0.0, 0.0, 0.1, 1.0, 1.0)
+    store.write_gap(0, 1, 1800.0, 0.0)
+    store.write(0, 1, 1, 1800.0, 0.0, 0.1, 3.0, 3.0)
+    store.close()
+    assert os.path.isdir(store_path(filename))
+    times, normed = MeasurementFileCache().read([filename])[0]
+    assert times.tolist() == [0.0, 0.5, 0.5]
+    assert np.isnan(normed[1])
+
+
+def test_cumulative_heat_across_gap(tmp_path):
+    filename = str(tmp_path / "a.csv")
+    cache = MeasurementFileCache()
+    heat = CumulativeHeat(peak_after=0.0)
+    write_csv(filename, [(0.0, 1.0), (1.0, 1.0)])
+    heat.update(*cache.read([filename])[0])
+    # The run is resumed: a gap row, then new readings appended
+    write_csv(filename, [(3.0, 1.0), (4.0, 1.0)], gap_at=0)
+    times, normed = cache.read([filename])[0]
+    assert np.isnan(normed).sum() == 1
+    curve = heat.update(times, normed)
+    assert np.isfinite(curve).all()
+    # The gap is bridged as if it had been measured, the same as integrating
+    # everything at once
+    expected = CumulativeHeat(peak_after=0.0)
+    expected.update(times, normed)
+    assert heat.total == expected.total > 0
+    assert heat.peak_height == 1.0
+
+
+def test_appended_lines_only(tmp_path):
+    filename = str(tmp_path / "a.csv")
+    cache = MeasurementFileCache()
+    write_csv(filename, [(0.0, 1.0)])
+    (generation,) = cache.generations([filename])
+    assert generation == 0
+    cache.read([filename])
+    (generation,) = cache.generations([filename])
+    with open(filename, "a") as f:
+        f.write("0.10000, 2.0, 2026-01-01T00:00:00\n0.2")  # Last line incomplete
+    times, normed = cache.read([filename])[0]
+    assert normed.tolist() == [1.0, 2.0]
+    assert cache.generations([filename]) == [generation]
+
+
+def test_truncated_file_is_read_again(tmp_path):
+    filename = str(tmp_path / "a.csv")
+    cache = MeasurementFileCache()
+    write_csv(filename, [(0.0, 1.0), (0.1, 2.0), (0.2, 3.0)])
+    cache.read([filename])
+    before = cache.generations([filename])
+    with open(filename, "r+") as f:
+        f.truncate(0)
+    write_csv(filename, [(0.0, 5.0)])
+    times, normed = cache.read([filename])[0]
+    assert normed.tolist() == [5.0]
+    assert cache.generations([filename]) != before
+
+
+def test_replaced_file_is_read_again(tmp_path):
+    filename = str(tmp_path / "a.csv")
+    other = str(tmp_path / "b.csv")
+    cache = MeasurementFileCache()
+    write_csv(filename, [(0.0, 1.0)])
+    cache.read([filename])
+    before = cache.generations([filename])
+    # Longer than the file read before, so only the inode tells
+    write_csv(other, [(0.0, 7.0), (0.1, 8.0)])
+    os.replace(other, filename)
+    times, normed = cache.read([filename])[0]
+    assert normed.tolist() == [7.0, 8.0]
+    assert cache.generations([filename]) != before
+
+
+def test_generation_not_reused_after_eviction(tmp_path):
+    filenames = [str(tmp_path / f"{i}.csv") for i in range(3)]
+    for filename in filenames:
+        write_csv(filename, [(0.0, 1.0)])
+    cache = MeasurementFileCache(max_files=1)
+    cache.read(filenames[:1])
+    before = cache.generations(filenames[:1])
+    cache.read(filenames[1:2])
+    assert cache.generations(filenames[:1]) == [0]
+    cache.read(filenames[:1])
+    assert cache.generations(filenames[:1]) != before
@@ -0,0 +1,47 @@
+from keithley2000.journal import RunJournal
+
+RUN = {"run_id": "1", "filenames": ["a.csv"], "last_seq": 0, "last_elapsed": 0.0}
+
+
+def test_update_during_run(tmp_path):
+    journal = RunJournal(str(tmp_path), "A")
+    journal.write(state="running", **RUN)
+    journal.update(**dict(RUN, state="running", last_seq=5))
+    assert journal.read()["last_seq"] == 5
+
+
+def test_update_after_final_write_is_dropped(tmp_path):
+    journal = RunJournal(str(tmp_path), "A")
+    journal.write(state="running", **RUN)
+    journal.write(final=True, state="stopped", **dict(RUN, last_seq=9))
+    # A journal sink still writing after the end of the run
+    journal.update(**dict(RUN, state="running", last_seq=5))
+    assert journal.read()["state"] == "stopped"
+    assert journal.read()["last_seq"] == 9
+    # Until the next run
+    journal.write(state="running", **RUN)
+    journal.update(**dict(RUN, state="running", last_seq=3))
+    assert journal.read()["last_seq"] == 3
+
+
+def test_interrupted(tmp_path):
+    journal = RunJournal(str(tmp_path), "A")
+    assert journal.interrupted() is None
+    journal.write(state="running", **RUN)
+    assert journal.interrupted()["run_id"] == "1"
+    journal.mark("discarded")
+    assert journal.interrupted() is None
+
+
+def test_run_locked_elsewhere_is_not_interrupted(tmp_path):
+    running = RunJournal(str(tmp_path), "A")
+    running.lock()
+    running.write(state="running", **RUN)
+    # Another RunJournal gets a lock of its own, as another process would
+    other = RunJournal(str(tmp_path), "A")
+    try:
+        assert other.locked_elsewhere()
+        assert other.interrupted() is None
+    finally:
+        running.unlock()
+    assert other.interrupted()["run_id"] == "1"
@@ -0,0 +1,25 @@
+import threading
+
+from keithley2000.channels import ChannelTransform
+from keithley2000.live import LiveStore
+from keithley2000.pipeline import Pipeline, Sink
+
+
+def test_close_writes_everything(tmp_path):
+    written, finished = [], threading.Event()
+    sink = Sink("test", written.extend, finished.set)
+    live = LiveStore()
+    live.start_run([str(tmp_path / "a.csv")])
+    pipeline = Pipeline(
+        "SIM",
+        [1],
+        ChannelTransform([[0.0, 1.0]], [1.0]),
+        live,
+        [sink],
+    )
+    for i in range(50):
+        pipeline.put([(1, 0.001 * i, float(i), 0.0)])
+    assert pipeline.close(timeout=10)
+    assert finished.is_set()
+    assert [r.elapsed for r in written] == [float(i) for i in range(50)]
+    assert pipeline.total_dropped == 0